@@ -6,14 +6,23 @@ Updated to:
 - EV1 & EV2 ON in safe range, others OFF
 - All EVs ON when feeder load is low
 """
-import matplotlib.pyplot as plt
 import helics as h
 import logging
-import pandas as pd
 import numpy as np
 import argparse
 import os
 
+from ev_fleet import (
+    EVFleet, primary_setpoint_table, BRANCH_NAMES, OVERLOAD, SAFE_RANGE, PLANNED
+)
+from checkpoint import Checkpointer, load_checkpoint
+from event_journal import EventJournal, StepLogger
+from federate_clock import make_clock
+from step_profiler import (
+    make_profiler, REQUEST_TIME, READ_INPUTS, READ_MESSAGES, CONTROL, RECORD, LOG
+)
+from telemetry_recorder import TelemetryRecorder, buffer_rows, export_csv, load_recording
+
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
 logger.setLevel(logging.DEBUG)
@@ -27,6 +36,15 @@ def destroy_federate(fed):
     logger.info("Federate finalized")
 
 
+def _checkpoint(checkpointer, fleet, grantedtime, branch):
+    """Queue a checkpoint of the fleet state at grantedtime."""
+    last_command = fleet.dispatcher.last_command if fleet.dispatcher is not None else fleet.setpoints
+    checkpointer.checkpoint(
+        grantedtime, fleet.setpoints, last_command, fleet.readings, branch=branch,
+        plan_bias=fleet.plan.bias if fleet.plan is not None else None,
+    )
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description='')
@@ -41,39 +59,33 @@ if __name__ == "__main__":
     logger.info("HELICS Version: {}".format(h.helicsGetVersion()))
     logger.info("{}: Federate {} has been registered".format(federate_name, federate_name))
 
-    endpoint_count = h.helicsFederateGetEndpointCount(fed)
-    subkeys_count = h.helicsFederateGetInputCount(fed)
+    # Feeder limits (W)
+    feeder_limit_upper = 4.8e6
+    feeder_limit_lower = 2.6e6
 
-    # ---------------------------------------------------------------------
-    # Endpoints and subscriptions
-    # ---------------------------------------------------------------------
-    endid = {}
-    subid = {}
-    ev_names = []
-
-    # Endpoints (EV chargers)
-    for i in range(endpoint_count):
-        ep = h.helicsFederateGetEndpointByIndex(fed, i)
-        endid[f"m{i}"] = ep
-        end_name = h.helicsEndpointGetName(ep)
-        ev_name = end_name.split('/')[-1]
-        ev_names.append(ev_name)
-        logger.info("{}: Registered Endpoint ---> {}".format(federate_name, end_name))
-
-    # Subscriptions (feeder load from GridLAB-D)
-    for i in range(subkeys_count):
-        sub = h.helicsFederateGetInputByIndex(fed, i)
-        subid[f"m{i}"] = sub
-        h.helicsInputSetDefaultComplex(sub, 0, 0)
-        sub_key = h.helicsInputGetTarget(sub)
-        logger.info("{}: Registered Subscription ---> {}".format(federate_name, sub_key))
+    # EV message wire format: "string" for GridLAB-D peers (default), "binary"
+    # when every peer on the EV endpoints is a Python federate using ev_messages
+    CONTROLLER_MESSAGE_ENCODING = os.getenv("CONTROLLER_MESSAGE_ENCODING", "string")
 
     # ---------------------------------------------------------------------
-    # Enter execution mode
+    # Endpoints (EV chargers) and subscriptions (feeder load from GridLAB-D)
     # ---------------------------------------------------------------------
-    h.helicsFederateEnterExecutingMode(fed)
+    fleet = EVFleet.from_federate(
+        fed, primary_setpoint_table, feeder_limit_lower, feeder_limit_upper,
+        encoding=CONTROLLER_MESSAGE_ENCODING,
+    )
+    ev_names = fleet.names
+    for name in ev_names:
+        logger.info("{}: Registered Endpoint ---> {}".format(federate_name, name))
+    for sub in fleet.inputs:
+        h.helicsInputSetDefaultComplex(sub, 0, 0)
+        logger.info("{}: Registered Subscription ---> {}".format(federate_name, h.helicsInputGetTarget(sub)))
 
-    plotting = True      # Enable plotting at the end
+    # Headless profile: no plotting at all, and matplotlib is never imported.
+    # Otherwise plotting only happens (and matplotlib is only imported) after
+    # the time loop, so it never delays entering executing mode.
+    CONTROLLER_HEADLESS = os.getenv("CONTROLLER_HEADLESS", "0") == "1"
+    plotting = not CONTROLLER_HEADLESS      # Enable plotting at the end
     hours = 24
     total_interval = int(60 * 60 * hours)
     grantedtime = -1
@@ -82,68 +94,171 @@ if __name__ == "__main__":
     CONTROLLER_INTERVAL_SEC = int(os.getenv("CONTROLLER_INTERVAL_SEC", "60"))
     update_interval = CONTROLLER_INTERVAL_SEC
 
-    # Feeder limits (W)
-    feeder_limit_upper = 4.8e6
-    feeder_limit_lower = 2.6e6
+    # Send-on-change: only message an EV endpoint when its command changes,
+    # re-sending unchanged commands every CONTROLLER_KEEPALIVE_SEC (0 = never)
+    CONTROLLER_SEND_ON_CHANGE = os.getenv("CONTROLLER_SEND_ON_CHANGE", "0") == "1"
+    CONTROLLER_KEEPALIVE_SEC = int(os.getenv("CONTROLLER_KEEPALIVE_SEC", "0"))
+    if CONTROLLER_SEND_ON_CHANGE:
+        fleet.send_on_change(keepalive=CONTROLLER_KEEPALIVE_SEC)
+
+    # Bounded EV message ingestion (opt-in): at most CONTROLLER_INGEST_QUEUE_LIMIT
+    # messages per endpoint and step (default 0 = drain everything, the old loop),
+    # optionally CONTROLLER_INGEST_RATE per simulated second, and with
+    # CONTROLLER_INGEST_CHECK_SOURCE=1 only messages from the endpoint's
+    # destination (gld_hlc_conn/EVn), so a flooding sender cannot stretch a step
+    CONTROLLER_INGEST_QUEUE_LIMIT = int(os.getenv("CONTROLLER_INGEST_QUEUE_LIMIT", "0"))
+    CONTROLLER_INGEST_RATE = float(os.getenv("CONTROLLER_INGEST_RATE", "0"))
+    if CONTROLLER_INGEST_QUEUE_LIMIT > 0:
+        fleet.limit_ingestion(
+            CONTROLLER_INGEST_QUEUE_LIMIT, rate=CONTROLLER_INGEST_RATE or None,
+            check_source=os.getenv("CONTROLLER_INGEST_CHECK_SOURCE", "0") == "1",
+        )
 
-    # Data storage
-    EV_data = {name: [] for name in ev_names}
-    time_sim = []
-    feeder_real_power = []
+    # Look-ahead planning: follow a per-EV setpoint plan for the day
+    # (dispatch_planner.py), corrected against the measured load, instead of
+    # picking a branch every step. A saved plan (.npz) or "auto" to plan at
+    # startup; commands are sent on change
+    CONTROLLER_PLAN = os.getenv("CONTROLLER_PLAN", "")
+    if CONTROLLER_PLAN:
+        from dispatch_planner import plan_for_fleet
+        plan = fleet.follow_plan(plan_for_fleet(fleet, CONTROLLER_PLAN), keepalive=CONTROLLER_KEEPALIVE_SEC)
+        logger.info("{}: Following dispatch plan {} ({} blocks, {} setpoint changes)".format(
+            federate_name, CONTROLLER_PLAN, len(plan), int(plan.changes().sum())))
+
+    # Data storage: fixed-size buffers streamed to 1c_EV_Outputs.tlm
+    n_evs = len(ev_names)
+    recorder = TelemetryRecorder(
+        "1c_EV_Outputs.tlm", ev_names + ["time", "feeder_load"],
+        buffer_rows(total_interval, update_interval),
+    )
+    row = np.empty(n_evs + 2)
+
+    # Human-readable per-step log: optional, and rate-limited to branch
+    # changes plus one step every CONTROLLER_STEP_LOG_SEC wall seconds
+    step_log = StepLogger(
+        enabled=os.getenv("CONTROLLER_STEP_LOG", "1") == "1",
+        min_interval=float(os.getenv("CONTROLLER_STEP_LOG_SEC", "10")),
+    )
+
+    # Time advancement: "fixed" steps every update_interval; "event" requests
+    # the maximum time and only wakes when gld_hlc_conn/S* change (by more
+    # than CONTROLLER_WAKE_DELTA_VA) or an EV message arrives
+    CONTROLLER_TIME_MODE = os.getenv("CONTROLLER_TIME_MODE", "fixed")
+    CONTROLLER_WAKE_DELTA_VA = float(os.getenv("CONTROLLER_WAKE_DELTA_VA", "0"))
+
+    # Incremental checkpoints: every CONTROLLER_CHECKPOINT_SEC simulation
+    # seconds the telemetry rows since the last checkpoint and the controller
+    # state are appended to CONTROLLER_CHECKPOINT by a background thread.
+    # CONTROLLER_RESUME=1 restores the last checkpoint and fast-forwards to it
+    CONTROLLER_CHECKPOINT = os.getenv("CONTROLLER_CHECKPOINT", "")
+    CONTROLLER_CHECKPOINT_SEC = int(os.getenv("CONTROLLER_CHECKPOINT_SEC", "3600"))
+    CONTROLLER_RESUME = os.getenv("CONTROLLER_RESUME", "0") == "1"
+    resume_from = None
+    if CONTROLLER_RESUME and CONTROLLER_CHECKPOINT and os.path.exists(CONTROLLER_CHECKPOINT):
+        resume_from = load_checkpoint(CONTROLLER_CHECKPOINT)
+    if CONTROLLER_RESUME and resume_from is None:
+        logger.warning("{}: No checkpoint to resume from in '{}', starting at 0".format(
+            federate_name, CONTROLLER_CHECKPOINT))
+    checkpointer = None
+    if CONTROLLER_CHECKPOINT:
+        checkpointer = Checkpointer(
+            CONTROLLER_CHECKPOINT, ev_names, recorder.columns, CONTROLLER_CHECKPOINT_SEC,
+            meta={"federate": federate_name, "interval": update_interval}, resume=resume_from is not None,
+        )
+    # Structured event journal (one typed record per step, written by a
+    # background thread); .jsonl or columnar .tlm, empty disables it. On
+    # resume the journal is kept up to the checkpoint time and appended to
+    CONTROLLER_JOURNAL = os.getenv("CONTROLLER_JOURNAL", "1c_Controller_events.jsonl")
+    journal = None
+    if CONTROLLER_JOURNAL:
+        journal = EventJournal(CONTROLLER_JOURNAL, ev_names,
+                               resume_at=resume_from.time if resume_from is not None else None)
+
+    start_time = 0
+    if resume_from is not None:
+        # Telemetry and state up to the checkpoint; the last commands are not
+        # restored into the send-on-change cache, so the restarted feeder is
+        # sent every command again at the first step
+        for restored in resume_from.rows.T:
+            recorder.append(restored)
+        fleet.setpoints = resume_from.arrays["setpoints"].copy()
+        fleet.readings[:] = resume_from.arrays["readings"]
+        if fleet.plan is not None:
+            fleet.plan.bias = resume_from.state.get("plan_bias", 0.0)
+        grantedtime = int(resume_from.time)
+        start_time = grantedtime if CONTROLLER_TIME_MODE == "event" else grantedtime + update_interval
+        logger.info("{}: Resuming from checkpoint at {} s ({} rows restored)".format(
+            federate_name, grantedtime, resume_from.rows.shape[1]))
+
+    clock = make_clock(
+        CONTROLLER_TIME_MODE, fed, total_interval, update_interval,
+        fleet.inputs, CONTROLLER_WAKE_DELTA_VA, start=start_time,
+    )
+
+    # Per-step phase timing (off by default): CONTROLLER_PROFILE=1 logs
+    # per-phase totals and histograms at finalize, CONTROLLER_PROFILE_RAW
+    # additionally dumps every step's timings (.csv or .tlm)
+    CONTROLLER_PROFILE_RAW = os.getenv("CONTROLLER_PROFILE_RAW", "")
+    profiler = make_profiler(
+        enabled=os.getenv("CONTROLLER_PROFILE", "0") == "1" or bool(CONTROLLER_PROFILE_RAW),
+        raw_path=CONTROLLER_PROFILE_RAW or None,
+    )
 
     # ---------------------------------------------------------------------
-    # Main time loop
+    # Enter execution mode
     # ---------------------------------------------------------------------
-    for t in range(0, total_interval, update_interval):
-
-        # Synchronize HELICS time
-        while grantedtime < t:
-            grantedtime = h.helicsFederateRequestTime(fed, t)
+    h.helicsFederateEnterExecutingMode(fed)
+    logger.info("{}: Entered executing mode".format(federate_name))
+    if journal is not None:
+        # A resumed run's start record follows the kept records, at the checkpoint time
+        journal.event("start", grantedtime if resume_from is not None else 0,
+                      federate=federate_name, interval=update_interval,
+                      limit_lower_w=feeder_limit_lower, limit_upper_w=feeder_limit_upper,
+                      time_mode=CONTROLLER_TIME_MODE, plan=CONTROLLER_PLAN or None,
+                      resumed_from=resume_from.time if resume_from is not None else None)
 
-        # Time in hours
-        time_sim.append(t / 3600.0)
+    # ---------------------------------------------------------------------
+    # Main time loop
+    # ---------------------------------------------------------------------
+    profiler.start()
+    for t in clock:
+        grantedtime = clock.granted
+        profiler.lap(REQUEST_TIME)
 
         # ---------------------- Read feeder load -------------------------
-        rload_total = 0.0
-        iload_total = 0.0
-        for i in range(subkeys_count):
-            sub = subid[f"m{i}"]
-            demand = h.helicsInputGetComplex(sub)
-            rload_total += demand.real
-            iload_total += demand.imag
-
-        feeder_real_power.append(rload_total)
+        load = fleet.read_load()
+        rload_total = load.real
+        iload_total = load.imag
+        profiler.lap(READ_INPUTS)
 
         # ---------------------- Read EV messages -------------------------
-        # Initialize EV values with NaN for this time step
-        current_ev_values = {name: np.nan for name in ev_names}
+        # NaN for every EV that sent nothing this time step
+        readings = fleet.read_messages(now=grantedtime)
+        profiler.lap(READ_MESSAGES)
+
+        # Store EV values, time in hours and feeder load for this time step
+        row[:n_evs] = readings
+        row[n_evs] = t / 3600.0
+        row[n_evs + 1] = rload_total
+        recorder.append(row)
+        if checkpointer is not None:
+            checkpointer.record(row)
+        profiler.lap(RECORD)
 
-        for i in range(endpoint_count):
-            end_point = endid[f"m{i}"]
-            ev_name = ev_names[i]
-
-            latest_val = None
-            end_point_msg_obj = None
-
-            # Clear pending messages, keep only the most recent one
-            while h.helicsEndpointHasMessage(end_point):
-                end_point_msg_obj = h.helicsEndpointGetMessage(end_point)
-
-            if end_point_msg_obj is not None:
-                try:
-                    EV_now = complex(h.helicsMessageGetString(end_point_msg_obj))
-                    latest_val = EV_now.real / 1000.0  # W -> kW
-                except Exception as e:
-                    logger.warning(
-                        f"{federate_name}: Could not parse EV message at endpoint {ev_name}: {e}"
-                    )
-
-            if latest_val is not None:
-                current_ev_values[ev_name] = latest_val
-
-        # Store EV values (one per EV per time step)
-        for name in ev_names:
-            EV_data[name].append(current_ev_values[name])
+        # -----------------------------------------------------------------
+        # CONTROL LOGIC
+        # -----------------------------------------------------------------
+        P = rload_total
+        branch = fleet.step(P, now=grantedtime)
+        profiler.lap(CONTROL)
+        if journal is not None:
+            journal.step(grantedtime, load, branch, fleet.setpoints, fleet.last_sent)
+        if checkpointer is not None and checkpointer.due(grantedtime):
+            _checkpoint(checkpointer, fleet, grantedtime, branch)
+        profiler.lap(RECORD)
+        if not step_log.due(branch):
+            profiler.end_step(grantedtime)
+            continue
 
         logger.info(
             "{}: Federate Granted Time = {}".format(federate_name, grantedtime)
@@ -155,86 +270,83 @@ if __name__ == "__main__":
                 round(iload_total / 1000.0, 2),
             )
         )
+        action_taken = BRANCH_NAMES[branch]
 
-        # -----------------------------------------------------------------
-        # CONTROL LOGIC
-        # -----------------------------------------------------------------
-        P = feeder_real_power[-1]
-        action_taken = "unknown"
-
-        # Case 1: Overload condition → turn OFF all EV stations
-        if P >= feeder_limit_upper:
+        # Planned: setpoints come from the plan
+        if branch == PLANNED:
             logger.info(
-                "{}: OVERLOAD: P = {:.2f} MW >= {:.2f} MW, turning OFF all EV stations.".format(
+                "{}: PLANNED: P = {:.2f} MW, EV setpoints {:.1f} kW in total.".format(
+                    federate_name, P / 1e6, np.nansum(fleet.setpoints) / 1000.0
+                )
+            )
+        # Case 1: Overload condition → all EV stations OFF
+        elif branch == OVERLOAD:
+            logger.info(
+                "{}: OVERLOAD: P = {:.2f} MW >= {:.2f} MW, all EVs are now OFF.".format(
                     federate_name, P / 1e6, feeder_limit_upper / 1e6
                 )
             )
-
-            # Turn OFF all EVs (all endpoints)
-            for i in range(endpoint_count):
-                h.helicsEndpointSendBytes(endid[f"m{i}"], '0.0+0.0j')
-
-            logger.info("{}: All EVs are now OFF due to overload.".format(federate_name))
-            action_taken = "overload_off"
-
-        # Case 2: Safe range → only EV1 and EV2 ON, others OFF
-        elif feeder_limit_lower < P < feeder_limit_upper:
+        # Case 2: Safe range → alternating 210/200 kW setpoints
+        elif branch == SAFE_RANGE:
             logger.info(
-                "{}: SAFE RANGE: P = {:.2f} MW, EV1 & EV2 ON, others OFF.".format(
+                "{}: SAFE RANGE: P = {:.2f} MW, EV setpoints reduced.".format(
                     federate_name, P / 1e6
                 )
             )
-
-            # Turn ON EV1 and EV2
-            h.helicsEndpointSendBytes(endid["m0"], '210000+0.0j')  # EV1
-            h.helicsEndpointSendBytes(endid["m1"], '200000+0.0j')  # EV2
-            h.helicsEndpointSendBytes(endid["m2"], '210000+0.0j')  # EV1
-            h.helicsEndpointSendBytes(endid["m3"], '200000+0.0j')  # EV2
-            h.helicsEndpointSendBytes(endid["m4"], '210000+0.0j')  # EV1
-            h.helicsEndpointSendBytes(endid["m5"], '200000+0.0j')  # EV2
-            action_taken = "safe_range_ev1_ev2_only"
-
-            # Turn OFF EV3–EV6 (if they exist)
-            # for i in range(2, endpoint_count):
-            #     h.helicsEndpointSendBytes(endid[f"m{i}"], '0.0+0.0j')
-            #
-            # logger.info("{}: EV3, EV4, EV5, and EV6 are OFF.".format(federate_name))
-
         # Case 3: Below or equal to lower limit → all EVs ON
-        else:  # P <= feeder_limit_lower
+        else:
             logger.info(
-                "{}: LOW LOAD: P = {:.2f} MW <= {:.2f} MW, turning ON ALL EVs.".format(
+                "{}: LOW LOAD: P = {:.2f} MW <= {:.2f} MW, all EVs are now charging.".format(
                     federate_name, P / 1e6, feeder_limit_lower / 1e6
                 )
             )
 
-            # Turn ON all EVs (same pattern as before)
-            powers = ['210000+0.0j', '200000+0.0j', '200000+0.0j',
-                      '200000+0.0j', '200000+0.0j', '206000+0.0j']
-            for i in range(endpoint_count):
-                p_cmd = powers[i] if i < len(powers) else '200000+0.0j'
-                h.helicsEndpointSendBytes(endid[f"m{i}"], p_cmd)
-
-            logger.info("{}: All EVs are now charging.".format(federate_name))
-            action_taken = "low_load_all_on"
-
         logger.info(
             f"[CONTROLLER_ACTION] sim_time={grantedtime}s load_kw={P/1000.0:.1f} "
             f"interval={update_interval}s action={action_taken}"
         )
+        profiler.lap(LOG)
+        profiler.end_step(grantedtime)
 
     # ---------------------------------------------------------------------
     # Plotting and saving results (after loop)
     # ---------------------------------------------------------------------
+    grantedtime = max(grantedtime, clock.granted)
+    recorder.close()
+    if checkpointer is not None:
+        _checkpoint(checkpointer, fleet, grantedtime, None)
+        checkpointer.close()
+    logger.info("{}: {}".format(federate_name, clock.report()))
+    logger.info("{}: {}".format(federate_name, step_log.report()))
+    if fleet.dispatcher is not None:
+        logger.info("{}: Send-on-change {}".format(federate_name, fleet.dispatcher.report()))
+    if fleet.ingestor is not None:
+        logger.info("{}: EV message ingestion {}".format(federate_name, fleet.ingestor.report()))
+    if fleet.plan is not None:
+        logger.info("{}: Dispatch plan corrected in {} steps, final forecast bias {:.1f} kW".format(
+            federate_name, fleet.plan.corrections, fleet.plan.bias / 1000.0))
+    if journal is not None:
+        journal.event("end", grantedtime, clock=clock.report(),
+                      dispatcher=fleet.dispatcher.report() if fleet.dispatcher is not None else None,
+                      ingestion={key: dict(zip(ev_names, counts.tolist()))
+                                 for key, counts in fleet.ingestor.counts().items()}
+                      if fleet.ingestor is not None else None)
+        journal.close()
+
+    # Save data first
+    profiler.start()
+    export_csv("1c_EV_Outputs.tlm", "1c_EV_Outputs.csv")
+    profiler.lap_span("export_csv")
+
     if plotting:
-        # Save data first
-        EV_data["time"] = time_sim
-        EV_data["feeder_load"] = feeder_real_power
-        pd.DataFrame.from_dict(EV_data).to_csv("1c_EV_Outputs.csv", header=True, index=False)
+        import matplotlib.pyplot as plt
+
+        EV_data = load_recording("1c_EV_Outputs.tlm")
+        time_sim = EV_data["time"]
+        feeder_real_power = EV_data["feeder_load"]
 
         # EV names for plotting
-        plot_ev_names = [k for k in EV_data if k not in ["time", "feeder_load"]]
-        n_evs = len(plot_ev_names)
+        plot_ev_names = list(ev_names)
 
         # Sanity check lengths
         logger.info(f"len(time_sim) = {len(time_sim)}")
@@ -268,6 +380,7 @@ if __name__ == "__main__":
 
         plt.tight_layout()
         plt.savefig("./output/1c_Feeder_and_EVs_subplot.png", dpi=300)
+        profiler.lap_span("plotting")
 
     # ---------------------------------------------------------------------
     # Finalize federate
@@ -278,3 +391,5 @@ if __name__ == "__main__":
 
     logger.info("{}: Destroying federate".format(federate_name))
     destroy_federate(fed)
+    profiler.lap_span("finalize")
+    profiler.finish(logger, prefix="{}: ".format(federate_name))
@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
-import matplotlib.pyplot as plt
-import time
 import helics as h
 import logging
-import pandas as pd
 import numpy as np
 import argparse
+import os
+
+from ev_fleet import EVFleet, secondary_setpoint_table, OVERLOAD, SAFE_RANGE
+from live_dashboard import RingBuffer, start_dashboard
+from step_profiler import (
+    make_profiler, REQUEST_TIME, READ_INPUTS, READ_MESSAGES, CONTROL, RECORD, LOG
+)
+from telemetry_recorder import TelemetryRecorder, buffer_rows, export_csv
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
@@ -27,122 +32,104 @@ if __name__ == "__main__":
     logger.info("HELICS Version: {}".format(h.helicsGetVersion()))
     logger.info("{}: Federate {} has been registered".format(federate_name, federate_name))
 
-    endpoint_count = h.helicsFederateGetEndpointCount(fed)
-    subkeys_count = h.helicsFederateGetInputCount(fed)
-    endid = {}
-    subid = {}
-    ev_names = []
-
-    for i in range(endpoint_count):
-        ep = h.helicsFederateGetEndpointByIndex(fed, i)
-        endid[f"m{i}"] = ep
-        name = h.helicsEndpointGetName(ep).split("/")[-1]
-        ev_names.append(name)
+    feeder_limit_upper = 4.2e6
+    feeder_limit_lower = 2.6e6
+    fleet = EVFleet.from_federate(
+        fed, secondary_setpoint_table, feeder_limit_lower, feeder_limit_upper
+    )
+    ev_names = fleet.names
+    for name in ev_names:
         logger.info(f"{federate_name}: Registered Endpoint ---> {name}")
 
-    for i in range(subkeys_count):
-        subid[f"m{i}"] = h.helicsFederateGetInputByIndex(fed, i)
-        h.helicsInputSetDefaultComplex(subid[f"m{i}"], 0, 0)
-        logger.info(f"{federate_name}: Registered Subscription ---> {h.helicsInputGetTarget(subid[f'm{i}'])}")
+    for sub in fleet.inputs:
+        h.helicsInputSetDefaultComplex(sub, 0, 0)
+        logger.info(f"{federate_name}: Registered Subscription ---> {h.helicsInputGetTarget(sub)}")
 
     h.helicsFederateEnterExecutingMode(fed)
+    logger.info(f"{federate_name}: Entered executing mode")
 
-    plotting = True
+    # CONTROLLER_HEADLESS=1 skips the live dashboard process entirely
+    plotting = os.getenv("CONTROLLER_HEADLESS", "0") != "1"
     hours = 24
     #total_interval = int(60 * 60 * hours)
     total_interval = 1
     grantedtime = -1
     update_interval = 1 * 60
-    feeder_limit_upper = 4.2e6
-    feeder_limit_lower = 2.6e6
-    EV_data = {name: [] for name in ev_names}
-    time_sim = []
-    feeder_real_power = []
-
+    n_evs = len(ev_names)
+    recorder = TelemetryRecorder(
+        "1c_EV_Outputs_2.tlm", ev_names + ["time", "feeder_load_W"],
+        buffer_rows(total_interval, update_interval),
+    )
+    row = np.empty(n_evs + 2)
+
+    # Live plots are drawn by a separate dashboard process reading a
+    # shared-memory ring buffer; the time loop only pushes one row per step
     if plotting:
-        ax = {}
-        fig = plt.figure()
-        fig.subplots_adjust(hspace=0.4, wspace=0.4)
-        ax['Feeder_2'] = plt.subplot(313)
-        for i, name in enumerate(ev_names):
-            ax[name] = plt.subplot(331 + i)
-
+        ring = RingBuffer.create(recorder.columns)
+        dashboard = start_dashboard(ring)
+
+    # Per-step phase timing, as in 1bc_EV_Controller.py: CONTROLLER_PROFILE=1
+    # and/or CONTROLLER_PROFILE_RAW=<.csv or .tlm path>
+    CONTROLLER_PROFILE_RAW = os.getenv("CONTROLLER_PROFILE_RAW", "")
+    profiler = make_profiler(
+        enabled=os.getenv("CONTROLLER_PROFILE", "0") == "1" or bool(CONTROLLER_PROFILE_RAW),
+        raw_path=CONTROLLER_PROFILE_RAW or None,
+    )
+
+    profiler.start()
     for t in range(0, total_interval, update_interval):
         while grantedtime < t:
             grantedtime = h.helicsFederateRequestTime(fed, t)
+        profiler.lap(REQUEST_TIME)
 
-        time_sim.append(t / 3600)
+        load = fleet.read_load()
+        rload_total = load.real
+        iload_total = load.imag
+        profiler.lap(READ_INPUTS)
 
-        rload_total = 0
-        iload_total = 0
-        for i in range(subkeys_count):
-            demand = h.helicsInputGetComplex(subid[f"m{i}"])
-            rload_total += demand.real
-            iload_total += demand.imag
-        feeder_real_power.append(rload_total)
-
-        # Initialize all EV values as NaN in case no message is received this step
-        current_ev_values = {name: np.nan for name in ev_names}
-
-        for i in range(endpoint_count):
-            ep = endid[f"m{i}"]
-            name = ev_names[i]
-            latest_val = None
-
-            while h.helicsEndpointHasMessage(ep):
-                msg = h.helicsEndpointGetMessage(ep)
-                try:
-                    latest_val = complex(h.helicsMessageGetString(msg)).real / 1000
-                except Exception as e:
-                    logger.warning(f"Could not parse message for {name}: {e}")
-                    continue
-
-            if latest_val is not None:
-                current_ev_values[name] = latest_val
+        # NaN for every EV that sent nothing this step
+        readings = fleet.read_messages()
+        profiler.lap(READ_MESSAGES)
 
         # Store the values
-        for name in ev_names:
-            EV_data[name].append(current_ev_values[name])
+        row[:n_evs] = readings
+        row[n_evs] = t / 3600
+        row[n_evs + 1] = rload_total
+        recorder.append(row)
+        profiler.lap(RECORD)
 
         logger.info(f"{federate_name}: Granted Time = {grantedtime}")
         logger.info(f"{federate_name}: Load = {rload_total/1e3:.2f} kW + {iload_total/1e3:.2f} kVAr")
+        profiler.lap(LOG)
 
-        if feeder_real_power[-1] > feeder_limit_upper:
-            for idx in range(endpoint_count):
-                h.helicsEndpointSendBytes(endid[f"m{idx}"], '0.0+0.0j')
+        branch = fleet.step(rload_total)
+        profiler.lap(CONTROL)
+        if branch == OVERLOAD:
             logger.info(f"{federate_name}: Overload action executed")
-        elif feeder_limit_lower < feeder_real_power[-1] < feeder_limit_upper:
-            for idx in range(2):
-                h.helicsEndpointSendBytes(endid[f"m{idx}"], '210000+0.0j')
+        elif branch == SAFE_RANGE:
             logger.info(f"{federate_name}: Safe range action executed")
         else:
-            for idx in range(endpoint_count):
-                h.helicsEndpointSendBytes(endid[f"m{idx}"], '200000+0.0j')
             logger.info(f"{federate_name}: Low-load action executed")
+        profiler.lap(LOG)
 
         if plotting:
-            ax['Feeder_2'].clear()
-            ax['Feeder_2'].plot(time_sim, np.array(feeder_real_power)/1e6)
-            ax['Feeder_2'].set_ylabel("Feeder Load (MW)")
-            ax['Feeder_2'].set_xlabel("Time (Hours)")
-            ax['Feeder_2'].grid()
-
-            for name in ev_names:
-                ax[name].clear()
-                ax[name].plot(time_sim, EV_data[name])
-                ax[name].set_title(name)
-                ax[name].set_ylabel("EV Output (kW)")
-                ax[name].set_xlabel("Time (Hours)")
-                ax[name].grid()
-
-            plt.show(block=False)
-            plt.pause(0.01)
+            ring.push(row)
+            profiler.lap(RECORD)
+        profiler.end_step(grantedtime)
 
+    recorder.close()
+    export_csv("1c_EV_Outputs_2.tlm", "1c_EV_Outputs_2.csv")
+    profiler.lap_span("export_csv")
     if plotting:
-        df = pd.DataFrame(EV_data)
-        df["time"] = time_sim
-        df["feeder_load_W"] = feeder_real_power
-        df.to_csv("1c_EV_Outputs_2.csv", index=False)
+        ring.finish()
 
     logger.info(f"{federate_name}: Finished time loop, finalizing federate.")
     destroy_federate(fed)
+    profiler.lap_span("finalize")
+
+    if plotting:
+        # Give the dashboard time to attach and draw the last frame
+        dashboard.join(timeout=5)
+        ring.close()
+
+    profiler.finish(logger, prefix=f"{federate_name}: ")
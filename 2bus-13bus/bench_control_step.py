@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Step-latency benchmark: original per-endpoint dict loop vs. the EVFleet core.
+
+Both implementations run against mock_helics, the in-memory stand-in for the
+helics calls, so the numbers measure controller-side Python work only.
+
+    python bench_control_step.py                # 6, 600 and 6000 endpoints
+    python bench_control_step.py -n 6 60 -r 50
+"""
+import argparse
+import time
+
+import numpy as np
+
+import mock_helics as h
+from ev_fleet import EVFleet, primary_setpoint_table
+
+
+def _setup(n):
+    """Mock federation with n controller endpoints and a constant feeder load."""
+    h.reset()
+    fed = h.helicsCreateCombinationFederate("EVControllerSim", h.helicsCreateFederateInfo())
+    endpoints = [h.helicsFederateRegisterGlobalEndpoint(fed, f"EV_Controller/EV{i + 1}", "") for i in range(n)]
+    for ep in endpoints:
+        h.helicsEndpointSetDefaultDestination(ep, f"gld_hlc_conn/{h.helicsEndpointGetName(ep).split('/')[-1]}")
+    feeder = h.helicsCreateCombinationFederate("gld_hlc_conn", h.helicsCreateFederateInfo())
+    pubs = [h.helicsFederateRegisterGlobalPublication(feeder, f"gld_hlc_conn/S{ph}", h.HELICS_DATA_TYPE_COMPLEX, "VA")
+            for ph in "abc"]
+    subs = [h.helicsFederateRegisterSubscription(fed, f"gld_hlc_conn/S{ph}", "VA") for ph in "abc"]
+    for pub in pubs:
+        h.helicsPublicationPublishComplex(pub, 1.2e6, 3.0e5)
+    return endpoints, subs
+
+
+def fill(endpoints):
+    """Queue one reading on every endpoint, as GridLAB-D does each step."""
+    for ep in endpoints:
+        h.deliver(ep.name, b'200000.0+0.0j')
+
+
+def legacy_step(h, endid, subid, ev_names, feeder_limit_lower, feeder_limit_upper):
+    """One step of the original 1bc_EV_Controller.py loop body."""
+    endpoint_count = len(endid)
+    rload_total = 0.0
+    for i in range(len(subid)):
+        rload_total += h.helicsInputGetComplex(subid[f"m{i}"]).real
+
+    current_ev_values = {name: np.nan for name in ev_names}
+    for i in range(endpoint_count):
+        end_point = endid[f"m{i}"]
+        end_point_msg_obj = None
+        while h.helicsEndpointHasMessage(end_point):
+            end_point_msg_obj = h.helicsEndpointGetMessage(end_point)
+        if end_point_msg_obj is not None:
+            current_ev_values[ev_names[i]] = complex(h.helicsMessageGetString(end_point_msg_obj)).real / 1000.0
+
+    P = rload_total
+    if P >= feeder_limit_upper:
+        for i in range(endpoint_count):
+            h.helicsEndpointSendBytes(endid[f"m{i}"], '0.0+0.0j')
+    elif feeder_limit_lower < P < feeder_limit_upper:
+        for i in range(endpoint_count):
+            h.helicsEndpointSendBytes(endid[f"m{i}"], '210000+0.0j' if i % 2 == 0 else '200000+0.0j')
+    else:
+        powers = ['210000+0.0j', '200000+0.0j', '200000+0.0j',
+                  '200000+0.0j', '200000+0.0j', '206000+0.0j']
+        for i in range(endpoint_count):
+            h.helicsEndpointSendBytes(endid[f"m{i}"], powers[i] if i < len(powers) else '200000+0.0j')
+    return current_ev_values
+
+
+def fleet_step(fleet):
+    """One step of the EVFleet based loop body."""
+    load = fleet.read_load()
+    fleet.read_messages()
+    return fleet.step(load.real)
+
+
+def _time_step(step, prepare, repeats):
+    """Median wall time (s) of step() over repeats, calling prepare() untimed."""
+    samples = []
+    for _ in range(repeats):
+        prepare()
+        start = time.perf_counter()
+        step()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples))
+
+
+def run(sizes, repeats):
+    print(f"{'EVs':>6} {'legacy (ms)':>12} {'fleet (ms)':>12} {'speedup':>8}")
+    for n in sizes:
+        endpoints, subs = _setup(n)
+        ev_names = [h.helicsEndpointGetName(ep).split('/')[-1] for ep in endpoints]
+        endid = {f"m{i}": ep for i, ep in enumerate(endpoints)}
+        subid = {f"m{i}": sub for i, sub in enumerate(subs)}
+        fleet = EVFleet(ev_names, endpoints, subs, primary_setpoint_table(n), 2.6e6, 4.8e6, api=h)
+
+        t_legacy = _time_step(
+            lambda: legacy_step(h, endid, subid, ev_names, 2.6e6, 4.8e6),
+            lambda: fill(endpoints), repeats,
+        )
+        t_fleet = _time_step(lambda: fleet_step(fleet), lambda: fill(endpoints), repeats)
+        print(f"{n:>6} {t_legacy * 1e3:>12.3f} {t_fleet * 1e3:>12.3f} {t_legacy / t_fleet:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='EV controller step-latency benchmark')
+    parser.add_argument('-n', '--sizes', nargs='+', type=int, default=[6, 600, 6000])
+    parser.add_argument('-r', '--repeats', type=int, default=200)
+    args = parser.parse_args()
+    run(args.sizes, args.repeats)
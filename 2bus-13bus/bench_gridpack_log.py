@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput and peak-memory benchmark for gridpack_log_output.py.
+
+Builds a synthetic gridpack.log of the requested size by repeating the solver
+output of the real log (configuration dump, PETSc KSP view, branch flows and
+bus table) under increasing "Granted Time" lines. The streaming parser then
+runs over the whole file. The original readlines() parser runs over a prefix
+only, because on a multi-GB log it would run out of memory. Each parser runs
+in its own process, so the peak RSS numbers are not mixed up.
+
+    python bench_gridpack_log.py                   # 2 GB log, 256 MB legacy prefix
+    python bench_gridpack_log.py --size-gb 4 --legacy-mb 512
+    python bench_gridpack_log.py --check           # chunk-size consistency only
+"""
+import argparse
+import multiprocessing as mp
+import os
+import re
+import resource
+import tempfile
+import time
+
+from gridpack_log_output import iter_solutions
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GRANTED_LINE = "[2025-08-18 17:47:09.356] [console] [debug] gridpack (131072)[{t}]::Granted Time={t}\n"
+
+
+def legacy_parse(log_file_path):
+    """The original readlines() parser, minus the printing."""
+    iterations_data = []
+    with open(log_file_path, 'r') as file:
+        lines = file.readlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith("Iteration"):
+            iteration_num = int(re.search(r"Iteration\s+(\d+)", line).group(1))
+            iteration_info = {"iteration": iteration_num, "buses": []}
+            while i < len(lines) and not lines[i].strip().startswith("Bus Voltages and Phase Angles"):
+                i += 1
+            i += 2
+            while i < len(lines) and lines[i].strip() != "":
+                match = re.match(r"\s*(\d+)\s+([-.\d]+)\s+([-.\d]+)", lines[i])
+                if match:
+                    iteration_info["buses"].append({
+                        "bus": int(match.group(1)),
+                        "voltage_mag": float(match.group(3)),
+                        "phase_angle": float(match.group(2)),
+                    })
+                i += 1
+            iterations_data.append(iteration_info)
+        i += 1
+    return len(iterations_data)
+
+
+def streaming_parse(path):
+    return sum(1 for _ in iter_solutions(path))
+
+
+def _solutions(path, chunk_bytes=None):
+    kw = {} if chunk_bytes is None else {"chunk_bytes": chunk_bytes}
+    return [(s.index, s.time, s.iteration, s.bus.tolist(), s.voltage_mag.tolist(), s.phase_angle.tolist())
+            for s in iter_solutions(path, **kw)]
+
+
+def check_chunk_sizes(path, chunk_sizes=range(1, 4097, 61)):
+    """Raise AssertionError unless every chunk size parses path like the default."""
+    expected = _solutions(path)
+    assert expected, f"no solutions in {path}"
+    for chunk_bytes in chunk_sizes:
+        got = _solutions(path, chunk_bytes)
+        if got != expected:
+            first = next((i for i, (g, e) in enumerate(zip(got, expected)) if g != e), min(len(got), len(expected)))
+            raise AssertionError(f"chunk_bytes={chunk_bytes}: solution {first} differs "
+                                 f"({len(got)} solutions, expected {len(expected)})")
+    return len(expected)
+
+
+def _solve_block():
+    """Solver output of one power flow from the real log, with a blank line after the bus table."""
+    with open(os.path.join(HERE, "gridpack.log")) as fh:
+        lines = fh.readlines()
+    start = next(i for i, line in enumerate(lines) if line.startswith("<Configuration>"))
+    table = next(i for i, line in enumerate(lines) if "Bus Voltages and Phase Angles" in line)
+    end = table + 3
+    while end < len(lines) and lines[end].lstrip()[:1].isdigit():
+        end += 1
+    return "".join(lines[start:end]) + "\n"
+
+
+def write_synthetic_log(path, size_bytes):
+    """Write solve blocks under increasing granted times until size_bytes."""
+    block = _solve_block()
+    written = 0
+    t = 0
+    with open(path, "w") as fh:
+        while written < size_bytes:
+            chunk = GRANTED_LINE.format(t=t) + block
+            fh.write(chunk)
+            written += len(chunk)
+            t += 5
+    return written
+
+
+def _measure(target, path, nbytes, result):
+    if nbytes is not None:
+        with open(path, "rb") as src, open(path + ".prefix", "wb") as dst:
+            dst.write(src.read(nbytes))
+        path += ".prefix"
+    start = time.perf_counter()
+    n = target(path)
+    elapsed = time.perf_counter() - start
+    result.put((n, elapsed, os.path.getsize(path), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+    if nbytes is not None:
+        os.remove(path)
+
+
+def measure(target, path, nbytes=None):
+    """(solutions, seconds, bytes read, peak RSS in KiB) of target(path) in a fresh process."""
+    ctx = mp.get_context("spawn")
+    result = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(target, path, nbytes, result))
+    proc.start()
+    out = result.get()
+    proc.join()
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='gridpack.log parser benchmark')
+    parser.add_argument('--size-gb', type=float, default=2.0, help='synthetic log size')
+    parser.add_argument('--legacy-mb', type=float, default=256.0,
+                        help='prefix of the log given to the readlines() parser')
+    parser.add_argument('--dir', default=None, help='where to write the synthetic log')
+    parser.add_argument('--check', action='store_true',
+                        help='only check that every chunk size gives the same solutions')
+    args = parser.parse_args()
+
+    n = check_chunk_sizes(os.path.join(HERE, "gridpack.log"))
+    print(f"chunk-size check: {n} solutions in gridpack.log agree for all chunk sizes")
+    if args.check:
+        fd, path = tempfile.mkstemp(suffix=".log", prefix="gridpack_check_", dir=args.dir)
+        os.close(fd)
+        try:
+            write_synthetic_log(path, 200_000)
+            n = check_chunk_sizes(path)
+            print(f"chunk-size check: {n} solutions in a synthetic log agree for all chunk sizes")
+        finally:
+            os.remove(path)
+        raise SystemExit(0)
+
+    fd, path = tempfile.mkstemp(suffix=".log", prefix="gridpack_synthetic_", dir=args.dir)
+    os.close(fd)
+    try:
+        size = write_synthetic_log(path, int(args.size_gb * 1e9))
+        print(f"synthetic log: {size / 1e9:.2f} GB at {path}")
+        print(f"{'parser':<10} {'input (MB)':>10} {'solutions':>10} {'time (s)':>9} {'MB/s':>7} {'peak RSS (MB)':>14}")
+        runs = [("legacy", legacy_parse, int(args.legacy_mb * 1e6)), ("streaming", streaming_parse, None)]
+        for name, target, nbytes in runs:
+            n, elapsed, nread, rss = measure(target, path, nbytes)
+            print(f"{name:<10} {nread / 1e6:>10.0f} {n:>10} {elapsed:>9.2f} "
+                  f"{nread / 1e6 / elapsed:>7.1f} {rss / 1024:>14.1f}")
+    finally:
+        os.remove(path)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of EV message encode/decode cost per message.
+
+Compares the original string path (format + complex(str)) with the ev_messages
+string and binary codecs, and the batched binary decoder.
+
+    python bench_messages.py
+    python bench_messages.py -n 100000
+"""
+import argparse
+import time
+
+import ev_messages
+
+
+def _per_message(fn, items):
+    """Wall time per item (ns) of fn applied to every element of items."""
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1e9
+
+
+def run(n):
+    values = [complex(200000.0 + (i % 100) * 100.0, 0.0) for i in range(n)]
+    ids = list(range(n))
+
+    legacy_payloads = ['{}+0.0j'.format(int(v.real)) for v in values]
+    string_payloads = [ev_messages.encode_string(v) for v in values]
+    binary_payloads = [ev_messages.encode_binary(i, v) for i, v in zip(ids, values)]
+
+    rows = [
+        ("legacy encode (format str)", _per_message(lambda v: '{}+0.0j'.format(int(v.real)), values)),
+        ("string encode", _per_message(ev_messages.encode_string, values)),
+        ("binary encode", _per_message(lambda i: ev_messages.encode_binary(i, values[i]), ids)),
+        ("legacy decode (complex(str))", _per_message(lambda p: complex(p).real / 1000.0, legacy_payloads)),
+        ("string decode", _per_message(ev_messages.decode, string_payloads)),
+        ("binary decode", _per_message(ev_messages.decode, binary_payloads)),
+        ("string decode_real", _per_message(ev_messages.decode_real, string_payloads)),
+        ("binary decode_real", _per_message(ev_messages.decode_real, binary_payloads)),
+    ]
+    start = time.perf_counter()
+    ev_messages.decode_binary_batch(binary_payloads)
+    rows.append(("binary batch decode", (time.perf_counter() - start) / n * 1e9))
+
+    print(f"{n} messages, {ev_messages.BINARY_SIZE} B binary vs "
+          f"~{sum(map(len, string_payloads)) // n} B string payloads")
+    for label, ns in rows:
+        print(f"  {label:<30} {ns:>8.0f} ns/msg")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='EV message encode/decode micro-benchmark')
+    parser.add_argument('-n', '--messages', type=int, default=50000)
+    args = parser.parse_args()
+    run(args.messages)
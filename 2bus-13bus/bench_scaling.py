@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Scaling benchmark of the multi-feeder controller: 10, 100, 1,000 and 10,000 EVs.
+
+For every size a scenario is generated with scenario_generator.py
+(--per-feeder EVs per feeder, so 10,000 EVs is 100 feeders of 100), and the
+controller is driven through it:
+
+    mock    (default) controller.json and every feeder.json are loaded into
+            mock_helics; the feeders publish the load trace and echo each EV
+            command back as the EV's reading, so every step drains and sends
+            one message per EV. Only the controller's own work is timed.
+    inproc  surrogate feeders and the controller on a real HELICS inproc
+            broker (multi_feeder.run_inprocess), one thread per feeder; the
+            wall time per step includes HELICS and the feeders.
+
+Reported per size: generation time, setup (config load, discovery, fleets),
+controller time per step and per EV, peak RSS, and the growth exponent
+against the previous size (1.0 = linear). Sizes whose step time exceeds
+--budget-ms are marked, which shows where the current design stops keeping up.
+
+    python bench_scaling.py
+    python bench_scaling.py --sizes 10 100 1000 --per-feeder 10 --workers 4
+    python bench_scaling.py --engine inproc --sizes 10 100 1000
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import mock_helics as h
+from multi_feeder import MultiFeederFleet
+from scenario_generator import feeder_dir, generate
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+
+def _trace():
+    return np.loadtxt(os.path.join(HERE, "extracted_feeder_load.csv"), delimiter=",", skiprows=1, ndmin=1)
+
+
+def _feeder_peers(scenario, trace, trace_step=1200):
+    """One mock peer for all feeders: publish the trace and echo every EV command."""
+    feeders = []
+    for f in scenario.feeders:
+        fed = h.helicsCreateCombinationFederateFromConfig(
+            os.path.join(scenario.directory, feeder_dir(f), "feeder.json"))
+        endpoints = [h.helicsFederateGetEndpointByIndex(fed, i) for i in range(h.helicsFederateGetEndpointCount(fed))]
+        feeders.append((f.key, endpoints))
+
+    def step(t):
+        per_phase = complex(trace[min(int(t) // trace_step, len(trace) - 1)] / 3.0, 0.0)
+        for key, endpoints in feeders:
+            for ph in "abc":
+                h.publish(f"{key}/S{ph}", per_phase)
+            for ep in endpoints:
+                msg = None
+                while h.helicsEndpointHasMessage(ep):
+                    msg = h.helicsEndpointGetMessage(ep)
+                h.helicsEndpointSendBytes(ep, h.helicsMessageGetBytes(msg) if msg is not None else b"200000.0+0.0j")
+
+    return step
+
+
+def run_mock(scenario, steps, interval, workers):
+    """(setup s, controller s per step, messages sent per step)."""
+    h.reset()
+    h.add_peer(_feeder_peers(scenario, _trace()), period=interval)
+    start = time.perf_counter()
+    fed = h.helicsCreateCombinationFederateFromConfig(os.path.join(scenario.directory, "controller.json"))
+    fleet = MultiFeederFleet.from_federate(fed, api=h, workers=workers)
+    setup = time.perf_counter() - start
+    h.helicsFederateEnterExecutingMode(fed)
+    busy = 0.0
+    sent = 0
+    for k in range(steps):
+        h.helicsFederateRequestTime(fed, k * interval)
+        start = time.perf_counter()
+        fleet.read_loads()
+        fleet.read_messages()
+        fleet.step(now=k * interval)
+        busy += time.perf_counter() - start
+        sent += fleet.last_sent
+    fleet.close()
+    h.helicsFederateDisconnect(fed)
+    return setup, busy / steps, sent / steps
+
+
+def run_inproc(scenario, steps, interval, workers):
+    from multi_feeder import run_inprocess
+    from surrogate_feeder import load_config
+
+    with open(os.path.join(scenario.directory, feeder_dir(scenario.feeders[0]), "surrogate.json")) as fh:
+        config = json.load(fh)
+    base = load_config()
+    base.update(config, name="surrogate_feeder", hours=steps * interval / 3600.0, publish_interval=interval)
+    result, wall = run_inprocess(len(scenario.feeders), base, interval=interval, workers=workers,
+                                 broker_name=f"scaling_{os.getpid()}_{len(scenario.feeders)}")
+    n_steps = max(len(result["branches"]), 1)
+    return float("nan"), wall / n_steps, float("nan")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Controller scaling with the number of EVs')
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help='total EVs')
+    parser.add_argument('--per-feeder', type=int, default=100, help='EVs per feeder')
+    parser.add_argument('--engine', choices=['mock', 'inproc'], default='mock')
+    parser.add_argument('--steps', type=int, default=20, help='control steps per size')
+    parser.add_argument('--interval', type=int, default=60)
+    parser.add_argument('--workers', type=int, default=0, help='MultiFeederFleet thread pool')
+    parser.add_argument('--budget-ms', type=float, default=100.0, help='step time considered too slow')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_scaling_")
+    run = run_mock if args.engine == "mock" else run_inproc
+    print(f"engine {args.engine}, {args.per_feeder} EVs per feeder, {args.steps} steps, workers {args.workers}")
+    print(f"{'EVs':>7} {'feeders':>7} {'generate (s)':>12} {'setup (s)':>10} {'step (ms)':>10} "
+          f"{'us/EV':>7} {'msgs/step':>9} {'peak RSS (MB)':>13} {'growth':>6}")
+    previous = None
+    try:
+        for n in args.sizes:
+            per_feeder = min(n, args.per_feeder)
+            n_feeders = math.ceil(n / per_feeder)
+            start = time.perf_counter()
+            scenario = generate(os.path.join(work, f"ev{n}"), per_feeder, n_feeders,
+                                feeder_model="surrogate", port=0, players=False)
+            generated = time.perf_counter() - start
+            setup, step, sent = run(scenario, args.steps, args.interval, args.workers)
+            total = per_feeder * n_feeders
+            growth = math.log(step / previous[1]) / math.log(total / previous[0]) if previous else float("nan")
+            flag = "  over budget" if step * 1e3 > args.budget_ms else ""
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"{total:>7} {n_feeders:>7} {generated:>12.2f} {setup:>10.3f} {step * 1e3:>10.2f} "
+                  f"{step / total * 1e6:>7.1f} {sent:>9.0f} {rss:>13.1f} {growth:>6.2f}{flag}")
+            previous = (total, step)
+            shutil.rmtree(scenario.directory, ignore_errors=True)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
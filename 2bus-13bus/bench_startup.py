@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Startup benchmark: process start to helicsFederateEnterExecutingMode.
+
+Starts a local HELICS broker, launches 1bc_EV_Controller.py in a scratch
+copy of this directory and measures the wall time from spawning the process
+until it logs "Entered executing mode". Each run lets the controller finish a
+short day (one step per hour) so the broker shuts down cleanly.
+
+    python bench_startup.py                 # eager, default and headless profiles
+    python bench_startup.py -r 10
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER = "1bc_EV_Controller.py"
+MARKER = "Entered executing mode"
+# profile -> (extra environment, modules imported before the controller runs)
+# "eager" reproduces the old module-top imports of matplotlib and pandas.
+PROFILES = {
+    "eager": ({}, ["matplotlib.pyplot", "pandas"]),
+    "default": ({}, []),
+    "headless": ({"CONTROLLER_HEADLESS": "1"}, []),
+}
+
+
+def _scratch_dir():
+    work = tempfile.mkdtemp(prefix="ev_startup_")
+    for name in os.listdir(HERE):
+        if name.endswith(".py") or name == "1c_Control.json":
+            shutil.copy(os.path.join(HERE, name), work)
+    os.makedirs(os.path.join(work, "output"))
+    return work
+
+
+def time_startup(work, extra_env, preload):
+    """Seconds from Popen to the executing-mode log line."""
+    broker = subprocess.Popen(["helics_broker", "-f", "1", "--loglevel=error"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    env = dict(os.environ, CONTROLLER_INTERVAL_SEC="3600", MPLBACKEND="Agg", **extra_env)
+    start = time.perf_counter()
+    cmd = [sys.executable, CONTROLLER, "-c", "1c"]
+    if preload:
+        cmd = [sys.executable, "-c",
+               f"import runpy, sys; {'; '.join('import ' + m for m in preload)}; "
+               f"sys.argv = {[CONTROLLER, '-c', '1c']!r}; "
+               f"runpy.run_path({CONTROLLER!r}, run_name='__main__')"]
+    proc = subprocess.Popen(cmd, cwd=work, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = None
+    for line in proc.stderr:
+        if elapsed is None and MARKER in line:
+            elapsed = time.perf_counter() - start
+    proc.wait()
+    broker.wait(timeout=30)
+    if elapsed is None:
+        raise RuntimeError(f"{CONTROLLER} never reached executing mode (exit code {proc.returncode})")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='EV controller startup benchmark')
+    parser.add_argument('-r', '--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    work = _scratch_dir()
+    try:
+        print(f"{'profile':<10} {'median (s)':>10} {'min (s)':>8}")
+        for profile, (extra_env, preload) in PROFILES.items():
+            samples = [time_startup(work, extra_env, preload) for _ in range(args.repeats)]
+            print(f"{profile:<10} {np.median(samples):>10.3f} {min(samples):>8.3f}")
+    finally:
+        shutil.rmtree(work)
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the Python federates and post-processors, with stored baselines.
+
+Every case runs at several input sizes against mock_helics (no broker, no
+GridLAB-D) or synthetic files, and reports the best wall time of a few
+repeats:
+
+    control_step       one EVFleet step (read load, drain messages, send), per EV count
+    controller_script  1bc_EV_Controller.py run end to end under mock_helics
+                       with an echoing feeder peer, per number of control steps
+    message_decode     ev_messages decode of string and binary payloads, per message count
+    message_flood      EVFleet.read_messages of 6 EVs through the bounded EndpointIngestor
+                       (source check on), per flood messages queued on every endpoint
+    message_drain      the same with the drain-everything loop
+    result_write       TelemetryRecorder append + close + export_csv, per row count
+    gridpack_parse     gridpack_log_output.iter_solutions on a synthetic log, per MB
+    gpk_parse          gpk_boundary.parse_gpk on a synthetic gpk.csv, per MB
+    transmission_step  transmission_federate.TransmissionModel.step (three phase power flows)
+                       over a day of feeder load, per case size (9b3g.raw, 300-bus case)
+    switch_load_cold   switch_timeline.load_timelines without a gld_csv cache, per switch count
+    switch_load_warm   the same with a warm cache
+    glm_parse_cold     glm_parser.load_glm of a model including IEEE8500.glm n times, no cache
+    glm_parse_warm     the same from the .gld_cache pickle
+
+Results are compared with bench_baselines.json. A case is flagged as a
+regression when it takes more than --tolerance times its baseline, and the
+exit status is then 1, so the suite can gate changes on a plain Linux box.
+--save records the current numbers (and the host they came from) as the
+new baselines.
+
+    python bench_suite.py                       # all cases, compare with the baselines
+    python bench_suite.py --cases control_step gridpack_parse
+    python bench_suite.py --quick               # smallest size of every case
+    python bench_suite.py --save                # re-baseline on this machine
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import ev_messages
+import mock_helics as h
+from bench_control_step import _setup, fill, fleet_step
+from ev_fleet import EVFleet, primary_setpoint_table
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(HERE, "bench_baselines.json")
+DEFAULT_TOLERANCE = 1.5
+
+
+def _best(run, prepare=None, repeats=3):
+    """Best wall time (s) of run() over repeats, calling prepare() untimed."""
+    best = np.inf
+    for _ in range(repeats):
+        if prepare is not None:
+            prepare()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_control_step(n_evs, repeats):
+    endpoints, subs = _setup(n_evs)
+    names = [h.helicsEndpointGetName(ep).split('/')[-1] for ep in endpoints]
+    fleet = EVFleet(names, endpoints, subs, primary_setpoint_table(n_evs), 2.6e6, 4.8e6, api=h)
+    # Steps are short: time a batch of them per repeat
+    steps = max(1, 20000 // n_evs)
+
+    def run():
+        for _ in range(steps):
+            fill(endpoints)
+            fleet_step(fleet)
+
+    return _best(run, repeats=repeats) / steps
+
+
+def _feeder_peer(trace, trace_step, names):
+    """Feeder stand-in: publish the trace and echo every EV command back as its reading."""
+    fed = h.helicsCreateCombinationFederate("gld_hlc_conn", h.helicsCreateFederateInfo())
+    pubs = [h.helicsFederateRegisterGlobalPublication(fed, f"gld_hlc_conn/S{ph}", h.HELICS_DATA_TYPE_COMPLEX, "VA")
+            for ph in "abc"]
+    endpoints = []
+    for name in names:
+        ep = h.helicsFederateRegisterGlobalEndpoint(fed, f"gld_hlc_conn/{name}", "")
+        h.helicsEndpointSetDefaultDestination(ep, f"EV_Controller/{name}")
+        endpoints.append(ep)
+
+    def step(t):
+        per_phase = trace[min(int(t) // trace_step, len(trace) - 1)] / 3.0
+        for pub in pubs:
+            h.helicsPublicationPublishComplex(pub, per_phase, 0.0)
+        for ep in endpoints:
+            msg = None
+            while h.helicsEndpointHasMessage(ep):
+                msg = h.helicsEndpointGetMessage(ep)
+            h.helicsEndpointSendBytes(ep, h.helicsMessageGetBytes(msg) if msg is not None else b"200000.0+0.0j")
+
+    return step
+
+
+def bench_controller_script(steps, repeats):
+    """Per-step wall time of 1bc_EV_Controller.py with CONTROLLER_INTERVAL_SEC = 1 day / steps."""
+    interval = 24 * 3600 // steps
+    trace = np.loadtxt(os.path.join(HERE, "extracted_feeder_load.csv"), delimiter=",", skiprows=1, ndmin=1)
+    with open(os.path.join(HERE, "1c_Control.json")) as fh:
+        names = [ep["key"].split('/')[-1] for ep in json.load(fh)["endpoints"]]
+    work = tempfile.mkdtemp(prefix="bench_controller_")
+    shutil.copy(os.path.join(HERE, "1c_Control.json"), work)
+    os.makedirs(os.path.join(work, "output"))
+    env = {"CONTROLLER_HEADLESS": "1", "CONTROLLER_INTERVAL_SEC": str(interval)}
+    saved_env = {key: os.environ.get(key) for key in env}
+    saved_helics = sys.modules.get("helics")
+    saved_argv, cwd = sys.argv, os.getcwd()
+    main_logger = logging.getLogger("__main__")
+    saved_handlers = main_logger.handlers[:]
+
+    def prepare():
+        h.reset()
+        h.add_peer(_feeder_peer(trace, 1200, names), period=interval)
+
+    def run():
+        # The script adds a stderr handler to the __main__ logger on every run
+        with contextlib.redirect_stderr(io.StringIO()):
+            runpy.run_path(os.path.join(HERE, "1bc_EV_Controller.py"), run_name="__main__")
+        main_logger.handlers[:] = saved_handlers
+
+    try:
+        os.environ.update(env)
+        sys.modules["helics"] = h
+        sys.argv = ["1bc_EV_Controller.py", "-c", "1c"]
+        sys.path.insert(0, HERE)
+        os.chdir(work)
+        return _best(run, prepare, repeats) / steps
+    finally:
+        os.chdir(cwd)
+        sys.path.remove(HERE)
+        sys.argv = saved_argv
+        if saved_helics is None:
+            sys.modules.pop("helics", None)
+        else:
+            sys.modules["helics"] = saved_helics
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def bench_message_decode(n, repeats):
+    values = [complex(200000.0 + (i % 100) * 100.0, 0.0) for i in range(n)]
+    payloads = ([ev_messages.encode_string(v) for v in values[:n // 2]]
+                + [ev_messages.encode_binary(i, v) for i, v in enumerate(values[n // 2:])])
+    decode = ev_messages.decode
+
+    def run():
+        for p in payloads:
+            decode(p)
+
+    return _best(run, repeats=repeats)
+
+
+def _bench_message_flood(n, repeats, bounded):
+    endpoints, subs = _setup(6)
+    names = [h.helicsEndpointGetName(ep).split('/')[-1] for ep in endpoints]
+    fleet = EVFleet(names, endpoints, subs, primary_setpoint_table(6), 2.6e6, 4.8e6, api=h)
+    if bounded:
+        fleet.limit_ingestion(check_source=True)
+        # One "queued, taking 64" warning per endpoint is expected here
+        logging.getLogger("endpoint_ingest").setLevel(logging.ERROR)
+    flood = b"0.0+0.0j"
+    steps = 20
+
+    def run():
+        busy = 0.0
+        for k in range(steps):
+            for ep in endpoints:
+                # n attacker messages, then the feeder's reading
+                ep.queue.clear()
+                ep.head = 0
+                for _ in range(n):
+                    h.deliver(ep.name, flood, source="ev_attacker/EV")
+                h.deliver(ep.name, b"200000.0+0.0j", source=h.helicsEndpointGetDefaultDestination(ep))
+            start = time.perf_counter()
+            fleet.read_messages(now=k * 60)
+            busy += time.perf_counter() - start
+        return busy
+
+    return min(run() for _ in range(repeats)) / steps
+
+
+def bench_message_flood(n, repeats):
+    return _bench_message_flood(n, repeats, bounded=True)
+
+
+def bench_message_drain(n, repeats):
+    return _bench_message_flood(n, repeats, bounded=False)
+
+
+def bench_result_write(rows, repeats):
+    from telemetry_recorder import TelemetryRecorder, buffer_rows, export_csv
+
+    columns = [f"EV{i + 1}" for i in range(6)] + ["time", "feeder_load"]
+    data = np.random.default_rng(0).random((rows, len(columns))) * 1e3
+    work = tempfile.mkdtemp(prefix="bench_write_")
+    path = os.path.join(work, "out.tlm")
+
+    def run():
+        with TelemetryRecorder(path, columns, buffer_rows(rows * 60, 60)) as recorder:
+            for row in data:
+                recorder.append(row)
+        export_csv(path, os.path.join(work, "out.csv"))
+
+    try:
+        return _best(run, repeats=repeats)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def bench_gridpack_parse(megabytes, repeats):
+    from bench_gridpack_log import write_synthetic_log
+    from gridpack_log_output import iter_solutions
+
+    fd, path = tempfile.mkstemp(suffix=".log", prefix="gridpack_bench_")
+    os.close(fd)
+    try:
+        write_synthetic_log(path, int(megabytes * 1e6))
+        return _best(lambda: sum(1 for _ in iter_solutions(path)), repeats=repeats)
+    finally:
+        os.remove(path)
+
+
+def _write_gpk(path, nbytes):
+    """Synthetic gpk.csv of about nbytes: 5 s blocks of random boundary signals."""
+    rng = np.random.default_rng(0)
+    lines = [f"{prefix}, {q}a{s}: ({{:.6g}},{{:.6g}}) {q}b{s}: ({{:.6g}},{{:.6g}}) {q}c{s}: ({{:.6g}},{{:.6g}})\n"
+             for q, prefix in (("S", "S received from Gridlab-D"), ("V", "Updated Vv by GridPACK"))
+             for s in ("", "_2")]
+    block = "Time (s): {}\n" + "".join(lines) + "\n"
+    with open(path, "w") as out:
+        t = 0
+        while out.tell() < nbytes:
+            t += 5
+            out.write(block.format(t, *rng.normal(size=24).tolist()))
+        out.write("End of Cosimulation.\n")
+
+
+def bench_gpk_parse(megabytes, repeats):
+    from gpk_boundary import parse_gpk
+
+    fd, path = tempfile.mkstemp(suffix=".csv", prefix="gpk_bench_")
+    os.close(fd)
+    try:
+        _write_gpk(path, int(megabytes * 1e6))
+        return _best(lambda: parse_gpk(path), repeats=repeats)
+    finally:
+        os.remove(path)
+
+
+def bench_transmission_step(buses, repeats):
+    from surrogate_feeder import load_trace
+    from transmission_federate import TransmissionModel, read_raw
+
+    case = read_raw(os.path.join(HERE, {9: "9b3g.raw", 300: "300bus_v23_no0imp_pslf.raw"}[buses]))
+    _, load, _ = load_trace(os.path.join(HERE, "extracted_feeder_load.csv"))
+    # 5 s steps over the day's 20 min samples, linearly interpolated
+    load = np.interp(np.arange(0, 86400, 5), np.arange(len(load)) * 1200.0, load)
+    steps = [np.outer([1.0, 0.8], p * np.array([0.34, 0.33, 0.33])) * (1 + 0.33j) for p in load[:2000]]
+    state = {}
+
+    def prepare():
+        state["model"] = TransmissionModel(case, {"gld_hlc_conn": 2, "gld_hlc_conn_2": 3})
+
+    def run():
+        step = state["model"].step
+        for S in steps:
+            step(S)
+
+    return _best(run, prepare, repeats) / len(steps)
+
+
+def _bench_switch_load(n, repeats, warm):
+    from bench_switch_timeline import write_switches
+    from gld_csv import CACHE_DIR
+    from switch_timeline import load_timelines
+
+    work = tempfile.mkdtemp(prefix="bench_switch_")
+    cache = os.path.join(work, CACHE_DIR)
+    try:
+        paths = write_switches(work, n)
+        if warm:
+            load_timelines(paths, workers=1)
+            prepare = None
+        else:
+            def prepare():
+                shutil.rmtree(cache, ignore_errors=True)
+        return _best(lambda: load_timelines(paths, workers=1).summary(), prepare, repeats)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def bench_switch_load_cold(n, repeats):
+    return _bench_switch_load(n, repeats, warm=False)
+
+
+def bench_switch_load_warm(n, repeats):
+    return _bench_switch_load(n, repeats, warm=True)
+
+
+def _bench_glm_parse(n, repeats, warm):
+    from glm_parser import load_glm
+
+    work = tempfile.mkdtemp(prefix="bench_glm_")
+    try:
+        # Every copy is a separate file, so the warm load re-hashes n x 1.7 MB
+        for i in range(n):
+            shutil.copy(os.path.join(HERE, "IEEE8500.glm"), os.path.join(work, f"IEEE8500_{i}.glm"))
+        path = os.path.join(work, "model.glm")
+        with open(path, "w") as fh:
+            fh.writelines(f'#include "IEEE8500_{i}.glm"\n' for i in range(n))
+        if warm:
+            load_glm(path)
+        return _best(lambda: load_glm(path, cache=warm), repeats=repeats)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def bench_glm_parse_cold(n, repeats):
+    return _bench_glm_parse(n, repeats, warm=False)
+
+
+def bench_glm_parse_warm(n, repeats):
+    return _bench_glm_parse(n, repeats, warm=True)
+
+
+# name: (function, sizes, size unit, reported unit)
+CASES = {
+    "control_step": (bench_control_step, [6, 600, 6000], "EVs", "s/step"),
+    "controller_script": (bench_controller_script, [288, 1440], "steps", "s/step"),
+    "message_decode": (bench_message_decode, [1000, 10000, 100000], "messages", "s"),
+    "message_flood": (bench_message_flood, [0, 100, 10000], "messages/endpoint", "s/step"),
+    "message_drain": (bench_message_drain, [0, 100, 10000], "messages/endpoint", "s/step"),
+    "result_write": (bench_result_write, [1440, 14400, 144000], "rows", "s"),
+    "gridpack_parse": (bench_gridpack_parse, [4, 32, 128], "MB", "s"),
+    "gpk_parse": (bench_gpk_parse, [4, 32], "MB", "s"),
+    "transmission_step": (bench_transmission_step, [9, 300], "buses", "s/step"),
+    "switch_load_cold": (bench_switch_load_cold, [10, 100], "switches", "s"),
+    "switch_load_warm": (bench_switch_load_warm, [10, 100], "switches", "s"),
+    "glm_parse_cold": (bench_glm_parse_cold, [1, 4], "x IEEE8500", "s"),
+    "glm_parse_warm": (bench_glm_parse_warm, [1, 4], "x IEEE8500", "s"),
+}
+
+
+def host_info():
+    return {"machine": platform.machine(), "processor": platform.processor(), "cpus": os.cpu_count(),
+            "python": platform.python_version(), "numpy": np.__version__, "system": platform.system()}
+
+
+def load_baselines(path=BASELINE_PATH):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {"host": None, "cases": {}}
+
+
+def save_baselines(results, path=BASELINE_PATH):
+    """Merge results ({case: {size: seconds}}) into the baseline file."""
+    baselines = load_baselines(path)
+    baselines["host"] = host_info()
+    for case, sizes in results.items():
+        baselines["cases"].setdefault(case, {}).update(sizes)
+    with open(path, "w") as fh:
+        json.dump(baselines, fh, indent=2, sort_keys=True)
+        fh.write("\n")
+
+
+def run(cases, quick=False, repeats=3, baselines=None, tolerance=DEFAULT_TOLERANCE):
+    """Run cases; returns ({case: {size: seconds}}, list of regressions)."""
+    baselines = baselines or {"cases": {}}
+    results, regressions = {}, []
+    print(f"{'case':<18} {'size':>14} {'time':>12} {'baseline':>12} {'ratio':>6}")
+    for name in cases:
+        fn, sizes, size_unit, unit = CASES[name]
+        results[name] = {}
+        for size in sizes[:1] if quick else sizes:
+            seconds = fn(size, repeats)
+            results[name][str(size)] = seconds
+            base = baselines["cases"].get(name, {}).get(str(size))
+            ratio = seconds / base if base else np.nan
+            flag = ""
+            if base and ratio > tolerance:
+                flag = "  REGRESSION"
+                regressions.append((name, size, ratio))
+            print(f"{name:<18} {f'{size} {size_unit}':>14} {_fmt(seconds, unit):>12} "
+                  f"{_fmt(base, unit) if base else '-':>12} {ratio:>6.2f}{flag}")
+    return results, regressions
+
+
+def _fmt(seconds, unit):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us" + unit[1:]
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms" + unit[1:]
+    return f"{seconds:.2f} s" + unit[1:]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark suite with stored baselines')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--quick', action='store_true', help='smallest size of every case only')
+    parser.add_argument('-r', '--repeats', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='flag cases slower than tolerance x baseline')
+    parser.add_argument('--baselines', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true', help='store the results as the new baselines')
+    args = parser.parse_args()
+
+    baselines = load_baselines(args.baselines)
+    if baselines.get("host") and baselines["host"] != host_info():
+        print(f"note: baselines were recorded on {baselines['host']}, ratios compare different machines")
+    results, regressions = run(args.cases, args.quick, args.repeats, baselines, args.tolerance)
+    if args.save:
+        save_baselines(results, args.baselines)
+        print(f"baselines saved to {args.baselines}")
+    elif regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.2f}x the baseline")
+        sys.exit(1)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Feeder-scale benchmark for switch_timeline.py.
+
+Writes n synthetic switch recorders (one day at 1-minute resolution, random
+OPEN/CLOSED toggles, grid/storage pairs per EV so islanding occurs) and
+compares the old per-file pandas loader of switch_status_EV*_plotting.py
+with load_timelines() on a cold and on a warm gld_csv cache.
+
+    python bench_switch_timeline.py                 # 100 and 1000 switches
+    python bench_switch_timeline.py -n 5000 --workers 8
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from switch_timeline import load_timelines
+
+HEADER = ("# file...... {name}\n# date...... (synthetic)\n# user...... (null)\n# host...... (null)\n"
+          "# target.... switch {k}\n# trigger... (none)\n# interval.. 60\n# limit..... 0\n# timestamp,status\n")
+STAMPS = [f"2013-08-28 {m // 60:02d}:{m % 60:02d}:00 PST" for m in range(24 * 60)]
+
+
+def legacy_load(path):
+    """load_switch_csv() of the old per-EV plotting scripts, without the print."""
+    import pandas as pd
+    df = pd.read_csv(path, comment='#')
+    # The "PST" suffix sends to_datetime to per-element dateutil parsing
+    ts_col, status_col = df.columns[:2]
+    df = df.rename(columns={ts_col: 'timestamp', status_col: 'status'})
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True, errors='coerce')
+    df['status'] = df['status'].map({'OPEN': 0, 'CLOSED': 1})
+    return df
+
+
+def write_switches(directory, n, seed=0):
+    """n recorders named sw_status_l<k>_EV<j>.csv / sw_status_stor_EV<j>.csv."""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for k in range(n):
+        ev = k // 2 + 1
+        name = f"sw_status_stor_EV{ev}.csv" if k % 2 else f"sw_status_l{k}_EV{ev}.csv"
+        # A handful of toggles per day
+        state = np.cumsum(rng.random(len(STAMPS)) < 0.005) % 2
+        if k % 2:
+            state = 1 - state
+        path = os.path.join(directory, name)
+        with open(path, "w") as fh:
+            fh.write(HEADER.format(name=name, k=k))
+            fh.write("".join(f"{s},{'CLOSED' if v else 'OPEN'}\n" for s, v in zip(STAMPS, state)))
+        paths.append(path)
+    return paths
+
+
+def run(sizes, workers, legacy=True):
+    print(f"{'switches':>8} {'legacy (s)':>10} {'cold (s)':>9} {'warm (s)':>9} {'islanded EVs':>12}")
+    for n in sizes:
+        work = tempfile.mkdtemp(prefix="sw_bench_")
+        try:
+            paths = write_switches(work, n)
+            t_legacy = np.nan
+            if legacy:
+                start = time.perf_counter()
+                for p in paths:
+                    legacy_load(p)
+                t_legacy = time.perf_counter() - start
+            timings = []
+            for _ in range(2):
+                start = time.perf_counter()
+                timelines = load_timelines(paths, workers)
+                summary = timelines.summary()
+                islanding = timelines.islanding()
+                timings.append(time.perf_counter() - start)
+            islanded = sum(1 for iv in islanding.values() if len(iv))
+            assert len(summary["runs"]) == n
+            print(f"{n:>8} {t_legacy:>10.2f} {timings[0]:>9.2f} {timings[1]:>9.2f} {islanded:>12}")
+        finally:
+            shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Switch timeline engine benchmark')
+    parser.add_argument('-n', '--sizes', nargs='+', type=int, default=[100, 1000])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-legacy', action='store_true', help='skip the slow pandas loader')
+    args = parser.parse_args()
+    run(args.sizes, args.workers, legacy=not args.no_legacy)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental checkpoints of the EV controller state, and resume.
+
+The controller hands every telemetry row to a Checkpointer (a copy into a
+list) and, every `every` simulation seconds, queues a checkpoint: the rows
+since the previous checkpoint plus a snapshot of the state that lives only
+in memory (granted time, last commands, EV readings, counters). A
+background thread appends it to the checkpoint file as one record, so the
+time loop does no I/O. Each record only holds what is new, so the file grows
+with the run, not with the number of checkpoints.
+
+File layout (.ckpt, append-only):
+    b"CKP1" | uint32 header length | JSON header {"names", "columns", "arrays", ...}
+    then repeated records:
+        uint32 state length | uint64 nrows | JSON state
+        | float64[n_evs] per array in header["arrays"]
+        | float64[ncols, nrows] telemetry rows (column-major) | uint32 CRC-32 of the record
+
+A record cut short or corrupted by a crash ends the file: load_checkpoint()
+returns the last complete record with all telemetry up to it, and resuming
+truncates the file there before appending again.
+
+Resume (CONTROLLER_RESUME=1 in 1bc_EV_Controller.py) restores the telemetry
+and state, requests the checkpoint time in one step (fast-forward; no
+control, no messages, no recording before it) and continues from the next
+control step. Pair it with surrogate_feeder.py replaying the run's
+recording (--csv below) to get back to a late-run event in seconds.
+
+Commands still in flight at the checkpoint are not part of its state. With
+the delay filter of 1c_Control.json (EVfilters, 3600 s on the controller
+endpoints), the commands sent in the last delay before the checkpoint never
+reach the restarted feeder. The resumed run's EV readings and feeder load
+therefore differ from the uninterrupted run for up to one filter delay
+after the checkpoint. After that they match again. Without the filter, only
+the EV readings of the first resumed step differ.
+
+    python checkpoint.py 1c_Controller.ckpt                       # list the records
+    python checkpoint.py 1c_Controller.ckpt --csv resumed_trace.csv
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CKP1"
+_RECORD = struct.Struct("<IQ")
+_CRC = struct.Struct("<I")
+# Per-EV arrays stored in every record
+STATE_ARRAYS = ("setpoints", "last_command", "readings")
+
+# Last complete record: time (s), state dict, {array: (n_evs,)}, every row up
+# to it (ncols, nrows), the file header, record count and valid file length
+Checkpoint = namedtuple("Checkpoint", ["time", "state", "arrays", "rows", "header", "records", "length"])
+
+_STOP = object()
+
+
+def _read_header(fh):
+    if fh.read(4) != MAGIC:
+        raise ValueError(f"{fh.name} is not a controller checkpoint file")
+    (length,) = struct.unpack("<I", fh.read(4))
+    return json.loads(fh.read(length))
+
+
+def iter_records(path):
+    """Yield (header, state, arrays, rows, end offset) for every complete record of a checkpoint file."""
+    with open(path, "rb") as fh:
+        header = _read_header(fh)
+        n = len(header["names"])
+        ncols = len(header["columns"])
+        k = len(header["arrays"])
+        while True:
+            prefix = fh.read(_RECORD.size)
+            if len(prefix) < _RECORD.size:
+                return
+            state_len, nrows = _RECORD.unpack(prefix)
+            size = state_len + 8 * (k * n + ncols * nrows)
+            body = fh.read(size)
+            tail = fh.read(_CRC.size)
+            if len(body) < size or len(tail) < _CRC.size:
+                logger.warning(f"{path}: ignoring truncated final checkpoint")
+                return
+            if zlib.crc32(prefix + body) != _CRC.unpack(tail)[0]:
+                logger.warning(f"{path}: checkpoint at offset {fh.tell() - size} is corrupt, ignoring the rest")
+                return
+            state = json.loads(body[:state_len])
+            values = np.frombuffer(body, dtype=float, offset=state_len)
+            arrays = {name: values[i * n:(i + 1) * n] for i, name in enumerate(header["arrays"])}
+            rows = values[k * n:].reshape(ncols, nrows)
+            yield header, state, arrays, rows, fh.tell()
+
+
+def load_checkpoint(path):
+    """The last complete Checkpoint of path, or None when it has no record."""
+    last = None
+    blocks = []
+    count = 0
+    for header, state, arrays, rows, end in iter_records(path):
+        blocks.append(rows)
+        last = (header, state, arrays, end)
+        count += 1
+    if last is None:
+        return None
+    header, state, arrays, end = last
+    return Checkpoint(state["time"], state, arrays, np.concatenate(blocks, axis=1), header, count, end)
+
+
+class Checkpointer:
+    """
+    Append-only checkpoint writer with a background thread.
+
+    names are the EV names (order of the per-EV state arrays), columns the
+    telemetry columns of the rows passed to record(). every is the
+    checkpoint interval in simulation seconds. With resume=True an existing
+    file is kept up to its last complete record and appended to.
+    """
+
+    def __init__(self, path, names, columns, every=3600, meta=None, resume=False):
+        self.path = path
+        self.names = list(names)
+        self.columns = list(columns)
+        self.every = every
+        self._rows = []
+        self.last_time = None
+        self.checkpoints = 0
+        self.rows = 0
+        header = dict(meta or {}, names=self.names, columns=self.columns, arrays=list(STATE_ARRAYS))
+        previous = load_checkpoint(path) if resume and os.path.exists(path) else None
+        if previous is not None:
+            if previous.header["names"] != self.names or previous.header["columns"] != self.columns:
+                raise ValueError(f"{path} was written for other EVs or columns")
+            self._fh = open(path, "r+b")
+            self._fh.truncate(previous.length)
+            self._fh.seek(previous.length)
+            self.last_time = previous.time
+            self.checkpoints = previous.records
+            self.rows = previous.rows.shape[1]
+        else:
+            data = json.dumps(header).encode()
+            self._fh = open(path, "wb")
+            self._fh.write(MAGIC + struct.pack("<I", len(data)) + data)
+            self._fh.flush()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="checkpoint", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, row):
+        """Keep one telemetry row for the next checkpoint (row is copied)."""
+        self._rows.append(np.array(row, dtype=float))
+
+    def due(self, t):
+        """True when at least every seconds have passed since the last checkpoint."""
+        return self.last_time is None or t - self.last_time >= self.every
+
+    def checkpoint(self, t, setpoints, last_command, readings, **state):
+        """
+        Queue a checkpoint at time t with the rows recorded since the last one.
+
+        setpoints, last_command and readings are per-EV arrays (copied);
+        state holds any other JSON-serialisable values to restore.
+        """
+        arrays = [np.array(a, dtype=float).reshape(len(self.names)) for a in (setpoints, last_command, readings)]
+        rows, self._rows = self._rows, []
+        self._queue.put((dict(state, time=t), arrays, rows))
+        self.last_time = t
+        self.checkpoints += 1
+        self.rows += len(rows)
+
+    def close(self):
+        """Write what is queued, stop the writer thread and close the file."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        logger.info(f"Checkpoints: {self.checkpoints} written to {self.path} ({self.rows} rows)")
+
+    # -- writer thread ------------------------------------------------------
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                self._write(*item)
+        finally:
+            self._fh.close()
+
+    def _write(self, state, arrays, rows):
+        data = json.dumps(state, default=float).encode()
+        block = np.stack(rows, axis=1) if rows else np.empty((len(self.columns), 0))
+        record = (_RECORD.pack(len(data), block.shape[1]) + data
+                  + b"".join(a.tobytes() for a in arrays) + np.ascontiguousarray(block).tobytes())
+        self._fh.write(record + _CRC.pack(zlib.crc32(record)))
+        self._fh.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect a controller checkpoint file')
+    parser.add_argument('path')
+    parser.add_argument('--csv', help='write the checkpointed telemetry as CSV (e.g. as a surrogate_feeder trace)')
+    args = parser.parse_args()
+
+    total = 0
+    for header, state, arrays, rows, end in iter_records(args.path):
+        total += rows.shape[1]
+        extra = {k: v for k, v in state.items() if k != "time"}
+        print(f"t={state['time']:>8g} s  +{rows.shape[1]:>5} rows ({total} total)  {end:>10} bytes  {extra}")
+    ckpt = load_checkpoint(args.path)
+    if ckpt is None:
+        print("no complete checkpoint")
+    elif args.csv:
+        columns = ckpt.header["columns"]
+        with open(args.csv, "w") as out:
+            out.write(",".join(columns) + "\n")
+            for row in ckpt.rows.T.tolist():
+                out.write(",".join("" if v != v else repr(v) for v in row) + "\n")
+        print(f"{ckpt.rows.shape[1]} rows up to t={ckpt.time:g} s written to {args.csv}")
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Look-ahead dispatch planning for the EV controller.
+
+Instead of picking a branch from the latest feeder load every step, the
+planner solves the whole day at once from
+
+- a forecast of the feeder load without the EVs: the load-shape player
+  (include/players/load_shape_player.player) scaled as a * shape + b, with a
+  and b fitted to a recorded trace;
+- the charging demand of every EV: include/players/evN_load_schedule.player,
+  capped at the EV's low-load setpoint of the controller table;
+- the feeder limits.
+
+The day is cut into blocks (default 15 min). In each block the EVs get their
+demand, scaled down in proportion wherever forecast + demand would exceed
+the upper limit minus a margin, using the block's largest forecast. Setpoints
+are rounded down to a quantum, so a plan row only changes at block edges and
+only where the demand or the headroom really moved. The solve is a few array
+operations over (blocks, EVs).
+
+At run time DispatchPlan.setpoints() is a binary search for the block plus a
+cheap correction: the measured load minus what the EVs draw is compared with
+the forecast, the error is smoothed into a bias, and only if the corrected
+headroom no longer covers the planned total are the block's setpoints scaled
+down. Commands go out send-on-change, so an EV is only messaged when its
+planned setpoint moves.
+
+    python dispatch_planner.py                          # plan, summary, save dispatch_plan.npz
+    python dispatch_planner.py --block 1800 --compare   # plus reactive vs planned on the surrogate
+    CONTROLLER_PLAN=dispatch_plan.npz python 1bc_EV_Controller.py
+"""
+import argparse
+import bisect
+import json
+import logging
+import os
+import re
+
+import numpy as np
+
+from ev_fleet import LOW_LOAD, primary_setpoint_table
+from schedule_tables import DAY, load_schedule
+
+logger = logging.getLogger(__name__)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PLAYERS = os.path.join(HERE, "include", "players")
+LOAD_SHAPE = os.path.join(PLAYERS, "load_shape_player.player")
+DEFAULT_PLAN = "dispatch_plan.npz"
+DEFAULT_TRACE = os.path.join(HERE, "extracted_feeder_load.csv")
+PLAN_VERSION = 1
+
+
+def ev_schedule_paths(names, directory=PLAYERS):
+    """{EV name: evN_load_schedule.player} for the names that have one."""
+    out = {}
+    for name in names:
+        m = re.fullmatch(r"EV(\d+)", name)
+        path = os.path.join(directory, f"ev{m.group(1)}_load_schedule.player") if m else None
+        if path and os.path.exists(path):
+            out[name] = path
+    return out
+
+
+def fit_load_forecast(shape, times, load, ev_power=0.0):
+    """
+    (a, b) of load - ev_power ~ a * shape(times) + b, by least squares.
+
+    load is a recorded feeder load (W) at times (s); ev_power is what the
+    EVs drew in that recording (scalar or array, W).
+    """
+    x = shape.at(times, 0)
+    A = np.column_stack([x, np.ones_like(x)])
+    (a, b), *_ = np.linalg.lstsq(A, np.asarray(load, dtype=float) - ev_power, rcond=None)
+    return float(a), float(b)
+
+
+def _blocks(values, per_block, reduce):
+    """reduce() over consecutive blocks of per_block rows (last block may be short)."""
+    n = len(values)
+    starts = np.arange(0, n, per_block)
+    return reduce.reduceat(values, starts, axis=0)
+
+
+def solve(forecast, demand, upper, margin=0.0, quantum=1000.0):
+    """
+    Setpoints (blocks, EVs) W for non-EV load forecast (blocks,) and EV demand (blocks, EVs).
+
+    Demand is served in full where forecast + demand fits under upper -
+    margin, and scaled down by the same factor for every EV where it does not
+    (to zero when the forecast alone is over). Results are rounded down to
+    quantum W.
+    """
+    total = demand.sum(axis=1)
+    headroom = upper - margin - forecast
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(total > 0, np.clip(headroom / total, 0.0, 1.0), 1.0)
+    plan = demand * scale[:, None]
+    if quantum:
+        plan = np.floor(plan / quantum) * quantum
+    return plan
+
+
+class DispatchPlan:
+    """
+    Per-EV setpoint plan over the day plus the run-time correction.
+
+    times (blocks,) are block start times (s), setpoints (blocks, EVs) W,
+    forecast (blocks,) the non-EV load the plan was solved for (W).
+    """
+
+    def __init__(self, names, times, setpoints, forecast, upper, margin=0.0, quantum=1000.0, bias_gain=0.3,
+                 meta=None):
+        self.names = list(names)
+        self.times = np.asarray(times, dtype=float)
+        self.setpoints_table = np.asarray(setpoints, dtype=float)
+        self.forecast = np.asarray(forecast, dtype=float)
+        if self.setpoints_table.shape != (len(self.times), len(self.names)):
+            raise ValueError(f"plan shape {self.setpoints_table.shape} does not match "
+                             f"{len(self.times)} blocks x {len(self.names)} EVs")
+        self.upper = upper
+        self.margin = margin
+        self.quantum = quantum
+        # Weight of the newest forecast error in the smoothed bias (0 = no correction)
+        self.bias_gain = bias_gain
+        self.bias = 0.0
+        self.meta = meta or {}
+        self._planned_total = self.setpoints_table.sum(axis=1)
+        # Plain list for bisect: a scalar lookup without numpy call overhead
+        self._time_list = self.times.tolist()
+        self.corrections = 0
+
+    def __len__(self):
+        return len(self.times)
+
+    def index(self, t):
+        """Block in force at t (s), wrapping over the day."""
+        return max(bisect.bisect_right(self._time_list, t % DAY) - 1, 0)
+
+    def observe(self, k, measured_non_ev):
+        """Fold the forecast error of block k into the bias."""
+        error = measured_non_ev - self.forecast[k]
+        self.bias += self.bias_gain * (error - self.bias)
+        return self.bias
+
+    def setpoints(self, t, load=None, ev_power=None):
+        """
+        (block, setpoints W) for time t.
+
+        With the measured feeder load (W) and the EV power in it (W), the
+        bias is updated and the block's setpoints are scaled down if the
+        corrected headroom no longer covers them. Returns the plan row itself
+        (not a copy) when no correction is needed.
+        """
+        k = self.index(t)
+        row = self.setpoints_table[k]
+        if load is None or not self.bias_gain:
+            return k, row
+        self.observe(k, load - (ev_power if ev_power is not None else 0.0))
+        headroom = self.upper - self.margin - (self.forecast[k] + self.bias)
+        planned = self._planned_total[k]
+        if planned <= headroom:
+            return k, row
+        self.corrections += 1
+        scale = max(headroom, 0.0) / planned
+        row = row * scale
+        if self.quantum:
+            row = np.floor(row / self.quantum) * self.quantum
+        return k, row
+
+    def for_names(self, names):
+        """The plan with its EV columns in the order of names (e.g. a controller's endpoint order)."""
+        names = list(names)
+        missing = sorted(set(names) - set(self.names))
+        if missing:
+            raise ValueError(f"plan has no setpoints for {missing}")
+        cols = [self.names.index(n) for n in names]
+        return DispatchPlan(names, self.times, self.setpoints_table[:, cols], self.forecast, self.upper, self.margin,
+                            self.quantum, self.bias_gain, meta=self.meta)
+
+    def changes(self):
+        """Setpoint changes per EV over the day (the commands a send-on-change dispatcher sends)."""
+        table = self.setpoints_table
+        return 1 + np.count_nonzero(table[1:] != table[:-1], axis=0)
+
+    def save(self, path=DEFAULT_PLAN):
+        meta = dict(self.meta, version=PLAN_VERSION, names=self.names, upper=self.upper, margin=self.margin,
+                    quantum=self.quantum, bias_gain=self.bias_gain)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, __header__=np.array(json.dumps(meta)), times=self.times,
+                 setpoints=self.setpoints_table, forecast=self.forecast)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PLAN):
+        with np.load(path, allow_pickle=False) as npz:
+            meta = json.loads(str(npz["__header__"]))
+            if meta.get("version") != PLAN_VERSION:
+                raise ValueError(f"{path}: plan version {meta.get('version')}, expected {PLAN_VERSION}")
+            return cls(meta["names"], npz["times"], npz["setpoints"], npz["forecast"], meta["upper"],
+                       meta["margin"], meta["quantum"], meta["bias_gain"], meta=meta)
+
+
+def build_plan(names, upper, rated=None, forecast=(1.0, 0.0), load_shape=LOAD_SHAPE, schedules=None,
+               resolution=60, block=900, margin=100e3, quantum=1000.0, bias_gain=0.3):
+    """
+    DispatchPlan for EVs names over one day.
+
+    rated (EVs,) caps the demand (default: the low-load row of the primary
+    setpoint table). forecast is (a, b) of the non-EV load a * shape + b.
+    schedules maps EV names to demand players (default ev_schedule_paths);
+    EVs without one demand their rated power all day. The forecast is
+    sampled every resolution seconds and each block plans for its maximum.
+    """
+    names = list(names)
+    if rated is None:
+        rated = primary_setpoint_table(len(names))[LOW_LOAD]
+    rated = np.asarray(rated, dtype=float)
+    if schedules is None:
+        schedules = ev_schedule_paths(names)
+    fine = np.arange(0, DAY, resolution, dtype=float)
+    shape = load_schedule(load_shape)
+    a, b = forecast
+    # Before the first player line the shape holds its first value
+    base = a * np.nan_to_num(shape.at(fine, 0), nan=shape.values[0, 0]) + b
+    demand = np.tile(rated, (len(fine), 1))
+    for i, name in enumerate(names):
+        if name in schedules:
+            demand[:, i] = np.minimum(np.nan_to_num(load_schedule(schedules[name]).at(fine, 0)), rated[i])
+    per_block = max(int(block // resolution), 1)
+    forecast_blocks = _blocks(base, per_block, np.maximum)
+    # Demand held over a block: its largest value, so charging is not cut short
+    demand_blocks = _blocks(demand, per_block, np.maximum)
+    times = fine[::per_block]
+    plan = solve(forecast_blocks, demand_blocks, upper, margin, quantum)
+    meta = {"forecast": [a, b], "load_shape": os.path.relpath(load_shape, HERE), "block": block,
+            "resolution": resolution, "schedules": {n: os.path.relpath(p, HERE) for n, p in schedules.items()}}
+    return DispatchPlan(names, times, plan, forecast_blocks, upper, margin, quantum, bias_gain, meta=meta)
+
+
+def trace_forecast(trace_path=DEFAULT_TRACE, n_evs=6, ev_power=200000.0):
+    """(a, b) of the non-EV load forecast fitted to a recorded trace with n_evs EVs at ev_power W each."""
+    from surrogate_feeder import load_trace, DEFAULT_CONFIG
+
+    times, load, _ = load_trace(trace_path)
+    if times is None:
+        times = np.arange(len(load)) * float(DEFAULT_CONFIG["trace_interval"])
+    return fit_load_forecast(load_schedule(LOAD_SHAPE), times, load, n_evs * ev_power)
+
+
+def plan_for_fleet(fleet, path="auto", **kwargs):
+    """
+    The saved plan at path (columns in the fleet's EV order), or for "auto" a
+    new plan with the fleet's limits and setpoint table, forecast from DEFAULT_TRACE.
+    """
+    if path != "auto":
+        return DispatchPlan.load(path).for_names(fleet.names)
+    kwargs.setdefault("rated", fleet.table[LOW_LOAD])
+    if "forecast" not in kwargs:
+        kwargs["forecast"] = trace_forecast(n_evs=len(fleet))
+    return build_plan(fleet.names, fleet.upper, **kwargs)
+
+
+def _compare(plan, lower, upper, interval):
+    """Reactive vs planned control of the surrogate feeder; prints steps, commands and time."""
+    from surrogate_feeder import load_config, run_inprocess
+
+    config = load_config("surrogate_feeder.json" if os.path.exists("surrogate_feeder.json") else None)
+    for label, kwargs in (("reactive", {}), ("planned", {"plan": plan})):
+        result, wall = run_inprocess(config, interval, lower, upper, broker_name=f"plan_{label}_{os.getpid()}",
+                                     **kwargs)
+        load = result["load"]
+        print(f"{label:>9}: {len(load)} steps, {int(result['sent'].sum())} commands, "
+              f"controller {result['control_s'] / len(load) * 1e6:.1f} us/step, wall {wall:.2f} s; "
+              f"load {load.min() / 1e6:.2f} .. {load.max() / 1e6:.2f} MW, "
+              f"{int(np.count_nonzero(load >= upper))} steps >= upper")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Look-ahead EV dispatch plan for one day')
+    parser.add_argument('--evs', nargs='+', default=[f"EV{i}" for i in range(1, 7)])
+    parser.add_argument('--upper', type=float, default=4.8e6, help='feeder upper limit (W)')
+    parser.add_argument('--lower', type=float, default=2.6e6, help='feeder lower limit (W), for --compare')
+    parser.add_argument('--margin', type=float, default=100e3, help='planning margin below the upper limit (W)')
+    parser.add_argument('--block', type=int, default=900, help='plan block length (s)')
+    parser.add_argument('--quantum', type=float, default=1000.0, help='setpoint rounding (W)')
+    parser.add_argument('--trace', default='extracted_feeder_load.csv', help='recorded load to fit the forecast to')
+    parser.add_argument('--trace-ev-W', type=float, default=200000.0, help='per-EV power included in the trace')
+    parser.add_argument('-o', '--output', default=DEFAULT_PLAN)
+    parser.add_argument('--compare', action='store_true', help='run reactive and planned control on the surrogate')
+    parser.add_argument('--interval', type=int, default=60, help='controller interval for --compare (s)')
+    args = parser.parse_args()
+
+    fit = trace_forecast(args.trace, len(args.evs), args.trace_ev_W)
+    plan = build_plan(args.evs, args.upper, forecast=fit, block=args.block, margin=args.margin,
+                      quantum=args.quantum)
+    plan.save(args.output)
+    changes = plan.changes()
+    print(f"forecast = {fit[0] / 1e6:.3f} MW x shape + {fit[1] / 1e6:.3f} MW; "
+          f"{len(plan)} blocks of {args.block} s x {len(plan.names)} EVs -> {args.output}")
+    print(f"forecast peak {plan.forecast.max() / 1e6:.2f} MW, planned EV peak "
+          f"{plan.setpoints_table.sum(axis=1).max() / 1e6:.3f} MW, "
+          f"energy {plan.setpoints_table.sum() * args.block / 3.6e9:.2f} MWh")
+    print("setpoint changes per EV: " + ", ".join(f"{n} {c}" for n, c in zip(plan.names, changes.tolist())))
+    if args.compare:
+        _compare(plan, args.lower, args.upper, args.interval)
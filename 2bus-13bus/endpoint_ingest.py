@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Flood-resistant ingestion of the EV reading messages.
+
+EVFleet.read_messages() used to drain every endpoint with
+helicsEndpointHasMessage/helicsEndpointGetMessage until empty and keep the
+last message: one or two Python-to-C calls per message, so any federate
+sending to EV_Controller/EVn (such as the attacker in
+gpk-gld-cosim-with-mcp.json) sets the controller's step time.
+
+EndpointIngestor bounds the work per endpoint and step instead:
+
+- helicsEndpointPendingMessageCount once per endpoint; idle endpoints cost
+  nothing more.
+- At most `queue_limit` messages are taken per step, and with a rate limit
+  (messages per simulated second, bucket of `burst`) at most what the bucket
+  holds. Whatever is left stays queued and is reported as backlog.
+- Only one message per endpoint is decoded: the newest one, or the newest
+  from an allowed source when sources are set (by default the endpoint's
+  default destination, i.e. gld_hlc_conn/EVn for the controller). Messages
+  from any other source are counted as foreign and dropped.
+- HELICS hands messages out oldest first, so when the limits leave messages
+  queued the newest taken is not the newest received. Such a reading is
+  stale: it is kept out of the readings (NaN, as for a step without a
+  message), counted, and its message time recorded in stale_time. The
+  endpoint's reading returns once a step takes everything queued.
+
+HELICS 3.6 cannot discard queued messages (helicsEndpointClearMessages and
+helicsFederateClearMessages are no-ops), and messages with the same time are
+not queued in arrival order. A sustained flood above the limits therefore
+grows the backlog inside HELICS and can hold back the feeder's reading, but
+it no longer grows the controller's step time. The readings only feed the
+telemetry; control uses the feeder load inputs, which messages cannot delay.
+Per-endpoint counters (pending, taken, accepted, foreign, limited steps,
+stale readings, backlog) are kept for the report.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_LIMIT = 64
+
+
+class EndpointIngestor:
+    """
+    Bounded "newest message wins" reader for a set of endpoints.
+
+    decode maps a payload to the value stored in the readings (e.g.
+    MessageCodec.decode_real); scale multiplies it (1e-3 for W -> kW).
+    sources is a list with an allowed source name (or None for any) per
+    endpoint; rate is in messages per simulated second per endpoint (None =
+    unlimited) with a bucket of burst messages.
+    """
+
+    def __init__(self, endpoints, names, decode, scale=1.0, queue_limit=DEFAULT_QUEUE_LIMIT, rate=None,
+                 burst=None, sources=None, api=None):
+        if api is None:
+            import helics as api
+        self.h = api
+        self.endpoints = list(endpoints)
+        self.names = list(names)
+        n = len(self.endpoints)
+        self.decode = decode
+        self.scale = scale
+        self.queue_limit = int(queue_limit) if queue_limit else None
+        self.rate = rate or None
+        self.burst = float(burst if burst is not None else max(self.queue_limit or 1, 1))
+        self.sources = list(sources) if sources is not None else [None] * n
+        if len(self.sources) != n:
+            raise ValueError(f"{len(self.sources)} sources for {n} endpoints")
+        self.tokens = [self.burst] * n
+        self._last_time = None
+        # Per-endpoint counters; plain lists, as numpy scalar updates would
+        # cost more than the HELICS calls they count
+        self.pending = [0] * n          # messages found queued, summed over steps
+        self.taken = [0] * n            # messages retrieved
+        self.accepted = [0] * n         # readings decoded and stored
+        self.foreign = [0] * n          # retrieved but from another source
+        self.errors = [0] * n           # undecodable payloads
+        self.limited = [0] * n          # steps that left messages queued
+        self.stale = [0] * n            # allowed readings dropped as older than the queue
+        self.stale_time = [np.nan] * n  # message time of the last of those
+        self.backlog = [0] * n          # left queued after the last step
+        self.max_pending = [0] * n
+        self._flooded = set()
+
+    @classmethod
+    def for_fleet(cls, fleet, queue_limit=DEFAULT_QUEUE_LIMIT, rate=None, burst=None, check_source=False):
+        """Ingestor for an EVFleet; check_source allows only each endpoint's default destination."""
+        h = fleet.h
+        sources = None
+        if check_source:
+            sources = [h.helicsEndpointGetDefaultDestination(ep) or None for ep in fleet._endpoint_list]
+        return cls(fleet._endpoint_list, fleet.names, fleet.codec.decode_real, 1e-3, queue_limit, rate, burst,
+                   sources, api=h)
+
+    def _budgets(self, now):
+        """Messages each endpoint may take this step."""
+        if self.rate is None:
+            return None
+        if now is not None:
+            if self._last_time is not None:
+                refill = self.rate * max(now - self._last_time, 0.0)
+                self.tokens = [min(tokens + refill, self.burst) for tokens in self.tokens]
+            self._last_time = now
+        return self.tokens
+
+    def read(self, readings, now=None):
+        """
+        Fill readings (one value per endpoint, NaN when nothing usable or
+        only a stale message arrived) from the newest allowed message of
+        every endpoint; returns it.
+
+        now (simulation seconds) refills the rate-limit buckets.
+        """
+        h = self.h
+        count = h.helicsEndpointPendingMessageCount
+        get_message = h.helicsEndpointGetMessage
+        get_source = h.helicsMessageGetSource
+        get_bytes = h.helicsMessageGetBytes
+        budgets = self._budgets(now)
+        limit = self.queue_limit
+        sources = self.sources
+        pending_total, taken, backlog = self.pending, self.taken, self.backlog
+        values = [np.nan] * len(self.endpoints)
+        for i, ep in enumerate(self.endpoints):
+            pending = count(ep)
+            if not pending:
+                backlog[i] = 0
+                continue
+            pending_total[i] += pending
+            source = sources[i]
+            if pending == 1 and budgets is None:
+                # The usual step: one reading from the feeder
+                taken[i] += 1
+                backlog[i] = 0
+                if not self.max_pending[i]:
+                    self.max_pending[i] = 1
+                msg = get_message(ep)
+                if source is not None and get_source(msg) != source:
+                    self.foreign[i] += 1
+                    continue
+            else:
+                msg = self._take(i, ep, pending, limit, budgets, source)
+                if msg is None:
+                    continue
+            try:
+                values[i] = self.decode(get_bytes(msg)) * self.scale
+                self.accepted[i] += 1
+            except (ValueError, UnicodeDecodeError) as e:
+                self.errors[i] += 1
+                logger.warning(f"Could not parse EV message at endpoint {self.names[i]}: {e}")
+        readings[:] = values
+        return readings
+
+    def _take(self, i, ep, pending, limit, budgets, source):
+        """Retrieve up to the limits from a busy endpoint; the newest allowed message, or None if none or stale."""
+        h = self.h
+        get_message = h.helicsEndpointGetMessage
+        if pending > self.max_pending[i]:
+            self.max_pending[i] = pending
+        take = pending if limit is None else min(pending, limit)
+        if budgets is not None:
+            take = min(take, int(budgets[i]))
+            budgets[i] -= take
+        if take < pending:
+            self.limited[i] += 1
+            if i not in self._flooded:
+                self._flooded.add(i)
+                logger.warning(f"Endpoint {self.names[i]}: {pending} messages queued, taking {take} per step")
+        self.backlog[i] = pending - take
+        self.taken[i] += take
+        msg = None
+        if source is None:
+            for _ in range(take):
+                msg = get_message(ep)
+        else:
+            get_source = h.helicsMessageGetSource
+            foreign = 0
+            for _ in range(take):
+                m = get_message(ep)
+                if get_source(m) == source:
+                    msg = m
+                else:
+                    foreign += 1
+            self.foreign[i] += foreign
+        if take < pending and msg is not None:
+            # Newer messages are still queued: this reading is stale
+            self.stale[i] += 1
+            self.stale_time[i] = h.helicsMessageGetTime(msg)
+            return None
+        return msg
+
+    def counts(self):
+        """{counter: per-endpoint array} of everything recorded so far."""
+        counters = {"pending": self.pending, "taken": self.taken, "accepted": self.accepted,
+                    "foreign": self.foreign, "errors": self.errors, "limited_steps": self.limited, "stale": self.stale,
+                    "backlog": self.backlog, "max_pending": self.max_pending}
+        return {key: np.array(values, dtype=np.int64) for key, values in counters.items()}
+
+    def report(self):
+        flooded = [self.names[i] for i in sorted(self._flooded)]
+        return (f"messages taken={sum(self.taken)} accepted={sum(self.accepted)} "
+                f"foreign={sum(self.foreign)} stale={sum(self.stale)} errors={sum(self.errors)} "
+                f"max queued={max(self.max_pending, default=0)} "
+                f"backlog={sum(self.backlog)} limited endpoints={flooded or 'none'}")
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Array-based EV fleet control core for the 2bus-13bus controllers.
+
+Endpoint handles, the last EV readings and the per-branch setpoint tables are
+kept in NumPy arrays indexed by EV, so a control step is a handful of array
+operations plus one HELICS call per endpoint, independent of dict lookups and
+string formatting.
+
+Branches (rows of the setpoint table):
+- OVERLOAD:   feeder load >= upper limit
+- SAFE_RANGE: lower limit < feeder load < upper limit
+- LOW_LOAD:   feeder load <= lower limit
+
+The secondary controller (1bc_EV_Controller_2.py) has always used
+load > upper for overload, so a load exactly at its upper limit falls
+through to LOW_LOAD; overload_at_upper=False keeps that boundary.
+
+A fleet following a dispatch plan reports PLANNED instead: its setpoints
+come from the plan, not from a row of the table.
+"""
+import logging
+
+import numpy as np
+
+from ev_messages import MessageCodec, STRING
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD = 0
+SAFE_RANGE = 1
+LOW_LOAD = 2
+# Not a table row: step() of a fleet following a plan
+PLANNED = 3
+
+# Labels used in the [CONTROLLER_ACTION] log line and the event journal
+BRANCH_NAMES = ("overload_off", "safe_range_ev1_ev2_only", "low_load_all_on", "planned")
+
+# Per-endpoint low-load setpoints of the primary controller (W)
+PRIMARY_LOW_LOAD_POWERS = [210000.0, 200000.0, 200000.0, 200000.0, 200000.0, 206000.0]
+DEFAULT_EV_POWER = 200000.0
+
+
+def primary_setpoint_table(n_evs):
+    """
+    Setpoint table (W) of 1bc_EV_Controller.py.
+
+    Overload turns every EV off, the safe range alternates 210/200 kW across
+    the endpoints, and low load uses PRIMARY_LOW_LOAD_POWERS for the first six
+    endpoints and DEFAULT_EV_POWER for any others.
+    """
+    table = np.empty((3, n_evs))
+    table[OVERLOAD] = 0.0
+    table[SAFE_RANGE] = np.where(np.arange(n_evs) % 2 == 0, 210000.0, 200000.0)
+    table[LOW_LOAD] = DEFAULT_EV_POWER
+    k = min(n_evs, len(PRIMARY_LOW_LOAD_POWERS))
+    table[LOW_LOAD, :k] = PRIMARY_LOW_LOAD_POWERS[:k]
+    return table
+
+
+def secondary_setpoint_table(n_evs):
+    """
+    Setpoint table (W) of 1bc_EV_Controller_2.py.
+
+    NaN entries mean "send nothing": in the safe range only the first two
+    endpoints are commanded and the others keep their last value.
+    """
+    table = np.full((3, n_evs), np.nan)
+    table[OVERLOAD] = 0.0
+    table[SAFE_RANGE, :2] = 210000.0
+    table[LOW_LOAD] = DEFAULT_EV_POWER
+    return table
+
+
+def upper_is_overload(table_factory):
+    """Whether a load equal to the upper limit is overload for the controller of table_factory."""
+    return table_factory is not secondary_setpoint_table
+
+
+def classify_load(load, lower, upper, overload_at_upper=True):
+    """
+    Map feeder load(s) (W) to branch indices; works on scalars and arrays.
+
+    overload_at_upper (bool or array of bools) selects the OVERLOAD
+    boundary: load >= upper when true, load > upper when false.
+    """
+    load = np.asarray(load, dtype=float)
+    over = (load > upper) | ((load == upper) & overload_at_upper)
+    return np.where(over, OVERLOAD,
+                    np.where((load > lower) & (load < upper), SAFE_RANGE, LOW_LOAD))
+
+
+class EVFleet:
+    """
+    Endpoints, subscriptions and setpoint tables of one controller federate.
+
+    endpoints and inputs are HELICS handles; table is a (3, n_evs) array of
+    setpoints in W (NaN = no command). encoding selects the wire format of
+    the setpoints (see ev_messages); readings are decoded in either format.
+    overload_at_upper=False makes a load equal to upper LOW_LOAD instead of
+    OVERLOAD (see classify_load). The helics module can be swapped out with the api argument, which is how
+    the benchmarks drive the core.
+    """
+
+    def __init__(self, names, endpoints, inputs, table, lower, upper, api=None,
+                 encoding=STRING, overload_at_upper=True):
+        if api is None:
+            import helics as api
+        self.h = api
+        self.names = list(names)
+        self.endpoints = np.empty(len(endpoints), dtype=object)
+        self.endpoints[:] = list(endpoints)
+        # Plain list view of the handles for the per-endpoint C calls
+        self._endpoint_list = self.endpoints.tolist()
+        self.inputs = list(inputs)
+        self.table = np.asarray(table, dtype=float)
+        if self.table.shape != (3, len(self.names)):
+            raise ValueError(
+                f"setpoint table shape {self.table.shape} does not match {len(self.names)} EVs"
+            )
+        self.lower = lower
+        self.upper = upper
+        self.overload_at_upper = overload_at_upper
+        self.readings = np.full(len(self.names), np.nan)  # kW
+        self.setpoints = np.full(len(self.names), np.nan)  # W, last evaluated
+        # Commands are encoded once per branch, not once per step
+        self.codec = MessageCodec(encoding)
+        # Optional SetpointDispatcher; None sends every command every step
+        self.dispatcher = None
+        # Optional dispatch_planner.DispatchPlan; None picks a branch every step
+        self.plan = None
+        # (block, keep-alive due time) while the block's plan row is in force
+        # uncorrected; lets step() skip the correction while nothing changes
+        self._plan_hold = None
+        # Optional endpoint_ingest.EndpointIngestor; None drains every message
+        self.ingestor = None
+        # Messages sent by the last step()
+        self.last_sent = 0
+        self._commands = [
+            [None if np.isnan(p) else self.codec.encode(i, p) for i, p in enumerate(row)]
+            for row in self.table
+        ]
+
+    @classmethod
+    def from_federate(cls, fed, table_factory, lower, upper, api=None, encoding=STRING):
+        """Collect every endpoint and input registered on fed; the upper boundary follows table_factory."""
+        if api is None:
+            import helics as api
+        endpoints = [api.helicsFederateGetEndpointByIndex(fed, i)
+                     for i in range(api.helicsFederateGetEndpointCount(fed))]
+        inputs = [api.helicsFederateGetInputByIndex(fed, i)
+                  for i in range(api.helicsFederateGetInputCount(fed))]
+        names = [api.helicsEndpointGetName(ep).split('/')[-1] for ep in endpoints]
+        return cls(names, endpoints, inputs, table_factory(len(names)), lower, upper,
+                   api=api, encoding=encoding, overload_at_upper=upper_is_overload(table_factory))
+
+    def __len__(self):
+        return len(self.names)
+
+    def read_load(self):
+        """Total complex feeder load (VA) over all subscriptions."""
+        total = 0j
+        for sub in self.inputs:
+            total += self.h.helicsInputGetComplex(sub)
+        return total
+
+    def read_messages(self, now=None):
+        """
+        Drain every endpoint, keeping only the newest message.
+
+        Fills self.readings with the EV real power in kW (NaN when nothing
+        arrived this step) and returns it. With an ingestor (limit_ingestion)
+        the work per endpoint is bounded; now refills its rate limits.
+        """
+        if self.ingestor is not None:
+            return self.ingestor.read(self.readings, now)
+        h = self.h
+        has_message = h.helicsEndpointHasMessage
+        get_message = h.helicsEndpointGetMessage
+        get_bytes = h.helicsMessageGetBytes
+        decode_real = self.codec.decode_real
+        values = [np.nan] * len(self.names)
+        for i, ep in enumerate(self._endpoint_list):
+            msg = None
+            while has_message(ep):
+                msg = get_message(ep)
+            if msg is None:
+                continue
+            try:
+                values[i] = decode_real(get_bytes(msg)) / 1000.0
+            except (ValueError, UnicodeDecodeError) as e:
+                logger.warning(f"Could not parse EV message at endpoint {self.names[i]}: {e}")
+        self.readings[:] = values
+        return self.readings
+
+    def evaluate(self, load):
+        """Pick the branch for load (W) and return (branch, setpoints in W)."""
+        # Scalar comparison; classify_load is the array form for many feeders
+        upper = self.upper
+        if load > upper or (load == upper and self.overload_at_upper):
+            branch = OVERLOAD
+        elif self.lower < load < upper:
+            branch = SAFE_RANGE
+        else:
+            branch = LOW_LOAD
+        self.setpoints = self.table[branch]
+        return branch, self.setpoints
+
+    def send_on_change(self, keepalive=None):
+        """Route commands through a SetpointDispatcher from now on."""
+        from setpoint_dispatcher import SetpointDispatcher
+        self.dispatcher = SetpointDispatcher(self._endpoint_list, keepalive, api=self.h)
+        return self.dispatcher
+
+    def limit_ingestion(self, queue_limit=None, rate=None, burst=None, check_source=False):
+        """
+        Read EV messages through an EndpointIngestor from now on: pending
+        counts instead of polling, at most queue_limit (and rate per second)
+        messages per endpoint and step, one decode per endpoint.
+        """
+        from endpoint_ingest import DEFAULT_QUEUE_LIMIT, EndpointIngestor
+        self.ingestor = EndpointIngestor.for_fleet(
+            self, queue_limit if queue_limit is not None else DEFAULT_QUEUE_LIMIT, rate, burst, check_source)
+        return self.ingestor
+
+    def follow_plan(self, plan, keepalive=None):
+        """
+        Take the setpoints from a DispatchPlan from now on, sent on change.
+
+        step() then looks up the plan and corrects it against the measured
+        load instead of picking a branch, and returns PLANNED. While the
+        block's setpoints are in force uncorrected and the load stays at or
+        under the plan's upper limit minus margin, a step only looks up the
+        block and sends nothing.
+        """
+        if list(plan.names) != self.names:
+            raise ValueError(f"plan is for {list(plan.names)}, fleet has {self.names}")
+        self.plan = plan
+        self._plan_hold = None
+        if self.dispatcher is None:
+            self.send_on_change(keepalive)
+        return plan
+
+    def _planned_step(self, load, now):
+        plan = self.plan
+        dispatcher = self.dispatcher
+        k = plan.index(now)
+        hold = self._plan_hold
+        # Same block, its setpoints sent uncorrected, the feeder under the
+        # plan's ceiling and no keep-alive due: nothing would be sent, so the
+        # bias and headroom correction is skipped until one of these changes
+        if hold is not None and hold[0] == k and now < hold[1] and load <= plan.upper - plan.margin:
+            return 0
+        # EV power inside the measured load: the readings, else the last command
+        total = float(self.readings.sum()) * 1000.0
+        if np.isnan(total):
+            missing = np.isnan(self.readings)
+            total = float(np.nansum(self.readings)) * 1000.0 + float(np.nansum(dispatcher.last_command[missing]))
+        corrections = plan.corrections
+        k, self.setpoints = plan.setpoints(now, load, total)
+        sent = dispatcher.dispatch(self.setpoints, _EncodedRow(self.codec.encode, self.setpoints), now)
+        if plan.corrections == corrections:
+            keepalive = dispatcher.keepalive
+            self._plan_hold = (k, float(dispatcher.last_sent_time.min()) + keepalive if keepalive else np.inf)
+        else:
+            self._plan_hold = None
+        return sent
+
+    def send(self, branch, now=0.0):
+        """Send the setpoints of branch to every endpoint that has one."""
+        if self.dispatcher is not None:
+            return self.dispatcher.dispatch(self.table[branch], self._commands[branch], now)
+        send_bytes = self.h.helicsEndpointSendBytes
+        sent = 0
+        for ep, cmd in zip(self._endpoint_list, self._commands[branch]):
+            if cmd is not None:
+                send_bytes(ep, cmd)
+                sent += 1
+        return sent
+
+    def step(self, load, now=0.0):
+        """
+        Evaluate the policy for load and send the resulting commands.
+
+        Returns the branch taken, or PLANNED when following a plan.
+        """
+        if self.plan is not None:
+            self.last_sent = self._planned_step(load, now)
+            return PLANNED
+        branch, _ = self.evaluate(load)
+        self.last_sent = self.send(branch, now)
+        return branch
+
+
+class _EncodedRow:
+    """Commands of a row of setpoints, encoded on access (only for the endpoints being sent)."""
+
+    __slots__ = ("encode", "values")
+
+    def __init__(self, encode, values):
+        self.encode = encode
+        self.values = values
+
+    def __getitem__(self, i):
+        return self.encode(i, self.values[i])
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Encoding of EV setpoint and telemetry messages.
+
+Two wire formats are supported:
+- string: the complex string GridLAB-D reads and writes, e.g. b"210000.0+0.0j"
+- binary: 21 packed bytes, tag 0xEB | uint32 EV id | float64 real | float64 imag
+
+The binary form is for Python peers only (controller, attacker, surrogate
+feeders); anything talking to GridLAB-D must keep the string form. Decoding
+detects the format from the payload, so a controller in binary mode still
+reads plain GridLAB-D strings.
+"""
+import struct
+
+import numpy as np
+
+STRING = "string"
+BINARY = "binary"
+ENCODINGS = (STRING, BINARY)
+
+BINARY_TAG = 0xEB
+_PACKER = struct.Struct("<BIdd")
+_unpack = _PACKER.unpack
+BINARY_SIZE = _PACKER.size
+# Same layout as _PACKER for decoding many payloads in one call
+BINARY_DTYPE = np.dtype([("tag", "u1"), ("ev_id", "<u4"), ("real", "<f8"), ("imag", "<f8")])
+
+NO_EV_ID = -1
+
+
+def encode_string(value):
+    """GridLAB-D complex string for value (W or VA)."""
+    value = complex(value)
+    return f"{value.real:.1f}{value.imag:+.1f}j".encode()
+
+
+def encode_binary(ev_id, value):
+    """Packed binary message for EV ev_id."""
+    value = complex(value)
+    return _PACKER.pack(BINARY_TAG, ev_id, value.real, value.imag)
+
+
+def is_binary(data):
+    return len(data) == BINARY_SIZE and data[0] == BINARY_TAG
+
+
+def decode(data):
+    """
+    Decode one message payload to (ev_id, complex value).
+
+    ev_id is NO_EV_ID for string payloads. Raises ValueError on payloads that
+    are neither format.
+    """
+    if len(data) == BINARY_SIZE and data[0] == BINARY_TAG:
+        _, ev_id, real, imag = _unpack(data)
+        return ev_id, complex(real, imag)
+    if isinstance(data, bytes):
+        data = data.decode()
+    return NO_EV_ID, complex(data)
+
+
+def decode_real(data):
+    """Real part of one payload in either format; the controller's hot path."""
+    if len(data) == BINARY_SIZE and data[0] == BINARY_TAG:
+        return _unpack(data)[2]
+    return complex(data.decode() if isinstance(data, bytes) else data).real
+
+
+def decode_binary_batch(payloads):
+    """
+    Decode many binary payloads at once.
+
+    Returns (ev_ids, values) arrays. All payloads must be binary.
+    """
+    records = np.frombuffer(b"".join(payloads), dtype=BINARY_DTYPE)
+    if len(records) and not (records["tag"] == BINARY_TAG).all():
+        raise ValueError("batch contains non-binary EV messages")
+    return records["ev_id"].astype(np.int64), records["real"] + 1j * records["imag"]
+
+
+class MessageCodec:
+    """Encoder/decoder bound to one wire format."""
+
+    def __init__(self, encoding=STRING):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"unknown EV message encoding {encoding!r}, expected one of {ENCODINGS}")
+        self.encoding = encoding
+        self.binary = encoding == BINARY
+
+    def encode(self, ev_id, value):
+        if self.binary:
+            return encode_binary(ev_id, value)
+        return encode_string(value)
+
+    decode = staticmethod(decode)
+    decode_real = staticmethod(decode_real)
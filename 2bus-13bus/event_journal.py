@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Structured, asynchronous event journal for the EV controllers.
+
+Each control step becomes one typed StepEvent (time, feeder load, branch,
+messages sent and the commanded setpoint per EV) instead of a handful of
+formatted log lines that later have to be regexed back out of
+1c_Controller.log. The controller only puts a tuple on a queue; a background
+thread formats and writes the records, so journalling costs no I/O in the
+time loop. A controller following a dispatch plan journals branch
+ev_fleet.PLANNED (action "planned") rather than a branch of the table.
+
+Two file formats, picked from the suffix of the path:
+- .jsonl: one JSON object per line, {"kind": "step", ...}, plus free-form
+  run events (start, end, reports) written with event().
+- .tlm:   the columnar format of telemetry_recorder, one row per step with
+  columns time, load_w, load_var, branch, sent and cmd_<EV>. Run events are
+  not stored in this format.
+
+StepLogger keeps the human-readable log optional and rate-limited: a step is
+logged when the branch changes or when min_interval wall seconds have passed.
+"""
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from ev_fleet import BRANCH_NAMES
+from telemetry_recorder import TelemetryRecorder, load_recording
+
+logger = logging.getLogger(__name__)
+
+JSONL = ".jsonl"
+COLUMNAR = ".tlm"
+JOURNAL_FORMATS = (JSONL, COLUMNAR)
+STEP_COLUMNS = ["time", "load_w", "load_var", "branch", "sent"]
+
+StepEvent = namedtuple("StepEvent", ["time", "load_w", "load_var", "branch", "sent", "setpoints"])
+
+_STOP = object()
+
+
+def _json_value(value):
+    # NaN (no command) is not valid JSON
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+class EventJournal:
+    """
+    Queue-backed writer of controller events.
+
+    names are the EV names, in the order of the setpoint arrays passed to
+    step(). setpoints are queued by reference, so pass arrays that are not
+    modified afterwards (EVFleet.setpoints is a row of the setpoint table).
+    With resume_at (s), as when resuming from a checkpoint, an existing
+    journal is cut back to its records up to that time and appended to.
+    """
+
+    def __init__(self, path, names, rows=256, resume_at=None):
+        self.path = path
+        self.names = list(names)
+        self.format = os.path.splitext(path)[1]
+        if self.format not in JOURNAL_FORMATS:
+            raise ValueError(f"unknown journal format {self.format!r}, expected one of {JOURNAL_FORMATS}")
+        if self.format == COLUMNAR:
+            self._recorder = TelemetryRecorder(
+                path, STEP_COLUMNS + [f"cmd_{name}" for name in self.names], rows,
+                resume=("time", resume_at) if resume_at is not None else None)
+            self._row = np.empty(len(STEP_COLUMNS) + len(self.names))
+            self._fh = None
+        else:
+            self._recorder = None
+            if resume_at is not None and os.path.exists(path):
+                _truncate_jsonl(path, resume_at)
+                self._fh = open(path, "a")
+            else:
+                self._fh = open(path, "w")
+        self.steps = 0
+        self.events = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="event-journal", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def step(self, t, load, branch, setpoints, sent):
+        """Queue one control step; load is the complex feeder load (VA)."""
+        self._queue.put(StepEvent(t, load.real, load.imag, int(branch), sent, setpoints))
+        self.steps += 1
+
+    def event(self, kind, t=None, **fields):
+        """Queue a run-level event such as "start", "end" or a report."""
+        self._queue.put((kind, t, fields))
+        self.events += 1
+
+    def close(self):
+        """Drain the queue, stop the writer thread and close the file."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        logger.info(f"Event journal: {self.steps} steps and {self.events} events written to {self.path}")
+
+    # -- writer thread ------------------------------------------------------
+
+    def _run(self):
+        write = self._write_step_columnar if self._recorder is not None else self._write_step_json
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                if isinstance(item, StepEvent):
+                    write(item)
+                elif self._fh is not None:
+                    self._write_event_json(item)
+        finally:
+            if self._recorder is not None:
+                self._recorder.close()
+            else:
+                self._fh.close()
+
+    def _write_step_json(self, ev):
+        record = {
+            "kind": "step",
+            "time": ev.time,
+            "load_w": ev.load_w,
+            "load_var": ev.load_var,
+            "branch": ev.branch,
+            "action": BRANCH_NAMES[ev.branch],
+            "sent": ev.sent,
+            "commands": dict(zip(self.names, map(_json_value, ev.setpoints.tolist()))),
+        }
+        self._fh.write(json.dumps(record) + "\n")
+
+    def _write_event_json(self, item):
+        kind, t, fields = item
+        record = {"kind": kind, "time": t}
+        record.update(fields)
+        self._fh.write(json.dumps(record, default=str) + "\n")
+
+    def _write_step_columnar(self, ev):
+        row = self._row
+        row[:5] = (ev.time, ev.load_w, ev.load_var, ev.branch, ev.sent)
+        row[5:] = ev.setpoints
+        self._recorder.append(row)
+
+
+def _truncate_jsonl(path, limit):
+    """Cut a .jsonl journal before its first record after limit (s) or its first incomplete line."""
+    end = 0
+    with open(path, "rb") as fh:
+        for line in fh:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                t = json.loads(line).get("time")
+            except ValueError:
+                break
+            if t is not None and t > limit:
+                break
+            end += len(line)
+    with open(path, "r+b") as fh:
+        fh.truncate(end)
+
+
+def read_events(path):
+    """All records of a .jsonl journal as a list of dicts."""
+    with open(path) as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def load_steps(path):
+    """
+    Step records of a journal in either format as {column: 1-D array}.
+
+    Columns are those of the columnar format; commands are cmd_<EV> in W
+    with NaN where no command was given.
+    """
+    if os.path.splitext(path)[1] == COLUMNAR:
+        return load_recording(path)
+    steps = [r for r in read_events(path) if r["kind"] == "step"]
+    data = {name: np.array([r[name] for r in steps], dtype=float) for name in STEP_COLUMNS}
+    names = list(steps[0]["commands"]) if steps else []
+    for name in names:
+        data[f"cmd_{name}"] = np.array(
+            [np.nan if r["commands"][name] is None else r["commands"][name] for r in steps])
+    return data
+
+
+class StepLogger:
+    """
+    Rate limit for the per-step human-readable log.
+
+    due(branch) is True when logging is enabled and either the branch
+    differs from the last logged one or min_interval wall seconds have
+    passed since the last logged step. min_interval=0 logs every step.
+    """
+
+    def __init__(self, enabled=True, min_interval=10.0):
+        self.enabled = enabled
+        self.min_interval = min_interval
+        self._last_branch = None
+        self._last_time = -math.inf
+        self.logged = 0
+        self.skipped = 0
+
+    def due(self, branch):
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        if branch != self._last_branch or now - self._last_time >= self.min_interval:
+            self._last_branch = branch
+            self._last_time = now
+            self.logged += 1
+            return True
+        self.skipped += 1
+        return False
+
+    def report(self):
+        return f"step log lines written for {self.logged} steps, {self.skipped} steps not logged"
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Time advancement strategies for the EV controller federate.
+
+FixedIntervalClock reproduces the original loop: request every multiple of
+update_interval and evaluate control at each one.
+
+EventDrivenClock requests HELICS_TIME_MAXTIME and is only granted when a
+subscribed input changes (the inputs are switched to only_update_on_change)
+or a message arrives. Grants where neither happened are counted but not
+yielded, so control runs only on real wake-ups.
+
+Both are iterables yielding the time (s) at which to evaluate control, with
+the actual granted time in .granted. start skips ahead: the first request is
+for start itself, so a resumed run reaches it with a single grant.
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+FIXED = "fixed"
+EVENT = "event"
+TIME_MODES = (FIXED, EVENT)
+
+
+class FixedIntervalClock:
+    """Step through range(start, total_interval, update_interval)."""
+
+    def __init__(self, fed, total_interval, update_interval, api=None, start=0):
+        if api is None:
+            import helics as api
+        self.h = api
+        self.fed = fed
+        self.total_interval = total_interval
+        self.update_interval = update_interval
+        self.start = start
+        self.granted = -1
+        self.grants = 0
+        self.wakeups = 0
+        self.wall_time = 0.0
+
+    def __iter__(self):
+        h = self.h
+        start = time.perf_counter()
+        try:
+            for t in range(self.start, self.total_interval, self.update_interval):
+                while self.granted < t:
+                    self.granted = h.helicsFederateRequestTime(self.fed, t)
+                    self.grants += 1
+                self.wakeups += 1
+                yield t
+        finally:
+            self.wall_time = time.perf_counter() - start
+
+    def report(self):
+        return (f"time mode={FIXED} grants={self.grants} control steps={self.wakeups} "
+                f"wall time={self.wall_time:.3f}s")
+
+
+class EventDrivenClock(FixedIntervalClock):
+    """
+    Request the maximum time and wake on input updates or EV messages.
+
+    min_change (VA) is an optional dead-band on the inputs: smaller load
+    changes still produce a grant but do not count as an update.
+    """
+
+    def __init__(self, fed, total_interval, inputs, min_change=0.0, api=None, start=0):
+        super().__init__(fed, total_interval, None, api=api, start=start)
+        h = self.h
+        self.inputs = list(inputs)
+        for sub in self.inputs:
+            h.helicsInputSetOption(sub, h.HELICS_HANDLE_OPTION_ONLY_UPDATE_ON_CHANGE, True)
+            if min_change:
+                h.helicsInputSetMinimumChange(sub, min_change)
+
+    def _has_news(self):
+        h = self.h
+        if h.helicsFederatePendingMessageCount(self.fed):
+            return True
+        return any(h.helicsInputIsUpdated(sub) for sub in self.inputs)
+
+    def __iter__(self):
+        h = self.h
+        start = time.perf_counter()
+        try:
+            if self.start > 0:
+                self.granted = h.helicsFederateRequestTime(self.fed, self.start)
+                self.grants += 1
+            while True:
+                self.granted = h.helicsFederateRequestTime(self.fed, h.HELICS_TIME_MAXTIME)
+                self.grants += 1
+                if self.granted >= self.total_interval:
+                    return
+                if self._has_news():
+                    self.wakeups += 1
+                    yield self.granted
+        finally:
+            self.wall_time = time.perf_counter() - start
+
+    def report(self):
+        return (f"time mode={EVENT} grants={self.grants} control steps={self.wakeups} "
+                f"wall time={self.wall_time:.3f}s")
+
+
+def make_clock(mode, fed, total_interval, update_interval, inputs, min_change=0.0, api=None, start=0):
+    """Clock for CONTROLLER_TIME_MODE."""
+    if mode == FIXED:
+        return FixedIntervalClock(fed, total_interval, update_interval, api=api, start=start)
+    if mode == EVENT:
+        return EventDrivenClock(fed, total_interval, inputs, min_change, api=api, start=start)
+    raise ValueError(f"unknown time mode {mode!r}, expected one of {TIME_MODES}")
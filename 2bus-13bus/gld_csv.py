@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Cached loader for GridLAB-D recorder and dump CSVs.
+
+Understands both output flavours found in this directory:
+
+- recorder / group_recorder files (sw_status*.csv, EV*_storage.csv,
+  output/1c_IEEE_123_feeder_0_*.csv, reg1_output.csv, ...):
+      # file...... EV1_storage.csv
+      # target.... meter 822
+      # interval.. 1200
+      # timestamp,measured_voltage_A,...
+      2013-08-28 00:00:00 PST,+0+0j,...
+- voltdump / currdump files (Volt_Dump_NR.csv, Current_Dump_NR.csv):
+      # Volt_Dump_NR.csv run at 2013-08-28 00:00:00 PST on 804 powerflow objects ...
+      node_name,voltA_real,voltA_imag,...
+
+Columns are parsed in bulk: timestamps become datetime64[s] (the time zone
+abbreviation is kept in the metadata), GridLAB-D complex values in
+rectangular (+a+bj, +a+bi) or polar (+m+ad, +m+ar) form become complex128,
+and *_real/*_imag (or .real/.imag) column pairs are merged into one complex
+column. Anything else is float64 if it parses as a number, otherwise a
+string array (e.g. OPEN/CLOSED).
+
+The parsed result is cached in a .npz sidecar under .gld_cache/ next to the
+CSV, keyed by the absolute path, size and mtime of the source, so repeated
+analyses of the same run skip the parse.
+
+    python gld_csv.py Volt_Dump_NR.csv sw_status_l5_EV1.csv
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from collections import namedtuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = ".gld_cache"
+CACHE_VERSION = 1
+
+GLDTable = namedtuple("GLDTable", ["meta", "data"])
+
+# "# target.... meter 822" -> ("target", "meter 822")
+_META_RE = re.compile(r"#\s*(\w+)\.*\s(.*)$")
+_DUMP_RE = re.compile(r"#\s*(\S+) run at (.+?) on (\d+) (.*)$")
+_COMPLEX_RE = re.compile(
+    r"^([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)"
+    r"([+-](?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)([ijdr])$",
+    re.MULTILINE,
+)
+_UNIT_DELETE = str.maketrans("ijdr", "    ")
+_TIMESTAMP_RE = re.compile(r"^\d{4}-\d\d-\d\d[ T]\d\d:\d\d:\d\d")
+_PAIR_SUFFIXES = (("_real", "_imag"), (".real", ".imag"))
+
+
+def read_header(path):
+    """
+    (meta, columns, n_header_lines) of a GridLAB-D CSV.
+
+    meta holds the recorder fields (file, date, user, host, target, trigger,
+    interval, limit) or, for dumps, file/run_at/objects/description.
+    """
+    meta = {}
+    columns = None
+    n = 0
+    with open(path) as fh:
+        for line in fh:
+            line = line.rstrip("\n")
+            if not line.startswith("#"):
+                if columns is None and line:
+                    # Dump files: plain CSV header after the "# ... run at" line
+                    columns = [c.strip() for c in line.split(",")]
+                    n += 1
+                break
+            n += 1
+            m = _DUMP_RE.match(line)
+            if m:
+                meta.update(file=m.group(1), run_at=m.group(2), objects=int(m.group(3)),
+                            description=m.group(4))
+                continue
+            body = line[1:].strip()
+            if "," in body or body == "timestamp":
+                columns = [c.strip() for c in body.split(",")]
+                continue
+            m = _META_RE.match(line)
+            if m:
+                meta[m.group(1)] = m.group(2).strip()
+    for key in ("interval", "limit"):
+        if key in meta:
+            try:
+                meta[key] = int(meta[key])
+            except ValueError:
+                pass
+    return meta, columns or [], n
+
+
+def parse_complex(values):
+    """
+    GridLAB-D complex strings to complex128 in bulk.
+
+    The imaginary part is split off at its sign and the unit letter
+    dropped, so NumPy parses the whole column in one call. Polar
+    values (d = degrees, r = radians) are converted to rectangular.
+    """
+    values = list(values)
+    if not values:
+        return np.empty(0, dtype=complex)
+    text = "\n".join(values).translate(_UNIT_DELETE)
+    # Split every sign off its number, then glue exponent signs back
+    text = text.replace("+", " +").replace("-", " -")
+    for e in ("e", "E"):
+        text = text.replace(e + " +", e + "+").replace(e + " -", e + "-")
+    parts = np.fromstring(text, dtype=float, sep=" ")
+    if len(parts) != 2 * len(values):
+        return np.array([_complex_one(v) for v in values], dtype=complex)
+    a, b = parts[0::2], parts[1::2]
+    if {v[-1] for v in values} <= {"i", "j"}:
+        return a + 1j * b
+    unit = np.array([v[-1] for v in values])
+    angle = np.where(unit == "d", np.deg2rad(b), b)
+    polar = (unit == "d") | (unit == "r")
+    return np.where(polar, a * np.exp(1j * angle), a + 1j * b)
+
+
+def _complex_one(value):
+    m = _COMPLEX_RE.match(value.strip())
+    if m is None:
+        try:
+            return complex(float(value))
+        except ValueError:
+            return complex(np.nan, np.nan)
+    a, b, unit = float(m.group(1)), float(m.group(2)), m.group(3)
+    if unit == "d":
+        return a * np.exp(1j * np.deg2rad(b))
+    if unit == "r":
+        return a * np.exp(1j * b)
+    return complex(a, b)
+
+
+def parse_timestamps(values):
+    """
+    (datetime64[s] array, time zone abbreviation) of GridLAB-D timestamps.
+
+    "2013-08-28 00:20:00 PST" keeps its wall-clock time; the zone is
+    returned separately (None when absent or mixed).
+    """
+    values = list(values)
+    zones = {v[19:].strip() for v in values}
+    stamps = np.array([v[:19] for v in values], dtype="datetime64[s]")
+    zone = zones.pop() if len(zones) == 1 else None
+    return stamps, zone or None
+
+
+def _column_kind(sample):
+    if _TIMESTAMP_RE.match(sample):
+        return "timestamp"
+    if _COMPLEX_RE.match(sample):
+        return "complex"
+    try:
+        float(sample)
+        return "float"
+    except ValueError:
+        return "str"
+
+
+def _merge_pairs(data, columns):
+    """Merge x_real/x_imag (or x.real/x.imag) float columns into complex x."""
+    out = {}
+    for name in columns:
+        if name not in data:
+            continue
+        for re_suffix, im_suffix in _PAIR_SUFFIXES:
+            if name.endswith(re_suffix):
+                base = name[:-len(re_suffix)]
+                imag = base + im_suffix
+                if imag in data:
+                    out[base] = data[name] + 1j * data.pop(imag)
+                    break
+        else:
+            out[name] = data[name]
+    return out
+
+
+def _parse_float(values):
+    """float64 column in one NumPy call, falling back to strings."""
+    parsed = np.fromstring(" ".join(values), dtype=float, sep=" ")
+    if len(parsed) == len(values):
+        return parsed
+    try:
+        return np.array(values, dtype=float)
+    except ValueError:
+        return np.array([v.strip() for v in values])
+
+
+def parse_gld_csv(path):
+    """Parse a GridLAB-D CSV into a GLDTable without touching the cache."""
+    meta, columns, n_header = read_header(path)
+    with open(path) as fh:
+        lines = fh.read().splitlines()[n_header:]
+    lines = [line for line in lines if line and not line.startswith("#")]
+    if not lines:
+        return GLDTable(meta, {name: np.empty(0) for name in columns})
+    if not columns:
+        columns = [f"col{i}" for i in range(lines[0].count(",") + 1)]
+    # One flat token list; column j is every k-th token starting at j
+    k = len(columns)
+    tokens = ",".join(lines).split(",")
+    if len(tokens) != k * len(lines):
+        raise ValueError(f"{path}: rows do not all have {k} fields")
+    data = {}
+    for j, name in enumerate(columns):
+        values = tokens[j::k]
+        kind = _column_kind(values[0].strip()) if values else "float"
+        if kind == "timestamp":
+            try:
+                data[name], meta["timezone"] = parse_timestamps(values)
+                continue
+            except ValueError:
+                kind = "str"
+        if kind == "complex":
+            data[name] = parse_complex(values)
+        elif kind == "float":
+            data[name] = _parse_float(values)
+        else:
+            data[name] = np.array([v.strip() for v in values])
+    return GLDTable(meta, _merge_pairs(data, columns))
+
+
+def _cache_path(path):
+    head, tail = os.path.split(os.path.abspath(path))
+    return os.path.join(head, CACHE_DIR, tail + ".npz")
+
+
+def _cache_key(path):
+    st = os.stat(path)
+    return {"version": CACHE_VERSION, "path": os.path.abspath(path),
+            "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _load_cache(path, key):
+    cache = _cache_path(path)
+    try:
+        with np.load(cache, allow_pickle=False) as npz:
+            header = json.loads(str(npz["__header__"]))
+            if header["key"] != key:
+                return None
+            return GLDTable(header["meta"], {name: npz[f"c{i}"] for i, name in enumerate(header["columns"])})
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_cache(path, key, table):
+    cache = _cache_path(path)
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    header = {"key": key, "meta": table.meta, "columns": list(table.data)}
+    arrays = {f"c{i}": values for i, values in enumerate(table.data.values())}
+    tmp = cache + ".tmp.npz"
+    np.savez(tmp, __header__=np.array(json.dumps(header)), **arrays)
+    os.replace(tmp, cache)
+
+
+def load_gld_csv(path, cache=True):
+    """
+    Load a GridLAB-D recorder or dump CSV as GLDTable(meta, {column: array}).
+
+    With cache=True the parsed arrays are reused from (and written to) the
+    .gld_cache sidecar as long as the CSV's path, size and mtime match.
+    """
+    if not cache:
+        return parse_gld_csv(path)
+    key = _cache_key(path)
+    table = _load_cache(path, key)
+    if table is not None:
+        return table
+    table = parse_gld_csv(path)
+    try:
+        _save_cache(path, key, table)
+    except OSError as e:
+        logger.warning(f"Could not write cache for {path}: {e}")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load GridLAB-D CSVs and report parse vs. cached load time')
+    parser.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        start = time.perf_counter()
+        table = parse_gld_csv(path)
+        t_parse = time.perf_counter() - start
+        load_gld_csv(path)
+        start = time.perf_counter()
+        load_gld_csv(path)
+        t_cached = time.perf_counter() - start
+        n = len(next(iter(table.data.values()))) if table.data else 0
+        print(f"{path}: {n} rows, parse {t_parse * 1e3:.1f} ms, cached {t_cached * 1e3:.1f} ms")
+        for key, value in table.meta.items():
+            print(f"    {key}: {value}")
+        for name, values in table.data.items():
+            print(f"    {name:<28} {values.dtype}")
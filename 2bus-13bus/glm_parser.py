@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+Parser for GridLAB-D model files (.glm).
+
+Reads the object tree of a GLM into GLMObject records (type, name, property
+dict, parent name), with nested objects flattened and linked to the object
+they are declared in. Other blocks (clock, module, class, schedule, ...) are
+kept as GLMBlock records with their raw statements. Macro lines (#set,
+#define, ...) are kept as (directive, argument) pairs. #include lines are
+replaced by the included file, looked up next to the including file and then
+next to the top-level model (so "include2/include/schedules/..." resolves
+from 1c_IEEE_123_feeder_2.glm), and the files read are listed in
+GLMModel.files with their SHA-1.
+
+The text is tokenized by one regular expression and assembled with an
+explicit stack. load_glm() also keeps the parsed model in a pickle under
+.gld_cache/ next to the GLM, keyed on the hashes of every file read, so an
+unchanged model (includes and all) is loaded from there instead of parsed.
+
+GLMTopology turns the objects into a node/link graph: every object with
+from and to properties (lines, switches, transformers, regulators, fuses) is
+an edge, which answers questions such as which node and phases each EV load
+hangs off:
+
+    topology = GLMTopology(load_glm("1c_IEEE_123_feeder.glm"))
+    topology.feeder_link("EV6")     # GLMLink(name='swEV6', type='switch', from_node='l114', ...)
+
+    python glm_parser.py 1c_IEEE_123_feeder.glm            # object counts, parse and cached load time
+    python glm_parser.py IEEE8500.glm --type node --show 3
+    python glm_parser.py 1c_IEEE_123_feeder_2.glm --ev     # link and phases of every EV
+"""
+import argparse
+import hashlib
+import logging
+import os
+import pickle
+import re
+import time
+from collections import Counter, defaultdict, deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Shared with gld_csv, which keeps its parsed CSVs in the same directory
+CACHE_DIR = ".gld_cache"
+CACHE_VERSION = 1
+
+GLMObject = namedtuple("GLMObject", ["type", "name", "properties", "parent"])
+GLMBlock = namedtuple("GLMBlock", ["keyword", "args", "statements", "children"])
+# files: [(absolute path, SHA-1 hex or None if missing), ...], top-level file first
+GLMModel = namedtuple("GLMModel", ["objects", "blocks", "directives", "files"])
+GLMLink = namedtuple("GLMLink", ["name", "type", "from_node", "to_node", "phases"])
+
+# Strings, braces, semicolons and bare words; comments are removed beforehand
+_TOKEN_RE = re.compile(r'"[^"]*"|\'[^\']*\'|[{};]|[^\s{};"\']+')
+_COMMENT_RE = re.compile(r'//[^\n]*')
+_DIRECTIVE_RE = re.compile(r'^[ \t]*#(\w+)[ \t]*([^\n]*)$', re.MULTILINE)
+_INCLUDE_RE = re.compile(r'^[ \t]*#include[ \t]+["<]?([^">\n;]+?)[">]?[ \t]*;?[ \t]*$', re.MULTILINE)
+
+
+def _unquote(token):
+    if len(token) >= 2 and token[0] == token[-1] and token[0] in "\"'":
+        return token[1:-1]
+    return token
+
+
+def split_directives(text):
+    """(text without macro lines, [(directive, argument), ...])."""
+    directives = [(m.group(1), m.group(2).strip().rstrip(";").strip())
+                  for m in _DIRECTIVE_RE.finditer(text)]
+    return _DIRECTIVE_RE.sub("", text), directives
+
+
+def tokenize(text):
+    """Tokens of GLM text without macro lines."""
+    return _TOKEN_RE.findall(_COMMENT_RE.sub("", text))
+
+
+class _Frame:
+    __slots__ = ("header", "statements", "children", "properties", "obj")
+
+    def __init__(self, header):
+        self.header = header
+        self.statements = []
+        self.children = []
+        self.properties = {}
+        self.obj = None
+
+
+def _set_property(frame, statement, strings):
+    value = " ".join(_unquote(t) for t in statement[1:])
+    # Share the property names and the short, repetitive values (phases, configurations):
+    # halves the memory of a large model and the size of its cache
+    if len(value) <= 16:
+        value = strings.setdefault(value, value)
+    frame.properties[strings.setdefault(statement[0], statement[0])] = value
+
+
+def parse_tokens(tokens):
+    """(objects, blocks) of a token list."""
+    objects = []
+    strings = {}
+    root = _Frame([])
+    stack = [root]
+    current = []
+    counts = Counter()
+    for tok in tokens:
+        if tok == ";":
+            if current:
+                frame = stack[-1]
+                frame.statements.append(current)
+                if frame.obj is not None:
+                    _set_property(frame, current, strings)
+            current = []
+        elif tok == "{":
+            frame = _Frame(current)
+            stack.append(frame)
+            if current and current[0] == "object":
+                # Register now so children keep file order after their parent
+                type_, _, obj_id = current[1].partition(":") if len(current) > 1 else ("", "", "")
+                frame.obj = [strings.setdefault(type_, type_), obj_id]
+                objects.append(frame)
+            current = []
+        elif tok == "}":
+            if current:
+                # Last statement without a semicolon
+                stack[-1].statements.append(current)
+                if stack[-1].obj is not None:
+                    _set_property(stack[-1], current, strings)
+                current = []
+            if len(stack) == 1:
+                raise ValueError("unbalanced '}' in GLM")
+            frame = stack.pop()
+            stack[-1].children.append(frame)
+        else:
+            current.append(tok)
+    if len(stack) != 1:
+        raise ValueError(f"unterminated block {' '.join(stack[-1].header)!r} in GLM")
+
+    # Names: the name property, else type:id, else type:<running number>
+    for frame in objects:
+        type_, obj_id = frame.obj
+        name = frame.properties.get("name")
+        if name is None:
+            counts[type_] += 1
+            name = f"{type_}:{obj_id or counts[type_]}"
+        frame.obj.append(name)
+    out = []
+    parents = {}
+    for frame in objects:
+        for child in frame.children:
+            if child.obj is not None:
+                parents[id(child)] = frame.obj[2]
+    for frame in objects:
+        type_, _, name = frame.obj
+        parent = frame.properties.get("parent", parents.get(id(frame)))
+        out.append(GLMObject(type_, name, frame.properties, parent))
+    blocks = [_block(frame) for frame in root.children if frame.obj is None]
+    return out, blocks
+
+
+def _block(frame):
+    header = frame.header
+    return GLMBlock(header[0] if header else "", header[1:], frame.statements,
+                    [_block(child) for child in frame.children if child.obj is None])
+
+
+def parse_glm_text(text, files=()):
+    """GLMModel of GLM source text (includes are listed, not followed)."""
+    body, directives = split_directives(text)
+    objects, blocks = parse_tokens(tokenize(body))
+    return GLMModel(objects, blocks, directives, list(files))
+
+
+def _read(path):
+    """(text, SHA-1 hex) of a file."""
+    with open(path, "rb") as fh:
+        data = fh.read()
+    return data.decode("utf-8", errors="replace"), hashlib.sha1(data).hexdigest()
+
+
+def _digest(path):
+    try:
+        with open(path, "rb") as fh:
+            return hashlib.sha1(fh.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def expand_includes(path):
+    """
+    (text of path with every #include replaced by the included file, files).
+
+    files lists (absolute path, SHA-1) of every file read, and (path, None)
+    for includes that were not found; those are left out with a warning.
+    """
+    top_dir = os.path.dirname(os.path.abspath(path))
+    files = []
+
+    def expand(path, stack):
+        text, digest = _read(path)
+        files.append((path, digest))
+        here = os.path.dirname(path)
+
+        def include(m):
+            name = m.group(1).strip()
+            for base in (here, top_dir):
+                candidate = os.path.normpath(os.path.join(base, name))
+                if os.path.isfile(candidate):
+                    break
+            else:
+                logger.warning(f"{path}: #include {name} not found")
+                files.append((os.path.normpath(os.path.join(here, name)), None))
+                return ""
+            if candidate in stack:
+                raise ValueError(f"{path}: recursive #include of {candidate}")
+            return expand(candidate, stack + (candidate,))
+
+        return _INCLUDE_RE.sub(include, text)
+
+    path = os.path.abspath(path)
+    return expand(path, (path,)), files
+
+
+def _cache_path(path):
+    head, tail = os.path.split(os.path.abspath(path))
+    return os.path.join(head, CACHE_DIR, tail + ".pickle")
+
+
+def _block_tuple(block):
+    return block.keyword, block.args, block.statements, [_block_tuple(b) for b in block.children]
+
+
+def _block_record(data):
+    keyword, args, statements, children = data
+    return GLMBlock(keyword, args, statements, [_block_record(b) for b in children])
+
+
+def _load_cache(path, includes):
+    """Cached GLMModel of path if every file it was built from is unchanged, else None."""
+    try:
+        with open(_cache_path(path), "rb") as fh:
+            data = pickle.load(fh)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION or data.get("includes") != includes:
+        return None
+    files = [tuple(f) for f in data["files"]]
+    if any(_digest(f) != digest for f, digest in files):
+        return None
+    # Plain tuples in the pickle, so it loads whether this module is __main__ or imported
+    return GLMModel([GLMObject._make(o) for o in data["objects"]],
+                    [_block_record(b) for b in data["blocks"]],
+                    data["directives"], files)
+
+
+def _save_cache(path, includes, model):
+    cache = _cache_path(path)
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    data = {"version": CACHE_VERSION, "includes": includes, "files": model.files,
+            "objects": [tuple(o) for o in model.objects],
+            "blocks": [_block_tuple(b) for b in model.blocks],
+            "directives": model.directives}
+    tmp = cache + ".tmp"
+    with open(tmp, "wb") as fh:
+        pickle.dump(data, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cache)
+
+
+def load_glm(path, includes=True, cache=True):
+    """
+    GLMModel of a .glm file, with #include files spliced in unless includes=False.
+
+    With cache=True the model is reused from (and written to) the .gld_cache
+    pickle as long as the SHA-1 of the GLM and of every included file match.
+    """
+    if cache:
+        model = _load_cache(path, includes)
+        if model is not None:
+            return model
+    if includes:
+        text, files = expand_includes(path)
+    else:
+        text, digest = _read(path)
+        files = [(os.path.abspath(path), digest)]
+    model = parse_glm_text(text, files)
+    if cache:
+        try:
+            _save_cache(path, includes, model)
+        except OSError as e:
+            logger.warning(f"Could not write cache for {path}: {e}")
+    return model
+
+
+def objects_by_name(model):
+    return {obj.name: obj for obj in model.objects}
+
+
+def property_float(value, default=None):
+    """Leading number of a GLM property value ("2401.7771", "77.4 MVA"); default if none."""
+    if value is None:
+        return default
+    try:
+        return float(value.split()[0])
+    except (ValueError, IndexError):
+        return default
+
+
+class GLMTopology:
+    """
+    Node/link graph of a GLMModel.
+
+    links maps link names to GLMLink records; adjacency maps every node to
+    [(neighbour, link name), ...] in both directions.
+    """
+
+    def __init__(self, model):
+        self.objects = objects_by_name(model)
+        self.links = {}
+        self.adjacency = defaultdict(list)
+        self._into = defaultdict(list)
+        for obj in model.objects:
+            props = obj.properties
+            if "from" not in props or "to" not in props:
+                continue
+            link = GLMLink(obj.name, obj.type, props["from"], props["to"], props.get("phases", ""))
+            self.links[obj.name] = link
+            self.adjacency[link.from_node].append((link.to_node, link.name))
+            self.adjacency[link.to_node].append((link.from_node, link.name))
+            self._into[link.to_node].append(link)
+
+    def links_into(self, node):
+        """Links whose to end is node."""
+        return self._into.get(node, [])
+
+    def feeder_link(self, node):
+        """The link feeding node (e.g. the switch in front of an EV load), or None."""
+        links = self._into.get(node)
+        return links[0] if links else None
+
+    def swing_nodes(self):
+        return [name for name, obj in self.objects.items()
+                if obj.properties.get("bustype", "").upper() == "SWING"]
+
+    def path(self, source, target):
+        """Link names along a shortest path from source to target, or None."""
+        if source == target:
+            return []
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            for neighbour, link in self.adjacency.get(node, ()):
+                if neighbour in previous:
+                    continue
+                previous[neighbour] = (node, link)
+                if neighbour == target:
+                    out = []
+                    while previous[neighbour] is not None:
+                        neighbour, link = previous[neighbour]
+                        out.append(link)
+                    return out[::-1]
+                queue.append(neighbour)
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Parse a GridLAB-D model and list its objects')
+    parser.add_argument('glm')
+    parser.add_argument('--type', help='only objects of this type')
+    parser.add_argument('--show', type=int, default=0, help='print the first N matching objects')
+    parser.add_argument('--no-includes', action='store_true', help='do not follow #include')
+    parser.add_argument('--ev', action='store_true', help='print the feeding link and phases of every EV load')
+    args = parser.parse_args()
+
+    includes = not args.no_includes
+    start = time.perf_counter()
+    model = load_glm(args.glm, includes, cache=False)
+    elapsed = time.perf_counter() - start
+    load_glm(args.glm, includes)
+    start = time.perf_counter()
+    load_glm(args.glm, includes)
+    cached = time.perf_counter() - start
+    print(f"{args.glm}: {len(model.objects)} objects, {len(model.blocks)} other blocks, "
+          f"{len(model.directives)} directives from {len(model.files)} files, "
+          f"parsed in {elapsed * 1e3:.1f} ms, cached load {cached * 1e3:.1f} ms")
+    for path, digest in model.files[1:]:
+        print(f"    include {os.path.relpath(path)}" + ("" if digest else " (missing)"))
+    objects = [o for o in model.objects if args.type is None or o.type == args.type]
+    for type_, n in Counter(o.type for o in objects).most_common():
+        print(f"    {type_:<28} {n:>6}")
+    for obj in objects[:args.show]:
+        print(f"{obj.type} {obj.name} (parent {obj.parent}): {obj.properties}")
+    if args.ev:
+        topology = GLMTopology(model)
+        swing = topology.swing_nodes()
+        for name in sorted(n for n, o in topology.objects.items() if o.type == "load" and re.match(r"EV\d", n)):
+            link = topology.feeder_link(name)
+            if link is None:
+                print(f"{name}: not connected")
+                continue
+            hops = topology.path(swing[0], name) if swing else None
+            print(f"{name}: {link.type} {link.name} from {link.from_node}, phases {link.phases}"
+                  + (f", {len(hops)} links from {swing[0]}" if hops is not None else ""))
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Parser for the T&D boundary signals gpk-left-fed.cpp writes to gpk.csv.
+
+Despite the suffix gpk.csv is free text, one block per GridPACK period:
+
+    Time (s): 5
+    S received from Gridlab-D, Sa: (re,im) Sb: (re,im) Sc: (re,im)
+    S received from Gridlab-D, Sa_2: (re,im) Sb_2: (re,im) Sc_2: (re,im)
+    Updated Vv by GridPACK, Va: (re,im) Vb: (re,im) Vc: (re,im)
+    Updated Vv by GridPACK, Va_2: (re,im) Vb_2: (re,im) Vc_2: (re,im)
+
+S is what GridPACK received from feeder A (gld_hlc_conn) and feeder A_2
+(gld_hlc_conn_2), V what it published back (gridpack/Va..Vc_2). Every block
+becomes one row of a BoundarySeries: time (n,), S and V (n, 2 feeders,
+3 phases) complex. Note that gpk-left-fed.cpp prints Vb under the Vb_2
+label, so V[:, 1, 1] repeats V[:, 0, 1] in files it wrote.
+
+The file is streamed in chunks. Each chunk of whole blocks is reduced to
+numbers with a handful of bytes.replace/translate calls and parsed by one
+np.fromstring, so a multi-day run (tens of MB) parses in well under a second.
+Blocks that do not have the usual 25 numbers (an unconnected feeder, a run
+cut short) are parsed one by one by label, with NaN for missing values.
+
+Parsed arrays are cached as .npz under .gld_cache/ next to the file. The
+cache records how far the file was parsed and a hash of that prefix, so for
+a file that is still growing only the new blocks are parsed.
+
+    python gpk_boundary.py                         # summary of gpk.csv
+    python gpk_boundary.py gpk.csv -o gpk_boundary.csv
+    python gpk_boundary.py gpk.csv --time 3600 7200 --print
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import string
+import warnings
+from collections import namedtuple
+
+import numpy as np
+
+from gld_csv import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+CHUNK_BYTES = 1 << 24
+FEEDERS = ("A", "A_2")
+SUFFIXES = ("", "_2")
+PHASES = "abc"
+# Values of a block in file order: S of both feeders, then V of both
+FIELDS = [f"{q}{ph}{sfx}" for q in "SV" for sfx in SUFFIXES for ph in PHASES]
+NUMBERS_PER_BLOCK = 1 + 2 * len(FIELDS)
+
+BLOCK_MARK = b"Time (s):"
+END_MARK = b"End of Cosimulation."
+# Label text removed before the numbers are parsed: the words with an "e"
+# (which could pass for an exponent), "-" or a digit. The remaining letters
+# and ":" are deleted by one translate, "()," become separators.
+_PHRASES = (BLOCK_MARK, b"S received from Gridlab-D,", b"Updated Vv by GridPACK,", b"_2:")
+_DELETE = bytes(string.ascii_letters, "ascii").translate(None, b"eE") + b":"
+_TO_SPACE = bytes.maketrans(b"(),", b"   ")
+_TIME_RE = re.compile(rb"Time \(s\):\s*(\S+)")
+_VALUE_RE = re.compile(rb"([SV][abc](?:_2)?):\s*\(([^,()]+),([^,()]+)\)")
+_FIELD_INDEX = {f.encode(): i for i, f in enumerate(FIELDS)}
+_FIELD_LABELS = [f.encode() for f in FIELDS]
+
+# time (n,) s; S and V (n, feeder, phase) complex, feeder 0 = A, 1 = A_2
+BoundarySeries = namedtuple("BoundarySeries", ["time", "S", "V"])
+
+
+def _empty():
+    return BoundarySeries(np.empty(0), np.empty((0, 2, 3), complex), np.empty((0, 2, 3), complex))
+
+
+def _concat(parts):
+    parts = [p for p in parts if len(p.time)]
+    if not parts:
+        return _empty()
+    if len(parts) == 1:
+        return parts[0]
+    return BoundarySeries(*(np.concatenate(arrays) for arrays in zip(*parts)))
+
+
+def _from_values(values):
+    """BoundarySeries of an (n, NUMBERS_PER_BLOCK) array of block numbers."""
+    pairs = values[:, 1::2] + 1j * values[:, 2::2]
+    pairs = pairs.reshape(len(values), 2, 2, 3)
+    return BoundarySeries(values[:, 0].copy(), pairs[:, 0].copy(), pairs[:, 1].copy())
+
+
+def _parse_blocks_by_label(buf):
+    """Slow path: every block of buf parsed by label, NaN where a value is missing."""
+    starts = [m.start() for m in re.finditer(re.escape(BLOCK_MARK), buf)]
+    values = np.full((len(starts), NUMBERS_PER_BLOCK), np.nan)
+    for k, start in enumerate(starts):
+        end = starts[k + 1] if k + 1 < len(starts) else len(buf)
+        block = buf[start:end]
+        m = _TIME_RE.match(block)
+        try:
+            values[k, 0] = float(m.group(1))
+        except (AttributeError, ValueError):
+            pass
+        for m in _VALUE_RE.finditer(block):
+            i = _FIELD_INDEX[m.group(1)]
+            try:
+                values[k, 1 + 2 * i] = float(m.group(2))
+                values[k, 2 + 2 * i] = float(m.group(3))
+            except ValueError:
+                pass
+    return _from_values(values)
+
+
+def parse_blocks(buf):
+    """BoundarySeries of the whole blocks in buf (bytes)."""
+    n_blocks = buf.count(BLOCK_MARK)
+    if not n_blocks:
+        return _empty()
+    end = buf.find(END_MARK, max(len(buf) - 256, 0))
+    text = buf[:end] if end != -1 else buf
+    for phrase in _PHRASES:
+        text = text.replace(phrase, b" ")
+    with warnings.catch_warnings():
+        # Text that is not all numbers stops the parse early; the count check below catches it
+        warnings.simplefilter("ignore", DeprecationWarning)
+        try:
+            values = np.fromstring(text.translate(_TO_SPACE, _DELETE), dtype=float, sep=" ")
+        except ValueError:
+            values = None
+    if values is not None and len(values) == n_blocks * NUMBERS_PER_BLOCK:
+        first = buf.find(b"\n\n")
+        labels = [m.group(1) for m in _VALUE_RE.finditer(buf, 0, first if first != -1 else len(buf))]
+        if labels == _FIELD_LABELS:
+            return _from_values(values.reshape(n_blocks, NUMBERS_PER_BLOCK))
+    return _parse_blocks_by_label(buf)
+
+
+def parse_stream(fh, chunk_bytes=CHUNK_BYTES):
+    """
+    (complete, tail, bytes consumed) of a binary file object from its current position.
+
+    complete holds the blocks followed by a blank line, which end at bytes
+    consumed; tail the trailing block of a file still being written (empty
+    when there is none), which is parsed again once complete.
+    """
+    parts = []
+    consumed = 0
+    rest = b""
+    while True:
+        data = fh.read(chunk_bytes)
+        buf = rest + data
+        if not data:
+            break
+        # Whole blocks only; the last one may go on in the next chunk
+        cut = buf.rfind(b"\n\n") + 2
+        if cut >= 2:
+            parts.append(parse_blocks(buf[:cut]))
+            consumed += cut
+            buf = buf[cut:]
+        rest = buf
+    tail_start = rest.find(BLOCK_MARK)
+    tail = parse_blocks(rest[tail_start:]) if tail_start != -1 else _empty()
+    return _concat(parts), tail, consumed
+
+
+def parse_gpk(path, chunk_bytes=CHUNK_BYTES):
+    """BoundarySeries of a whole gpk.csv file, without the cache."""
+    with open(path, "rb") as fh:
+        complete, tail, _ = parse_stream(fh, chunk_bytes)
+    return _concat([complete, tail])
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+def _cache_path(path):
+    head, tail = os.path.split(os.path.abspath(path))
+    return os.path.join(head, CACHE_DIR, tail + ".boundary.npz")
+
+
+def _prefix_hash(path, length):
+    """SHA-1 of the first and the last 64 kB of the first length bytes of path."""
+    sha = hashlib.sha1()
+    with open(path, "rb") as fh:
+        sha.update(fh.read(min(length, 1 << 16)))
+        fh.seek(max(length - (1 << 16), 0))
+        sha.update(fh.read(min(length, 1 << 16)))
+    return sha.hexdigest()
+
+
+def _load_cache(path):
+    try:
+        with np.load(_cache_path(path), allow_pickle=False) as npz:
+            header = json.loads(str(npz["__header__"]))
+            if header["version"] != CACHE_VERSION or header["path"] != os.path.abspath(path):
+                return None
+            return header, BoundarySeries(npz["time"], npz["S"], npz["V"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_cache(path, series, consumed, st):
+    cache = _cache_path(path)
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    header = {"version": CACHE_VERSION, "path": os.path.abspath(path), "consumed": consumed,
+              "prefix_sha1": _prefix_hash(path, consumed), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    tmp = cache + ".tmp.npz"
+    np.savez(tmp, __header__=np.array(json.dumps(header)), time=series.time, S=series.S, V=series.V)
+    os.replace(tmp, cache)
+
+
+def load_gpk(path="gpk.csv", cache=True):
+    """
+    BoundarySeries of gpk.csv through the .gld_cache sidecar.
+
+    An unchanged file is loaded from the cache; a file that grew since (same
+    prefix up to where the cache stopped) is only parsed from there.
+    """
+    if not cache:
+        return parse_gpk(path)
+    st = os.stat(path)
+    cached = _load_cache(path)
+    start, known = 0, _empty()
+    if cached is not None:
+        header, series = cached
+        consumed = header["consumed"]
+        if consumed <= st.st_size and _prefix_hash(path, consumed) == header["prefix_sha1"]:
+            start, known = consumed, series
+            if header["size"] == st.st_size and header["mtime_ns"] == st.st_mtime_ns and consumed == st.st_size:
+                return known
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        new, tail, consumed = parse_stream(fh)
+    complete = _concat([known, new])
+    if len(new.time) or cached is None or start == 0:
+        try:
+            _save_cache(path, complete, start + consumed, st)
+        except OSError as e:
+            logger.warning(f"Could not write cache for {path}: {e}")
+    return _concat([complete, tail])
+
+
+# ---------------------------------------------------------------------------
+# Output
+# ---------------------------------------------------------------------------
+def columns(series):
+    """{name: 1-D array}: time, then <field>_real/<field>_imag for Sa..Vc_2, as in the file labels."""
+    out = {"time": series.time}
+    for q, arrays in (("S", series.S), ("V", series.V)):
+        for f, sfx in enumerate(SUFFIXES):
+            for p, ph in enumerate(PHASES):
+                out[f"{q}{ph}{sfx}_real"] = arrays[:, f, p].real
+                out[f"{q}{ph}{sfx}_imag"] = arrays[:, f, p].imag
+    return out
+
+
+def select(series, first=None, last=None):
+    """Blocks with first <= time <= last (the file is in time order)."""
+    lo = 0 if first is None else int(np.searchsorted(series.time, first, side="left"))
+    hi = len(series.time) if last is None else int(np.searchsorted(series.time, last, side="right"))
+    return BoundarySeries(*(a[lo:hi] for a in series))
+
+
+def write_series(series, out_path):
+    """Write a BoundarySeries as .tlm (telemetry_recorder format) or CSV; returns the rows written."""
+    data = columns(series)
+    names = list(data)
+    table = np.column_stack([data[n] for n in names]) if len(series.time) else np.empty((0, len(names)))
+    if out_path.endswith(".tlm"):
+        from telemetry_recorder import TelemetryRecorder
+        with TelemetryRecorder(out_path, names, max(len(table), 1)) as recorder:
+            for row in table:
+                recorder.append(row)
+    else:
+        with open(out_path, "w") as out:
+            out.write(",".join(names) + "\n")
+            np.savetxt(out, table, delimiter=",", fmt="%.9g")
+    return len(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Parse the T&D boundary signals of gpk.csv into arrays')
+    parser.add_argument('path', nargs='?', default='gpk.csv')
+    parser.add_argument('-o', '--output', help='write the series to this .csv or .tlm file')
+    parser.add_argument('--time', nargs=2, type=float, metavar=('FIRST', 'LAST'), help='only blocks in [FIRST, LAST] s')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--print', action='store_true', help='print every block')
+    args = parser.parse_args()
+
+    series = load_gpk(args.path, cache=not args.no_cache)
+    if args.time:
+        series = select(series, *args.time)
+    n = len(series.time)
+    print(f"{args.path}: {n} blocks" + (f", t = {series.time[0]:g} .. {series.time[-1]:g} s" if n else ""))
+    for q, arrays in (("S", series.S), ("V", series.V)):
+        for f, feeder in enumerate(FEEDERS):
+            mags = np.abs(arrays[:, f, :])
+            desc = ", ".join(f"{ph} {np.nanmin(mags[:, p]):.6g}..{np.nanmax(mags[:, p]):.6g}" if n else f"{ph} -"
+                             for p, ph in enumerate(PHASES))
+            print(f"  |{q}| feeder {feeder:<4} {desc}")
+    if args.print:
+        for k in range(n):
+            print(f"t={series.time[k]:g}  S={series.S[k].ravel().tolist()}  V={series.V[k].ravel().tolist()}")
+    if args.output:
+        print(f"{write_series(series, args.output)} rows written to {args.output}")
@@ -1,49 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming parser for the GridPACK federate log (gridpack.log).
+
+The log is streamed in fixed-size chunks and never held in memory. Every power-flow
+solution ("Bus Voltages and Phase Angles" table) is yielded as one
+PowerFlowSolution with NumPy arrays of bus numbers, voltage magnitudes (pu)
+and phase angles (degrees), tagged with the HELICS time granted before it and
+the Newton iteration count it converged in.
+
+    python gridpack_log_output.py                       # summary per solution
+    python gridpack_log_output.py --print               # every bus, as before
+    python gridpack_log_output.py -o gridpack_voltages.csv --time 5 10
+    python gridpack_log_output.py -o gridpack_voltages.tlm --iterations 0 99
+
+An output path ending in .tlm is written in the columnar format of
+telemetry_recorder, anything else as CSV; either way one row per bus per
+solution is streamed out, so the whole run can be converted in bounded
+memory.
+"""
+import argparse
+import math
 import re
+from collections import namedtuple
+
+import numpy as np
 
 log_file_path = 'gridpack.log'  # Replace with your actual file name
 
-# Store the data in a list of dicts per iteration
-iterations_data = []
-
-with open(log_file_path, 'r') as file:
-    lines = file.readlines()
-
-i = 0
-while i < len(lines):
-    line = lines[i]
-    
-    # Detect iteration header
-    if line.startswith("Iteration"):
-        iteration_num = int(re.search(r"Iteration\s+(\d+)", line).group(1))
-        iteration_info = {"iteration": iteration_num, "buses": []}
-        
-        # Look for the bus voltage section
-        while i < len(lines) and not lines[i].strip().startswith("Bus Voltages and Phase Angles"):
-            i += 1
-        
-        i += 2  # Skip the header lines under "Bus Voltages and Phase Angles"
-
-        # Read bus values
-        while i < len(lines) and lines[i].strip() != "":
-            match = re.match(r"\s*(\d+)\s+([-.\d]+)\s+([-.\d]+)", lines[i])
-            if match:
-                bus_num = int(match.group(1))
-                phase_angle = float(match.group(2))
-                voltage_mag = float(match.group(3))
-                iteration_info["buses"].append({
-                    "bus": bus_num,
-                    "voltage_mag": voltage_mag,
-                    "phase_angle": phase_angle
-                })
-            i += 1
-
-        iterations_data.append(iteration_info)
-    
-    i += 1
-
-# Example: print results for each iteration
-for it in iterations_data:
-    print(f"Iteration {it['iteration']}")
-    for bus in it["buses"]:
-        print(f"Bus {bus['bus']}: V = {bus['voltage_mag']}, θ = {bus['phase_angle']}")
-    print()
+# The log is scanned in large binary chunks: bytes.find locates the few
+# interesting lines, and the precompiled patterns below only run there
+CHUNK_BYTES = 1 << 24
+GRANTED_MARK = b"Granted Time="
+ITERATION_MARK = b"\nIteration"
+TABLE_MARK = b"Bus Number"
+GRANTED_RE = re.compile(rb"Granted Time=(-?[\d.]+)")
+ITERATION_RE = re.compile(rb"Iteration\s+(\d+)")
+TABLE_RE = re.compile(rb"Bus Number[^\n]*\n((?:[ \t]*\d[^\n]*\n)*)")
+_GRANTED, _ITERATION, _TABLE = range(3)
+
+OUTPUT_COLUMNS = ["index", "time", "iteration", "bus", "phase_angle", "voltage_mag"]
+
+PowerFlowSolution = namedtuple(
+    "PowerFlowSolution", ["index", "time", "iteration", "bus", "voltage_mag", "phase_angle"]
+)
+
+
+def _bus_table(rows):
+    """bus, voltage magnitude and angle arrays from the raw rows of one table."""
+    values = np.array(rows.split(), dtype=float).reshape(-1, 3)
+    return values[:, 0].astype(np.int64), values[:, 2], values[:, 1]
+
+
+def _events(buf):
+    """(position, kind) of every marker in buf, in file order."""
+    events = []
+    for mark, kind in ((GRANTED_MARK, _GRANTED), (ITERATION_MARK, _ITERATION), (TABLE_MARK, _TABLE)):
+        pos = buf.find(mark)
+        while pos != -1:
+            events.append((pos, kind))
+            pos = buf.find(mark, pos + 1)
+    events.sort()
+    return events
+
+
+def iter_solutions(path=log_file_path, time_range=None, index_range=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Yield every power-flow solution in the log as a PowerFlowSolution.
+
+    index counts solutions from 0 in log order; time is the last HELICS
+    granted time before the solution (NaN before the first grant).
+    time_range and index_range are inclusive (first, last) filters. Tables
+    outside them are skipped without being parsed, and reading stops once
+    either range is exhausted (granted times never decrease). Memory use is
+    bounded by chunk_bytes.
+    """
+    t_lo, t_hi = time_range if time_range else (-math.inf, math.inf)
+    i_lo, i_hi = index_range if index_range else (0, math.inf)
+    granted = math.nan
+    iteration = -1
+    index = -1
+    with open(path, "rb") as fh:
+        rest = b""
+        while True:
+            data = fh.read(chunk_bytes)
+            eof = not data
+            # Every buffer starts at a line start: the leading newline lets
+            # ITERATION_MARK match a line that opens the buffer
+            buf = b"\n" + rest + data
+            rest = b""
+            if not eof:
+                # Only whole lines are scanned; the tail waits for the next chunk
+                cut = buf.rfind(b"\n") + 1
+                buf, rest = buf[:cut], buf[cut:]
+            for pos, kind in _events(buf):
+                if kind == _GRANTED:
+                    m = GRANTED_RE.match(buf, pos)
+                    if m:
+                        granted = float(m.group(1))
+                        if granted > t_hi:
+                            return
+                elif kind == _ITERATION:
+                    iteration = int(ITERATION_RE.match(buf, pos + 1).group(1))
+                else:
+                    m = TABLE_RE.match(buf, pos)
+                    if m.end() == len(buf) and not eof:
+                        # The table may go on in the next chunk
+                        rest = buf[pos:] + rest
+                        break
+                    index += 1
+                    if index > i_hi:
+                        return
+                    if index >= i_lo and t_lo <= granted <= t_hi:
+                        bus, vmag, angle = _bus_table(m.group(1))
+                        yield PowerFlowSolution(index, granted, iteration, bus, vmag, angle)
+            if eof:
+                return
+
+
+def write_solutions(solutions, out_path):
+    """Stream solutions to a .tlm or CSV file; returns the number written."""
+    n = 0
+    if out_path.endswith(".tlm"):
+        from telemetry_recorder import TelemetryRecorder
+        with TelemetryRecorder(out_path, OUTPUT_COLUMNS, 4096) as recorder:
+            for sol in solutions:
+                for row in _rows(sol):
+                    recorder.append(row)
+                n += 1
+        return n
+    with open(out_path, "w") as out:
+        out.write(",".join(OUTPUT_COLUMNS) + "\n")
+        for sol in solutions:
+            np.savetxt(out, _rows(sol), delimiter=",", fmt=["%d", "%.17g", "%d", "%d", "%.6f", "%.6f"])
+            n += 1
+    return n
+
+
+def _rows(sol):
+    k = len(sol.bus)
+    return np.column_stack([
+        np.full(k, sol.index), np.full(k, sol.time), np.full(k, sol.iteration),
+        sol.bus, sol.phase_angle, sol.voltage_mag,
+    ])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Parse bus voltages out of gridpack.log')
+    parser.add_argument('log', nargs='?', default=log_file_path)
+    parser.add_argument('-o', '--output', help='write every solution to this .csv or .tlm file')
+    parser.add_argument('--time', nargs=2, type=float, metavar=('FIRST', 'LAST'),
+                        help='only solutions whose granted time is in [FIRST, LAST] s')
+    parser.add_argument('--iterations', nargs=2, type=int, metavar=('FIRST', 'LAST'),
+                        help='only solutions number FIRST..LAST (0-based, log order)')
+    parser.add_argument('--print', action='store_true', help='print every bus value')
+    args = parser.parse_args()
+
+    solutions = iter_solutions(args.log, args.time, args.iterations)
+    if args.output:
+        n = write_solutions(solutions, args.output)
+        print(f"{n} solutions written to {args.output}")
+    else:
+        for sol in solutions:
+            print(f"Iteration {sol.index} (t = {sol.time:g} s, {sol.iteration} Newton iterations)")
+            if args.print:
+                for bus, vmag, angle in zip(sol.bus.tolist(), sol.voltage_mag.tolist(), sol.phase_angle.tolist()):
+                    print(f"Bus {bus}: V = {vmag}, θ = {angle}")
+            else:
+                print(f"  {len(sol.bus)} buses, V = {sol.voltage_mag.min():.6f} .. {sol.voltage_mag.max():.6f} pu")
+            print()
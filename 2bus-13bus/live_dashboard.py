@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Out-of-process live dashboard for the EV controllers.
+
+The controller pushes one row per step (EV outputs, time, feeder load) into a
+fixed-size ring buffer in shared memory; push() is a row copy plus a counter
+update. The dashboard runs in its own process, reads the ring at its own
+frame rate and redraws with matplotlib, so rendering never blocks the
+federate.
+
+Shared memory layout (all little-endian):
+    int64 write count | int64 ncols | int64 capacity | int64 done flag
+    int64 header length | JSON {"columns": [...]} | pad to 8 bytes
+    float64[capacity, ncols] rows
+
+Attach to a running controller from another shell with
+    python live_dashboard.py <shared memory name>
+"""
+import argparse
+import json
+import logging
+import multiprocessing as mp
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_FIXED = 5 * 8
+DEFAULT_CAPACITY = 4096
+MAX_EV_PANELS = 6
+
+
+class RingBuffer:
+    """Fixed-size shared-memory ring of float64 rows."""
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self._meta = np.ndarray((5,), dtype="<i8", buffer=shm.buf)
+        ncols, capacity, header_len = int(self._meta[1]), int(self._meta[2]), int(self._meta[4])
+        self.columns = json.loads(bytes(shm.buf[_FIXED:_FIXED + header_len]).decode())["columns"]
+        offset = _FIXED + (header_len + 7) // 8 * 8
+        self.data = np.ndarray((capacity, ncols), dtype="<f8", buffer=shm.buf, offset=offset)
+        self.capacity = capacity
+
+    @classmethod
+    def create(cls, columns, capacity=DEFAULT_CAPACITY, name=None):
+        header = json.dumps({"columns": list(columns)}).encode()
+        offset = _FIXED + (len(header) + 7) // 8 * 8
+        shm = shared_memory.SharedMemory(name=name, create=True,
+                                         size=offset + 8 * capacity * len(columns))
+        meta = np.ndarray((5,), dtype="<i8", buffer=shm.buf)
+        meta[:] = (0, len(columns), capacity, 0, len(header))
+        shm.buf[_FIXED:_FIXED + len(header)] = header
+        del meta
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name, standalone=False):
+        """
+        Attach to an existing ring. A standalone process (not started by the
+        creator) has its own resource tracker, which would otherwise unlink
+        the segment when the dashboard exits.
+        """
+        shm = shared_memory.SharedMemory(name=name)
+        if standalone:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def count(self):
+        return int(self._meta[0])
+
+    @property
+    def done(self):
+        return bool(self._meta[3])
+
+    def push(self, row):
+        """Write one row; O(1), overwrites the oldest row when full."""
+        n = self._meta[0]
+        self.data[n % self.capacity] = row
+        self._meta[0] = n + 1
+
+    def finish(self):
+        """Tell readers no more rows will come."""
+        self._meta[3] = 1
+
+    def snapshot(self):
+        """Copy of the buffered rows, oldest first."""
+        n = self.count
+        if n <= self.capacity:
+            return self.data[:n].copy()
+        start = n % self.capacity
+        rows = np.concatenate([self.data[start:], self.data[:start]])
+        # Drop rows the writer overwrote while we were copying
+        overwritten = self.count - n
+        return rows[overwritten:] if overwritten else rows
+
+    def close(self):
+        del self._meta, self.data
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def run_dashboard(name, fps=5.0, time_column="time", load_column=None, standalone=False):
+    """Dashboard process body: poll the ring and redraw until it is done."""
+    import matplotlib.pyplot as plt
+
+    ring = RingBuffer.attach(name, standalone)
+    columns = ring.columns
+    load_column = load_column or columns[-1]
+    ev_columns = [c for c in columns if c not in (time_column, load_column)]
+    t_idx, load_idx = columns.index(time_column), columns.index(load_column)
+    ev_idx = [columns.index(c) for c in ev_columns[:MAX_EV_PANELS]]
+
+    plt.ion()
+    fig = plt.figure()
+    fig.subplots_adjust(hspace=0.4, wspace=0.4)
+    feeder_ax = fig.add_subplot(313)
+    feeder_line, = feeder_ax.plot([], [])
+    feeder_ax.set_ylabel("Feeder Load (MW)")
+    feeder_ax.set_xlabel("Time (Hours)")
+    feeder_ax.grid()
+    ev_lines = []
+    for i, idx in enumerate(ev_idx):
+        ax = fig.add_subplot(3, 3, i + 1)
+        ax.set_title(columns[idx])
+        ax.set_ylabel("EV Output (kW)")
+        ax.set_xlabel("Time (Hours)")
+        ax.grid()
+        ev_lines.append((ax, ax.plot([], [])[0], idx))
+
+    interactive = plt.get_backend().lower() != "agg"
+    while True:
+        done = ring.done
+        rows = ring.snapshot()
+        if len(rows):
+            feeder_line.set_data(rows[:, t_idx], rows[:, load_idx] / 1e6)
+            feeder_ax.relim()
+            feeder_ax.autoscale_view()
+            for ax, line, idx in ev_lines:
+                line.set_data(rows[:, t_idx], rows[:, idx])
+                ax.relim()
+                ax.autoscale_view()
+        if done or not plt.fignum_exists(fig.number):
+            break
+        plt.pause(1.0 / fps)
+    ring.close()
+    if interactive and plt.fignum_exists(fig.number):
+        plt.ioff()
+        plt.show()
+
+
+def start_dashboard(ring, fps=5.0, **kwargs):
+    """Start run_dashboard on ring in a daemon process and return it."""
+    ctx = mp.get_context("spawn")
+    proc = ctx.Process(target=run_dashboard, args=(ring.name, fps), kwargs=kwargs, daemon=True)
+    proc.start()
+    logger.info(f"Live dashboard started (pid {proc.pid}) on shared memory {ring.name}")
+    return proc
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Live EV controller dashboard')
+    parser.add_argument('name', help='shared memory name printed by the controller')
+    parser.add_argument('--fps', type=float, default=5.0)
+    args = parser.parse_args()
+    run_dashboard(args.name, args.fps, standalone=True)
@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+"""
+In-process stand-in for the helics calls made by the Python federates.
+
+Drop-in for benchmarks and offline runs: pass it as the api argument
+(EVFleet, SetpointDispatcher, the clocks, run_surrogate) or install it under
+the helics name before a script imports helics:
+
+    import sys, mock_helics
+    sys.modules["helics"] = mock_helics
+    mock_helics.add_peer(feeder_step, period=60)
+
+There is no broker and no time coordination. Every federate lives in one
+module-level federation: publications reach the inputs subscribed to their
+key at once, and endpoint messages are queued on the destination endpoint if
+it is registered (otherwise counted as dropped). The other side of the
+co-simulation is played by peers, callables run for each of their periodic
+times that a time request reaches or passes. A peer publishes and sends
+through this same module, or queues messages with deliver().
+
+helicsFederateRequestTime grants the requested time; a request for
+HELICS_TIME_MAXTIME is granted at the next peer time, so the event-driven
+clock works too. reset() clears the federation between runs.
+"""
+import heapq
+import itertools
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+HELICS_TIME_MAXTIME = 9223372036.854774
+HELICS_TIME_ZERO = 0.0
+
+HELICS_CORE_TYPE_DEFAULT = 0
+HELICS_CORE_TYPE_ZMQ = 1
+HELICS_CORE_TYPE_TEST = 3
+HELICS_CORE_TYPE_INPROC = 18
+
+HELICS_DATA_TYPE_STRING = 0
+HELICS_DATA_TYPE_DOUBLE = 1
+HELICS_DATA_TYPE_INT = 2
+HELICS_DATA_TYPE_COMPLEX = 3
+
+HELICS_FLAG_UNINTERRUPTIBLE = 1
+HELICS_FLAG_OBSERVER = 0
+HELICS_HANDLE_OPTION_ONLY_UPDATE_ON_CHANGE = 454
+
+_VERSION = "mock (helics API subset)"
+
+
+class MockFederateInfo:
+    def __init__(self):
+        self.core_type = "mock"
+        self.core_init = ""
+        self.flags = {}
+
+
+class MockMessage:
+    __slots__ = ("data", "source", "destination", "time")
+
+    def __init__(self, data, source, destination, time):
+        self.data = data
+        self.source = source
+        self.destination = destination
+        self.time = time
+
+
+class MockPublication:
+    def __init__(self, fed, key, units):
+        self.fed = fed
+        self.key = key
+        self.units = units
+        self.value = None
+
+
+class MockInput:
+    def __init__(self, fed, target, units):
+        self.fed = fed
+        self.target = target
+        self.units = units
+        self.value = 0j
+        self.updated = False
+        self.only_on_change = False
+        self.min_change = 0.0
+
+
+class MockEndpoint:
+    def __init__(self, fed, name, destination=""):
+        self.fed = fed
+        self.name = name
+        self.destination = destination
+        self.queue = []
+        self.head = 0
+
+    def pending(self):
+        return len(self.queue) - self.head
+
+
+class MockFederate:
+    def __init__(self, name):
+        self.name = name
+        self.publications = []
+        self.inputs = []
+        self.endpoints = []
+        self.granted = -1.0
+        self.state = "created"
+
+
+class _Federation:
+    """Registry of every mock federate, publication, input and endpoint."""
+
+    def __init__(self):
+        self.federates = []
+        self.publications = {}
+        self.inputs = {}
+        self.endpoints = {}
+        # Heap of (next time, sequence, period, stop, step) peer entries
+        self.peers = []
+        self.sequence = itertools.count()
+        self.peer_time = -1.0
+        self.sent = 0
+        self.dropped = 0
+
+    def run_peers(self, until):
+        """Run every peer time <= until that has not run yet."""
+        while self.peers and self.peers[0][0] <= until:
+            t, seq, period, stop, step = heapq.heappop(self.peers)
+            self.peer_time = t
+            if step(t) is not False and t + period < stop:
+                heapq.heappush(self.peers, (t + period, seq, period, stop, step))
+
+    def next_peer_time(self):
+        return self.peers[0][0] if self.peers else HELICS_TIME_MAXTIME
+
+
+_federation = _Federation()
+
+
+def reset():
+    """Forget every federate, peer and counter."""
+    global _federation
+    _federation = _Federation()
+
+
+def add_peer(step, period, start=0.0, stop=HELICS_TIME_MAXTIME):
+    """
+    Run step(t) at t = start, start + period, ... (< stop) as time requests reach them.
+
+    step returning False removes the peer.
+    """
+    heapq.heappush(_federation.peers,
+                   (float(start), next(_federation.sequence), float(period), float(stop), step))
+
+
+def deliver(endpoint, data, time=None, source=""):
+    """Queue a message with payload data (from source) on the endpoint named endpoint."""
+    ep = _federation.endpoints.get(endpoint)
+    if ep is None:
+        _federation.dropped += 1
+        return False
+    if isinstance(data, str):
+        data = data.encode()
+    ep.queue.append(MockMessage(data, source, endpoint, _federation.peer_time if time is None else time))
+    return True
+
+
+def publish(key, value):
+    """Set every input subscribed to key, as a publication would."""
+    for sub in _federation.inputs.get(key, ()):
+        if sub.only_on_change and abs(value - sub.value) <= sub.min_change:
+            continue
+        sub.value = value
+        sub.updated = True
+
+
+def stats():
+    """Messages sent and dropped (no destination endpoint) so far."""
+    return {"sent": _federation.sent, "dropped": _federation.dropped}
+
+
+# ---------------------------------------------------------------------------
+# Library, broker and federate info
+# ---------------------------------------------------------------------------
+
+def helicsGetVersion():
+    return _VERSION
+
+
+def helicsCloseLibrary():
+    pass
+
+
+def helicsCreateBroker(core_type, name, init_string):
+    return name
+
+
+def helicsBrokerWaitForDisconnect(broker, ms_timeout):
+    return True
+
+
+def helicsBrokerFree(broker):
+    pass
+
+
+def helicsCreateFederateInfo():
+    return MockFederateInfo()
+
+
+def helicsFederateInfoSetCoreType(fi, core_type):
+    fi.core_type = core_type
+
+
+def helicsFederateInfoSetCoreTypeFromString(fi, core_type):
+    fi.core_type = core_type
+
+
+def helicsFederateInfoSetCoreInitString(fi, core_init):
+    fi.core_init = core_init
+
+
+def helicsFederateInfoSetFlagOption(fi, flag, value):
+    fi.flags[flag] = value
+
+
+# ---------------------------------------------------------------------------
+# Federates and registration
+# ---------------------------------------------------------------------------
+
+def _create_federate(name, fi=None):
+    fed = MockFederate(name)
+    _federation.federates.append(fed)
+    return fed
+
+
+helicsCreateCombinationFederate = _create_federate
+helicsCreateValueFederate = _create_federate
+helicsCreateMessageFederate = _create_federate
+
+
+def helicsCreateCombinationFederateFromConfig(config):
+    """Federate with the publications, subscriptions and endpoints of a JSON config."""
+    if isinstance(config, str) and not config.lstrip().startswith("{"):
+        with open(config) as fh:
+            config = json.load(fh)
+    elif isinstance(config, str):
+        config = json.loads(config)
+    fed = _create_federate(config.get("name", "mock_federate"))
+    for pub in config.get("publications", []):
+        helicsFederateRegisterGlobalPublication(fed, pub["key"], HELICS_DATA_TYPE_STRING, pub.get("unit", ""))
+    for sub in config.get("subscriptions", []):
+        helicsFederateRegisterSubscription(fed, sub["key"], sub.get("unit", ""))
+    for ep in config.get("endpoints", []):
+        handle = helicsFederateRegisterGlobalEndpoint(fed, ep["key"], ep.get("type", ""))
+        handle.destination = ep.get("destination", "")
+    return fed
+
+
+helicsCreateValueFederateFromConfig = helicsCreateCombinationFederateFromConfig
+
+
+def helicsFederateGetName(fed):
+    return fed.name
+
+
+def helicsFederateRegisterGlobalPublication(fed, key, data_type=HELICS_DATA_TYPE_COMPLEX, units=""):
+    pub = MockPublication(fed, key, units)
+    fed.publications.append(pub)
+    _federation.publications[key] = pub
+    return pub
+
+
+def helicsFederateRegisterPublication(fed, key, data_type=HELICS_DATA_TYPE_COMPLEX, units=""):
+    return helicsFederateRegisterGlobalPublication(fed, f"{fed.name}/{key}", data_type, units)
+
+
+def helicsFederateRegisterSubscription(fed, target, units=""):
+    sub = MockInput(fed, target, units)
+    fed.inputs.append(sub)
+    _federation.inputs.setdefault(target, []).append(sub)
+    pub = _federation.publications.get(target)
+    if pub is not None and pub.value is not None:
+        sub.value = pub.value
+    return sub
+
+
+def helicsFederateRegisterGlobalEndpoint(fed, name, endpoint_type=""):
+    ep = MockEndpoint(fed, name)
+    fed.endpoints.append(ep)
+    _federation.endpoints[name] = ep
+    return ep
+
+
+def helicsFederateRegisterEndpoint(fed, name, endpoint_type=""):
+    return helicsFederateRegisterGlobalEndpoint(fed, f"{fed.name}/{name}", endpoint_type)
+
+
+def helicsFederateGetEndpointCount(fed):
+    return len(fed.endpoints)
+
+
+def helicsFederateGetEndpointByIndex(fed, index):
+    return fed.endpoints[index]
+
+
+def helicsFederateGetInputCount(fed):
+    return len(fed.inputs)
+
+
+def helicsFederateGetInputByIndex(fed, index):
+    return fed.inputs[index]
+
+
+def helicsFederateGetPublicationCount(fed):
+    return len(fed.publications)
+
+
+def helicsFederateGetPublicationByIndex(fed, index):
+    return fed.publications[index]
+
+
+# ---------------------------------------------------------------------------
+# Time and life cycle
+# ---------------------------------------------------------------------------
+
+def helicsFederateEnterExecutingMode(fed):
+    fed.state = "executing"
+    fed.granted = 0.0
+    _federation.run_peers(0.0)
+
+
+def helicsFederateRequestTime(fed, requested):
+    """Grant requested (or the next peer time for MAXTIME) after running the peers up to it."""
+    if requested >= HELICS_TIME_MAXTIME:
+        requested = max(_federation.next_peer_time(), fed.granted)
+    _federation.run_peers(requested)
+    fed.granted = float(requested)
+    return fed.granted
+
+
+def helicsFederatePendingMessageCount(fed):
+    return sum(ep.pending() for ep in fed.endpoints)
+
+
+def helicsFederateDisconnect(fed):
+    fed.state = "finalized"
+
+
+helicsFederateFinalize = helicsFederateDisconnect
+
+
+def helicsFederateDestroy(fed):
+    helicsFederateDisconnect(fed)
+    helicsFederateFree(fed)
+
+
+def helicsFederateFree(fed):
+    if fed in _federation.federates:
+        _federation.federates.remove(fed)
+
+
+# ---------------------------------------------------------------------------
+# Values
+# ---------------------------------------------------------------------------
+
+def helicsPublicationPublishComplex(pub, real, imag=0.0):
+    pub.value = complex(real, imag)
+    publish(pub.key, pub.value)
+
+
+def helicsPublicationPublishDouble(pub, value):
+    helicsPublicationPublishComplex(pub, value, 0.0)
+
+
+def helicsPublicationPublishString(pub, value):
+    pub.value = value
+    for sub in _federation.inputs.get(pub.key, ()):
+        sub.value = value
+        sub.updated = True
+
+
+def helicsInputSetDefaultComplex(sub, real, imag=0.0):
+    if not sub.updated:
+        sub.value = complex(real, imag)
+
+
+def helicsInputSetOption(sub, option, value):
+    if option == HELICS_HANDLE_OPTION_ONLY_UPDATE_ON_CHANGE:
+        sub.only_on_change = bool(value)
+
+
+def helicsInputSetMinimumChange(sub, tolerance):
+    sub.min_change = float(tolerance)
+
+
+def helicsInputGetTarget(sub):
+    return sub.target
+
+
+def helicsInputIsUpdated(sub):
+    return sub.updated
+
+
+def helicsInputGetComplex(sub):
+    sub.updated = False
+    return sub.value
+
+
+def helicsInputGetDouble(sub):
+    sub.updated = False
+    return sub.value.real
+
+
+def helicsInputGetString(sub):
+    sub.updated = False
+    return str(sub.value)
+
+
+# ---------------------------------------------------------------------------
+# Messages
+# ---------------------------------------------------------------------------
+
+def helicsEndpointGetName(ep):
+    return ep.name
+
+
+def helicsEndpointSetDefaultDestination(ep, destination):
+    ep.destination = destination
+
+
+def helicsEndpointGetDefaultDestination(ep):
+    return ep.destination
+
+
+def helicsEndpointSendBytesTo(ep, data, destination):
+    _federation.sent += 1
+    target = _federation.endpoints.get(destination)
+    if target is None:
+        _federation.dropped += 1
+        return
+    if isinstance(data, str):
+        data = data.encode()
+    target.queue.append(MockMessage(data, ep.name, destination, ep.fed.granted))
+
+
+def helicsEndpointSendBytes(ep, data):
+    helicsEndpointSendBytesTo(ep, data, ep.destination)
+
+
+def helicsEndpointHasMessage(ep):
+    return ep.head < len(ep.queue)
+
+
+def helicsEndpointPendingMessageCount(ep):
+    return ep.pending()
+
+
+def helicsEndpointGetMessage(ep):
+    msg = ep.queue[ep.head]
+    ep.head += 1
+    if ep.head == len(ep.queue):
+        ep.queue.clear()
+        ep.head = 0
+    return msg
+
+
+def helicsMessageGetBytes(msg):
+    return msg.data
+
+
+def helicsMessageGetString(msg):
+    return msg.data.decode()
+
+
+def helicsMessageGetSource(msg):
+    return msg.source
+
+
+def helicsMessageGetTime(msg):
+    return msg.time
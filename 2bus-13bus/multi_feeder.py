@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+One controller federate for any number of feeders.
+
+The feeders are not hard-coded: discover_feeders() reads the endpoints and
+subscriptions registered on the federate (from its JSON config) and groups
+them by the federate they point at. An endpoint whose destination is
+gld_hlc_conn_2/EV4 is EV4 of feeder gld_hlc_conn_2. A subscription to
+gld_hlc_conn_2/Sb is one of the load inputs of that feeder. Every feeder
+becomes an EVFleet with its own setpoint table and limits (FEEDER_POLICIES,
+which reproduces 1bc_EV_Controller.py for feeder A and 1bc_EV_Controller_2.py
+for feeder B).
+
+MultiFeederFleet evaluates the policy of all feeders in one classify_load()
+call per step. Reading and sending stay one HELICS call per endpoint; with
+workers > 1 the feeders are split into contiguous slices and drained and
+commanded on a thread pool. This pays off with many feeders, because the
+HELICS library releases the GIL during those calls.
+
+1c_Control_multi.json is the union of 1c_Control.json and 1c_Control_2.json,
+so one process controls both feeders. The feeder-B GridLAB-D model has no EV
+endpoints (mainglm_2.json), so its EVs are commanded but report nothing back
+until endpoints like those of mainglm.json are added there.
+
+    python multi_feeder.py                          # federate from 1c_Control_multi.json
+    python multi_feeder.py --list                   # feeders and EVs found in the config
+    python multi_feeder.py --inproc 8 --workers 4   # 8 surrogate feeders and this controller in one process
+
+Environment (federate mode): CONTROLLER_INTERVAL_SEC, CONTROLLER_TIME_MODE,
+CONTROLLER_WAKE_DELTA_VA and CONTROLLER_MESSAGE_ENCODING as in the
+single-feeder controller, and CONTROLLER_FEEDER_WORKERS for the pool size.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ev_fleet import (
+    EVFleet, BRANCH_NAMES, LOW_LOAD, classify_load, primary_setpoint_table, secondary_setpoint_table,
+    upper_is_overload,
+)
+from ev_messages import STRING
+
+logger = logging.getLogger(__name__)
+
+# Endpoints and inputs of one feeder, as found on the federate
+FeederGroup = namedtuple("FeederGroup", ["name", "ev_names", "endpoints", "inputs"])
+# Setpoint table factory (n_evs -> (3, n_evs) W) and limits (W) of one feeder
+FeederPolicy = namedtuple("FeederPolicy", ["table_factory", "lower", "upper"])
+
+FEEDER_POLICIES = {
+    "gld_hlc_conn": FeederPolicy(primary_setpoint_table, 2.6e6, 4.8e6),
+    "gld_hlc_conn_2": FeederPolicy(secondary_setpoint_table, 2.6e6, 4.2e6),
+}
+DEFAULT_POLICY = FeederPolicy(primary_setpoint_table, 2.6e6, 4.8e6)
+
+
+def split_target(target):
+    """("gld_hlc_conn_2", "EV4") of "gld_hlc_conn_2/EV4"; a key without "/" is its own feeder."""
+    feeder, _, leaf = target.rpartition("/")
+    return (feeder, leaf) if feeder else (target, target)
+
+
+def group_targets(endpoint_targets, input_targets):
+    """
+    {feeder: ([(endpoint index, EV name), ...], [input index, ...])} in first-seen order.
+
+    endpoint_targets are the destinations of the controller endpoints and
+    input_targets the keys the inputs subscribe to.
+    """
+    groups = {}
+    for i, target in enumerate(endpoint_targets):
+        feeder, ev = split_target(target)
+        groups.setdefault(feeder, ([], []))[0].append((i, ev))
+    for i, target in enumerate(input_targets):
+        feeder, _ = split_target(target)
+        groups.setdefault(feeder, ([], []))[1].append(i)
+    return groups
+
+
+def feeders_in_config(path):
+    """{feeder: {"evs": [...], "inputs": [...]}} of a federate JSON config, without HELICS."""
+    with open(path) as fh:
+        config = json.load(fh)
+    endpoints = config.get("endpoints", [])
+    targets = [ep.get("destination") or ep.get("key") or ep.get("name", "") for ep in endpoints]
+    inputs = [sub.get("key") or sub.get("target", "") for sub in config.get("subscriptions", [])]
+    inputs += [inp.get("target", "") for inp in config.get("inputs", [])]
+    return {feeder: {"evs": [ev for _, ev in evs], "inputs": [inputs[i] for i in subs]}
+            for feeder, (evs, subs) in group_targets(targets, inputs).items()}
+
+
+def discover_feeders(fed, api=None):
+    """FeederGroups of every endpoint and input registered on fed."""
+    if api is None:
+        import helics as api
+    h = api
+    endpoints = [h.helicsFederateGetEndpointByIndex(fed, i) for i in range(h.helicsFederateGetEndpointCount(fed))]
+    inputs = [h.helicsFederateGetInputByIndex(fed, i) for i in range(h.helicsFederateGetInputCount(fed))]
+    # Endpoints without a destination are grouped by their own name
+    targets = [h.helicsEndpointGetDefaultDestination(ep) or h.helicsEndpointGetName(ep) for ep in endpoints]
+    groups = group_targets(targets, [h.helicsInputGetTarget(sub) for sub in inputs])
+    out = []
+    for feeder, (evs, subs) in groups.items():
+        if not evs:
+            logger.info(f"Feeder {feeder}: load inputs but no EV endpoints, monitored only")
+        if not subs:
+            logger.warning(f"Feeder {feeder}: EV endpoints but no load inputs, its load reads as 0")
+        out.append(FeederGroup(feeder, [ev for _, ev in evs], [endpoints[i] for i, _ in evs],
+                               [inputs[i] for i in subs]))
+    return out
+
+
+class MultiFeederFleet:
+    """
+    EVFleets of many feeders stepped together.
+
+    loads (complex VA) and branches hold one entry per feeder; lower, upper
+    and overload_at_upper are per-feeder arrays. policies maps feeder names to FeederPolicy
+    (default: FEEDER_POLICIES, DEFAULT_POLICY for any other feeder).
+    """
+
+    def __init__(self, groups, policies=None, api=None, encoding=STRING, workers=0):
+        if api is None:
+            import helics as api
+        self.h = api
+        policies = FEEDER_POLICIES if policies is None else policies
+        self.feeders = [g.name for g in groups]
+        self.fleets = []
+        for g in groups:
+            policy = policies.get(g.name, DEFAULT_POLICY)
+            self.fleets.append(EVFleet(g.ev_names, g.endpoints, g.inputs, policy.table_factory(len(g.ev_names)),
+                                       policy.lower, policy.upper, api=api, encoding=encoding,
+                                       overload_at_upper=upper_is_overload(policy.table_factory)))
+        self.lower = np.array([f.lower for f in self.fleets], dtype=float)
+        self.upper = np.array([f.upper for f in self.fleets], dtype=float)
+        self.overload_at_upper = np.array([f.overload_at_upper for f in self.fleets], dtype=bool)
+        self.loads = np.zeros(len(self.fleets), dtype=complex)
+        self.branches = np.full(len(self.fleets), LOW_LOAD)
+        # Column of each feeder's first EV in readings()
+        self.offsets = np.cumsum([0] + [len(f) for f in self.fleets])
+        self.last_sent = 0
+        self.workers = max(int(workers), 1)
+        self._pool = ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+        bounds = np.linspace(0, len(self.fleets), min(self.workers, max(len(self.fleets), 1)) + 1).astype(int)
+        self._slices = [self.fleets[a:b] for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    @classmethod
+    def from_federate(cls, fed, policies=None, api=None, encoding=STRING, workers=0):
+        return cls(discover_feeders(fed, api), policies, api=api, encoding=encoding, workers=workers)
+
+    def __len__(self):
+        return len(self.fleets)
+
+    @property
+    def ev_names(self):
+        """feeder/EV names in readings() order."""
+        return [f"{feeder}/{name}" for feeder, fleet in zip(self.feeders, self.fleets) for name in fleet.names]
+
+    def _map(self, fn):
+        if self._pool is None:
+            return [fn(fleets) for fleets in self._slices]
+        return list(self._pool.map(fn, self._slices))
+
+    def read_loads(self):
+        """Complex load (VA) of every feeder."""
+        self.loads[:] = [f.read_load() for f in self.fleets]
+        return self.loads
+
+    def read_messages(self):
+        """Drain every EV endpoint; newest reading (kW, NaN if none) of every EV, feeder after feeder."""
+        def drain(fleets):
+            for fleet in fleets:
+                fleet.read_messages()
+
+        self._map(drain)
+        return self.readings()
+
+    def readings(self):
+        if not self.fleets:
+            return np.empty(0)
+        return np.concatenate([f.readings for f in self.fleets])
+
+    def evaluate(self, loads=None):
+        """Branch of every feeder for loads (W, default the last read real loads)."""
+        loads = self.loads.real if loads is None else loads
+        self.branches = classify_load(loads, self.lower, self.upper, self.overload_at_upper)
+        for fleet, branch in zip(self.fleets, self.branches.tolist()):
+            fleet.setpoints = fleet.table[branch]
+        return self.branches
+
+    def send(self, now=0.0):
+        """Send every feeder's commands for its current branch; returns the number sent."""
+        def send(fleets, branches):
+            sent = 0
+            for fleet, branch in zip(fleets, branches):
+                fleet.last_sent = fleet.send(branch, now)
+                sent += fleet.last_sent
+            return sent
+
+        branches = self.branches.tolist()
+        jobs = []
+        start = 0
+        for fleets in self._slices:
+            jobs.append((fleets, branches[start:start + len(fleets)]))
+            start += len(fleets)
+        if self._pool is None:
+            self.last_sent = sum(send(*job) for job in jobs)
+        else:
+            self.last_sent = sum(self._pool.map(lambda job: send(*job), jobs))
+        return self.last_sent
+
+    def step(self, now=0.0):
+        """Evaluate every feeder on its last read load and send; returns the branches."""
+        self.evaluate()
+        self.send(now)
+        return self.branches
+
+    def send_on_change(self, keepalive=None):
+        for fleet in self.fleets:
+            fleet.send_on_change(keepalive)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def run_inprocess(n_feeders, config=None, interval=60, workers=0, broker_name="multi_feeder_inproc"):
+    """
+    n_feeders surrogate feeders (gld_hlc_conn, gld_hlc_conn_2, ...) and one
+    MultiFeederFleet controller on an inproc broker; returns (result, wall s).
+
+    result holds the controller's per-step loads (steps, feeders) and
+    branches, the feeder names and the commands each surrogate applied.
+    """
+    import helics as h
+
+    from surrogate_feeder import SurrogateFeeder, _federate_info, load_config, run_surrogate
+
+    base = load_config(config) if isinstance(config, str) or config is None else config
+    models = []
+    for k in range(n_feeders):
+        suffix = "" if k == 0 else f"_{k + 1}"
+        cfg = dict(base, name=f"{base['name']}{suffix}", feeder_key=f"gld_hlc_conn{suffix}",
+                   controller_key=f"EV_Controller{suffix}")
+        models.append(SurrogateFeeder(cfg))
+    broker = h.helicsCreateBroker("inproc", broker_name, f"-f {n_feeders + 1} --loglevel=error")
+    result = {}
+    start = time.perf_counter()
+
+    def feeder(model):
+        fed = h.helicsCreateCombinationFederate(model.config["name"],
+                                                _federate_info(h, "inproc", f"--broker={broker_name}"))
+        run_surrogate(fed, model, api=h)
+
+    def controller():
+        fed = h.helicsCreateCombinationFederate("EVControllerMulti",
+                                                _federate_info(h, "inproc", f"--broker={broker_name}"))
+        for model in models:
+            feeder_key, controller_key = model.config["feeder_key"], model.config["controller_key"]
+            for name in model.ev_names:
+                ep = h.helicsFederateRegisterGlobalEndpoint(fed, f"{controller_key}/{name}", "")
+                h.helicsEndpointSetDefaultDestination(ep, f"{feeder_key}/{name}")
+            for ph in "abc":
+                sub = h.helicsFederateRegisterSubscription(fed, f"{feeder_key}/S{ph}", "VA")
+                h.helicsInputSetDefaultComplex(sub, 0, 0)
+        # Same policy on every surrogate feeder, so the results compare with surrogate_feeder --inproc
+        fleet = MultiFeederFleet.from_federate(fed, policies={}, api=h, workers=workers)
+        h.helicsFederateEnterExecutingMode(fed)
+        total = int(3600 * base["hours"])
+        granted = -1
+        loads, branches = [], []
+        for t in range(0, total, interval):
+            while granted < t:
+                granted = h.helicsFederateRequestTime(fed, t)
+            loads.append(fleet.read_loads().real.copy())
+            fleet.read_messages()
+            branches.append(fleet.step(now=granted).copy())
+        h.helicsFederateDisconnect(fed)
+        fleet.close()
+        result["feeders"] = fleet.feeders
+        result["load"] = np.array(loads)
+        result["branches"] = np.array(branches)
+
+    threads = [threading.Thread(target=feeder, args=(m,)) for m in models]
+    threads.append(threading.Thread(target=controller))
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    h.helicsBrokerWaitForDisconnect(broker, -1)
+    h.helicsBrokerFree(broker)
+    result["commands"] = [m.commands for m in models]
+    return result, time.perf_counter() - start
+
+
+def run_federate(config_path, workers=0):
+    """The controller federate: every feeder of config_path, fixed or event-driven steps."""
+    import helics as h
+
+    from federate_clock import make_clock
+    from telemetry_recorder import TelemetryRecorder, buffer_rows, export_csv
+
+    fed = h.helicsCreateCombinationFederateFromConfig(config_path)
+    federate_name = h.helicsFederateGetName(fed)
+    fleet = MultiFeederFleet.from_federate(
+        fed, api=h, encoding=os.getenv("CONTROLLER_MESSAGE_ENCODING", "string"), workers=workers)
+    for feeder, sub_fleet in zip(fleet.feeders, fleet.fleets):
+        logger.info(f"{federate_name}: feeder {feeder}: {len(sub_fleet)} EVs ({', '.join(sub_fleet.names)}), "
+                    f"{len(sub_fleet.inputs)} load inputs, limits {sub_fleet.lower / 1e6:.2f}"
+                    f"..{sub_fleet.upper / 1e6:.2f} MW")
+        for sub in sub_fleet.inputs:
+            h.helicsInputSetDefaultComplex(sub, 0, 0)
+
+    total_interval = 60 * 60 * 24
+    update_interval = int(os.getenv("CONTROLLER_INTERVAL_SEC", "60"))
+    inputs = [sub for sub_fleet in fleet.fleets for sub in sub_fleet.inputs]
+    clock = make_clock(os.getenv("CONTROLLER_TIME_MODE", "fixed"), fed, total_interval, update_interval,
+                       inputs, float(os.getenv("CONTROLLER_WAKE_DELTA_VA", "0")))
+    ev_names = fleet.ev_names
+    n_evs = len(ev_names)
+    columns = ev_names + ["time"] + [f"{feeder}/load" for feeder in fleet.feeders]
+    recorder = TelemetryRecorder("multi_feeder_outputs.tlm", columns, buffer_rows(total_interval, update_interval))
+    row = np.empty(len(columns))
+
+    h.helicsFederateEnterExecutingMode(fed)
+    logger.info(f"{federate_name}: Entered executing mode with {len(fleet)} feeders, {n_evs} EVs")
+    last = fleet.branches.copy()
+    grantedtime = -1
+    for t in clock:
+        grantedtime = clock.granted
+        loads = fleet.read_loads()
+        row[:n_evs] = fleet.read_messages()
+        row[n_evs] = t / 3600.0
+        row[n_evs + 1:] = loads.real
+        recorder.append(row)
+        branches = fleet.step(now=grantedtime)
+        # Log branch changes only; a step log per feeder would swamp the file
+        for i in np.flatnonzero(branches != last).tolist():
+            logger.info(f"[CONTROLLER_ACTION] sim_time={grantedtime}s feeder={fleet.feeders[i]} "
+                        f"load_kw={loads[i].real / 1000.0:.1f} interval={update_interval}s "
+                        f"action={BRANCH_NAMES[branches[i]]}")
+        last = branches.copy()
+
+    recorder.close()
+    fleet.close()
+    logger.info(f"{federate_name}: {clock.report()}")
+    export_csv("multi_feeder_outputs.tlm", "multi_feeder_outputs.csv")
+    while grantedtime < total_interval:
+        grantedtime = h.helicsFederateRequestTime(fed, total_interval)
+    h.helicsFederateRequestTime(fed, h.HELICS_TIME_MAXTIME)
+    h.helicsFederateDisconnect(fed)
+    h.helicsFederateDestroy(fed)
+    logger.info(f"{federate_name}: Federate finalized")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='EV controller federate for every feeder in its config')
+    parser.add_argument('-c', '--config', default='1c_Control_multi.json')
+    parser.add_argument('--list', action='store_true', help='print the feeders and EVs of the config and exit')
+    parser.add_argument('--inproc', type=int, metavar='N',
+                        help='run N surrogate feeders and the controller on an in-process broker')
+    parser.add_argument('--interval', type=int, default=60, help='controller interval for --inproc (s)')
+    parser.add_argument('--workers', type=int, default=int(os.getenv("CONTROLLER_FEEDER_WORKERS", "0")),
+                        help='threads for draining and sending (0 or 1: none)')
+    args = parser.parse_args()
+
+    if args.list:
+        for feeder, found in feeders_in_config(args.config).items():
+            print(f"{feeder}: EVs {', '.join(found['evs']) or '-'}; inputs {', '.join(found['inputs']) or '-'}")
+    elif args.inproc:
+        result, wall = run_inprocess(args.inproc, interval=args.interval, workers=args.workers)
+        steps = len(result["branches"])
+        print(f"{args.inproc} feeders, {steps} control steps in {wall:.2f} s "
+              f"({wall / max(steps, 1) * 1e3:.2f} ms per step)")
+        for k, feeder in enumerate(result["feeders"]):
+            counts = np.bincount(result["branches"][:, k], minlength=3)
+            print(f"    {feeder:<18} steps overload/safe/low = {counts.tolist()}, "
+                  f"{result['commands'][k]} EV commands applied")
+    else:
+        run_federate(args.config, args.workers)
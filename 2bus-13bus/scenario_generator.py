@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""
+Scale-out scenario generator: N feeders with M EV stations each.
+
+Writes one self-contained scenario directory. All of its files are
+generated from the same feeder/EV list, so they agree with each other:
+
+    controller.json        multi_feeder.py config: EV_Controller{sfx}/EVxxxx -> gld_hlc_conn{sfx}/EVxxxx
+                           endpoints and gld_hlc_conn{sfx}/Sa|Sb|Sc subscriptions of every feeder
+    feeder_<k>/            one directory per feeder (k = 1, 2, ...; sfx = "", "_2", "_3", ...):
+        feeder.glm         the base GLM (1c_IEEE_123_feeder.glm) with its helics_msg renamed to
+                           gld_hlc_conn{sfx}, configured by feeder.json, and including ev_stations.glm
+        ev_stations.glm    switch + load + recorders + player of every EV station
+        feeder.json        GridLAB-D HELICS config: S publications and one endpoint per EV
+        surrogate.json     surrogate_feeder.py config standing in for the GLM
+        players/EVxxxx.player
+        include -> <repo>/include  (symlink, for the schedules and weather of the base GLM)
+    runner.json            helics run file (GridLAB-D feeders, or surrogates with --feeder-model surrogate)
+    scenario.json          summary: port, feeders, EVs and where each station is attached
+
+Stations are attached round-robin to the single-phase loads of the base GLM
+(l114 AN, l107 BN, ...), the same way EV1-EV6 hang off l5/l2/l88/l92/l107/l114,
+and take that load's phase. Players are the repo's ev1-6 load schedules, each
+shifted by a per-EV offset; like the base model, the loads keep a fixed
+constant_power and the player reference is left commented out.
+
+Broker ports: each scenario gets its own port (ZMQ uses two, so ports advance
+by PORT_STRIDE). Ports are recorded in ports.json in the output root, and
+ports that are already bound on this host or in use by the repo's own runner
+files are skipped. Scenarios generated side by side therefore never collide.
+
+    python scenario_generator.py --evs 100 --feeders 4 -o scenarios/f4_ev100
+    python scenario_generator.py --evs 10 --feeders 2 --feeder-model surrogate -o scenarios/demo
+    helics run --path=scenarios/demo/runner.json
+"""
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import re
+import socket
+from collections import namedtuple
+
+from glm_parser import load_glm
+from schedule_tables import load_schedule
+
+logger = logging.getLogger(__name__)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASE_GLM = os.path.join(HERE, "1c_IEEE_123_feeder.glm")
+DEFAULT_TRACE = os.path.join(HERE, "extracted_feeder_load.csv")
+PLAYER_SHAPES = os.path.join(HERE, "include", "players", "ev[0-9]_load_schedule.player")
+BASE_PORT = 23500
+PORT_STRIDE = 2
+PORT_REGISTRY = "ports.json"
+EV_POWER_W = 200000.0
+# Offset between the player shapes of consecutive EVs
+PLAYER_SHIFT_S = 900
+
+# One EV station: name, the load it hangs off and its phase letter
+EVStation = namedtuple("EVStation", ["name", "node", "phase"])
+# One feeder: key suffix, its helics_msg name, the controller endpoint prefix and its stations
+FeederSpec = namedtuple("FeederSpec", ["suffix", "key", "controller_key", "stations"])
+Scenario = namedtuple("Scenario", ["directory", "port", "feeders", "files"])
+
+
+def feeder_dir(feeder):
+    """Directory of a feeder in the scenario: feeder_1, feeder_2, ..."""
+    return f"feeder{feeder.suffix or '_1'}"
+
+
+def suffix(k):
+    """Key suffix of feeder k (0-based): "", "_2", "_3", ... as in gld_hlc_conn_2."""
+    return "" if k == 0 else f"_{k + 1}"
+
+
+def ev_names(n):
+    """EV0001 ... : zero-padded, so they never clash with EV1-EV6 of the base model."""
+    width = max(4, len(str(n)))
+    return [f"EV{i + 1:0{width}d}" for i in range(n)]
+
+
+def attachment_points(base_glm):
+    """(load name, phase letter) of every single-phase load of the base GLM, in file order."""
+    points = []
+    for obj in load_glm(base_glm).objects:
+        if obj.type != "load" or re.match(r"EV\d", obj.name):
+            continue
+        phases = [ph for ph in obj.properties.get("phases", "").upper() if ph in "ABC"]
+        if len(phases) == 1:
+            points.append((obj.name, phases[0]))
+    if not points:
+        raise ValueError(f"{base_glm} has no single-phase loads to attach EV stations to")
+    return points
+
+
+def plan_feeders(n_feeders, n_evs, points):
+    """FeederSpecs of n_feeders feeders with n_evs stations each, cycling through points."""
+    names = ev_names(n_evs)
+    feeders = []
+    for k in range(n_feeders):
+        sfx = suffix(k)
+        stations = [EVStation(name, *points[i % len(points)]) for i, name in enumerate(names)]
+        feeders.append(FeederSpec(sfx, f"gld_hlc_conn{sfx}", f"EV_Controller{sfx}", stations))
+    return feeders
+
+
+# ---------------------------------------------------------------------------
+# Broker ports
+# ---------------------------------------------------------------------------
+def _port_free(port):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind(("127.0.0.1", port))
+        except OSError:
+            return False
+    return True
+
+
+def _repo_ports():
+    """Ports fixed in the runner files of this directory (e.g. 23404)."""
+    ports = set()
+    for path in glob.glob(os.path.join(HERE, "*.json")):
+        with open(path, errors="replace") as fh:
+            ports.update(int(p) for p in re.findall(r"--port=(\d+)", fh.read()))
+    return ports
+
+
+def allocate_port(root, scenario, base=BASE_PORT):
+    """
+    Broker port of scenario, recorded in root/ports.json.
+
+    A scenario keeps its port when regenerated; new scenarios take the first
+    free slot at or above base.
+    """
+    registry_path = os.path.join(root, PORT_REGISTRY)
+    try:
+        with open(registry_path) as fh:
+            registry = json.load(fh)
+    except (OSError, ValueError):
+        registry = {}
+    if scenario in registry:
+        return registry[scenario]
+    taken = set(registry.values()) | _repo_ports()
+    port = base
+    while any(p in taken for p in range(port, port + PORT_STRIDE)) or not all(
+            _port_free(p) for p in range(port, port + PORT_STRIDE)):
+        port += PORT_STRIDE
+    registry[scenario] = port
+    os.makedirs(root, exist_ok=True)
+    with open(registry_path, "w") as fh:
+        json.dump(registry, fh, indent=2, sort_keys=True)
+        fh.write("\n")
+    return port
+
+
+# ---------------------------------------------------------------------------
+# HELICS configs
+# ---------------------------------------------------------------------------
+def _core(port):
+    """Core keys of a federate config; a --broker_address in coreInit is not used for the port."""
+    return {"coreInit": "--federates=1", "brokerAddress": "127.0.0.1", "brokerPort": port}
+
+
+def controller_config(feeders, port, period=30, filter_delay=None):
+    """multi_feeder.py config for every EV of every feeder (filter_delay=3600 adds the EVfilters of 1c_Control.json)."""
+    endpoints, subscriptions = [], []
+    for f in feeders:
+        for st in f.stations:
+            endpoints.append({"key": f"{f.controller_key}/{st.name}", "destination": f"{f.key}/{st.name}",
+                              "global": True, "type": "string"})
+        for ph in "abc":
+            subscriptions.append({"global": True, "key": f"{f.key}/S{ph}", "type": "complex", "unit": "VA",
+                                  "info": {"object": "Node650", "property": f"measured_power_{ph.upper()}"}})
+    config = {**_core(port), "coreName": "EVControllerMulti Federate", "coreType": "zmq",
+              "name": "EVControllerMultiSim", "period": period, "logfile": "output.log", "log_level": "warning",
+              "endpoints": endpoints, "subscriptions": subscriptions}
+    if filter_delay:
+        config["filters"] = [{"name": "EVfilters", "sourcetargets": [ep["key"] for ep in endpoints],
+                              "mode": "source", "operation": "delay",
+                              "properties": {"name": "delay", "value": filter_delay}}]
+    return config
+
+
+def feeder_config(feeder, port, swing="Node650", period=30):
+    """GridLAB-D helics_msg config of one feeder, in the layout of mainglm.json."""
+    publications = [{"global": True, "key": f"{feeder.key}/S{ph}", "type": "complex", "unit": "VA",
+                     "info": {"object": swing, "property": f"measured_power_{ph}"}} for ph in "ABC"]
+    endpoints = []
+    for st in feeder.stations:
+        prop = {"object": st.name, "property": f"constant_power_{st.phase}"}
+        endpoints.append({"global": True, "key": f"{feeder.key}/{st.name}",
+                          "destination": f"{feeder.controller_key}/{st.name}",
+                          "info": {"publication_info": prop, "subscription_info": prop}})
+    return {**_core(port), "coreName": f"IEEE123bus{feeder.suffix} Core", "coreType": "zmq",
+            "name": f"IEEE123bus_fed{feeder.suffix}", "period": period, "logfile": "IEEE123bus-gld.log",
+            "log_level": "warning", "publications": publications, "endpoints": endpoints}
+
+
+def surrogate_config(feeder, trace=DEFAULT_TRACE):
+    """surrogate_feeder.py config standing in for the feeder."""
+    return {"name": f"surrogate_feeder{feeder.suffix}", "feeder_key": feeder.key,
+            "controller_key": feeder.controller_key, "trace": trace,
+            "evs": {st.name: {"phase": st.phase, "gain": 1.0} for st in feeder.stations}}
+
+
+def runner_config(name, feeders, port, feeder_model="gridlabd"):
+    """helics run file starting the broker on port, every feeder and the controller."""
+    env = {"HELICS_BROKER": f"tcp://localhost:{port}"}
+    federates = []
+    for f in feeders:
+        if feeder_model == "surrogate":
+            exec_ = (f"python {os.path.join(HERE, 'surrogate_feeder.py')} -c surrogate.json "
+                     f"--broker=--broker_address=tcp://127.0.0.1:{port}")
+        else:
+            exec_ = "gridlabd feeder.glm"
+        federates.append({"directory": feeder_dir(f), "exec": exec_, "host": "localhost",
+                          "name": feeder_dir(f), "environment": env})
+    federates.append({"directory": ".", "exec": f"python {os.path.join(HERE, 'multi_feeder.py')} -c controller.json",
+                      "host": "localhost", "name": "controller", "environment": env})
+    # An explicit broker federate: the auto broker ("broker": true) always takes the default port
+    federates.append({"directory": ".", "exec": f"helics_broker -f{len(federates)} --port={port} --loglevel=warning",
+                      "host": "localhost", "name": "broker"})
+    return {"name": name, "broker": False, "federates": federates}
+
+
+# ---------------------------------------------------------------------------
+# GLM and players
+# ---------------------------------------------------------------------------
+_STATION_TEMPLATE = """object switch {{
+    name sw{name};
+    phases {phase}N;
+    from {node};
+    to {name};
+    status CLOSED;
+    object recorder {{
+        name sw_recorder_{name};
+        file output/sw_status_{node}_{name}.csv;
+        interval 1200;
+        property status;
+    }};
+}};
+
+object load {{
+    name {name};
+    phases "{phase}N";
+    nominal_voltage {nominal};
+    //constant_power_{phase} {name}_player.value;
+    constant_power_{phase} {power:.0f}+0j;
+    object recorder {{
+        property constant_power_{phase}, voltage_{phase};
+        interval 1200;
+        file output/{name}.csv;
+    }};
+}};
+
+object player {{
+    name {name}_player;
+    property value;
+    file "players/{name}.player";
+}};
+
+"""
+
+
+def stations_glm(feeder, nominal=2401.7771, power=EV_POWER_W):
+    lines = [f"// {len(feeder.stations)} EV stations of {feeder.key}, generated by scenario_generator.py\n\n"]
+    lines += [_STATION_TEMPLATE.format(name=st.name, node=st.node, phase=st.phase, nominal=nominal, power=power)
+              for st in feeder.stations]
+    return "".join(lines)
+
+
+def feeder_glm(base_text, feeder):
+    """The base GLM wired to this feeder's helics_msg config, including ev_stations.glm."""
+    text, n = re.subn(r"(object\s+helics_msg\s*\{[^}]*?name\s+)gld_hlc_conn\w*;", rf"\g<1>{feeder.key};", base_text)
+    text, m = re.subn(r"(object\s+helics_msg\s*\{[^}]*?configure\s+)[^;\s]+;", r"\g<1>feeder.json;", text)
+    if not (n and m):
+        raise ValueError("base GLM has no helics_msg object named gld_hlc_conn to rewire")
+    return text + '\n#include "ev_stations.glm"\n'
+
+
+def _read_player(path):
+    """[(seconds after midnight, value), ...] of a player file; "24:00:00" is accepted."""
+    schedule = load_schedule(path)
+    return [(int(t), float(v)) for t, v in zip(schedule.times, schedule.values[:, 0])]
+
+
+def player_text(shape, shift, day=datetime.datetime(2013, 8, 28)):
+    """The shape moved later by shift seconds (wrapping around the day), in player file format."""
+    day_s = 24 * 3600
+    points = {(t + shift) % day_s: v for t, v in shape if t < day_s}
+    # Value at midnight: the shape's value in force at day_s - shift
+    before = [v for t, v in shape if t <= (day_s - shift) % day_s] or [shape[0][1]]
+    points.setdefault(0, before[-1])
+    lines = ["# time, EV_power\n"]
+    for t in sorted(points):
+        lines.append(f"{(day + datetime.timedelta(seconds=t)):%Y-%m-%d %H:%M:%S}, {points[t]:.3f}\n")
+    return "".join(lines)
+
+
+def _player_shapes():
+    paths = sorted(glob.glob(PLAYER_SHAPES))
+    if not paths:
+        return [[(0, EV_POWER_W)]]
+    return [_read_player(p) for p in paths]
+
+
+# ---------------------------------------------------------------------------
+# Scenario
+# ---------------------------------------------------------------------------
+def _write_json(path, data):
+    with open(path, "w") as fh:
+        json.dump(data, fh, indent=2)
+        fh.write("\n")
+    return path
+
+
+def generate(out_dir, n_evs, n_feeders, feeder_model="gridlabd", base_glm=DEFAULT_BASE_GLM,
+             trace=DEFAULT_TRACE, port=None, filter_delay=None, players=True):
+    """Write a scenario with n_feeders feeders of n_evs EV stations to out_dir; returns a Scenario."""
+    out_dir = os.path.abspath(out_dir)
+    name = os.path.basename(out_dir.rstrip(os.sep))
+    if port is None:
+        port = allocate_port(os.path.dirname(out_dir), name)
+    feeders = plan_feeders(n_feeders, n_evs, attachment_points(base_glm))
+    os.makedirs(out_dir, exist_ok=True)
+    files = [_write_json(os.path.join(out_dir, "controller.json"), controller_config(feeders, port, filter_delay=filter_delay))]
+    with open(base_glm) as fh:
+        base_text = fh.read()
+    shapes = _player_shapes() if players else []
+    include_dir = os.path.join(os.path.dirname(os.path.abspath(base_glm)), "include")
+    for f in feeders:
+        fdir = os.path.join(out_dir, feeder_dir(f))
+        os.makedirs(os.path.join(fdir, "output"), exist_ok=True)
+        files.append(_write_json(os.path.join(fdir, "feeder.json"), feeder_config(f, port)))
+        files.append(_write_json(os.path.join(fdir, "surrogate.json"), surrogate_config(f, trace)))
+        for fname, text in (("feeder.glm", feeder_glm(base_text, f)), ("ev_stations.glm", stations_glm(f))):
+            with open(os.path.join(fdir, fname), "w") as fh:
+                fh.write(text)
+            files.append(os.path.join(fdir, fname))
+        link = os.path.join(fdir, "include")
+        if os.path.isdir(include_dir) and not os.path.lexists(link):
+            os.symlink(include_dir, link)
+        if players:
+            pdir = os.path.join(fdir, "players")
+            os.makedirs(pdir, exist_ok=True)
+            for i, st in enumerate(f.stations):
+                path = os.path.join(pdir, f"{st.name}.player")
+                with open(path, "w") as fh:
+                    fh.write(player_text(shapes[i % len(shapes)], (i // len(shapes)) * PLAYER_SHIFT_S))
+                files.append(path)
+    files.append(_write_json(os.path.join(out_dir, "runner.json"), runner_config(name, feeders, port, feeder_model)))
+    summary = {"name": name, "port": port, "feeder_model": feeder_model, "base_glm": os.path.abspath(base_glm),
+               "evs_per_feeder": n_evs,
+               "feeders": {f.key: {"controller": f.controller_key, "directory": feeder_dir(f),
+                                   "stations": [list(st) for st in f.stations]} for f in feeders}}
+    files.append(_write_json(os.path.join(out_dir, "scenario.json"), summary))
+    return Scenario(out_dir, port, feeders, files)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Generate HELICS configs, runner, GLM and players for N feeders x M EVs')
+    parser.add_argument('--evs', type=int, required=True, help='EV stations per feeder')
+    parser.add_argument('--feeders', type=int, default=1)
+    parser.add_argument('-o', '--out', required=True, help='scenario directory (its parent holds ports.json)')
+    parser.add_argument('--feeder-model', choices=['gridlabd', 'surrogate'], default='gridlabd',
+                        help='what runner.json starts for every feeder')
+    parser.add_argument('--base-glm', default=DEFAULT_BASE_GLM)
+    parser.add_argument('--trace', default=DEFAULT_TRACE, help='load trace of the surrogate feeders')
+    parser.add_argument('--port', type=int, help='broker port (default: allocated)')
+    parser.add_argument('--filter-delay', type=float, help='add a delay filter (s) on the controller endpoints')
+    parser.add_argument('--no-players', action='store_true')
+    args = parser.parse_args()
+
+    scenario = generate(args.out, args.evs, args.feeders, args.feeder_model, args.base_glm, args.trace,
+                        args.port, args.filter_delay, not args.no_players)
+    n = sum(len(f.stations) for f in scenario.feeders)
+    print(f"{scenario.directory}: {len(scenario.feeders)} feeders, {n} EV stations, broker port {scenario.port}, "
+          f"{len(scenario.files)} files")
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled lookup tables for the schedule and player files under include/.
+
+Three inputs are understood:
+
+- GridLAB-D players (ev*_load_schedule.player, load_shape_player.player,
+  switch_control.player, ...) and the player-style CSVs
+  (ev5/ev6_load_schedule.csv): "timestamp, value[, value...]" lines. The
+  timestamps are wall clock ("2013-08-28 06:00:00", with an optional zone,
+  and "24:00:00" for the end of the day) or relative to the previous line
+  ("+1m", "+30s", "+2h", "+1d"). Values may be real or GridLAB-D complex.
+- EV_trips.csv (NHTS vehicle trips): ARRHOME/DEPHOME/ARRWORK/DEPWORK are
+  HHMM clock times, DURHOME/DURWORK minutes. load_trips() returns every
+  column with the clock times converted to minutes after midnight.
+  compile_trips() turns them into the number of vehicles at home and at
+  work over the day, a daily (period 86400 s) schedule.
+
+A Schedule holds sorted float64 times (seconds after epoch, which is the
+midnight of the first timestamp, i.e. simulation time 0 of the co-sim) and
+a (n, k) value array. at(t) is a binary search (np.searchsorted) holding
+the last value at or before t, like a player does. t may be an array, so a
+whole forecast horizon is one call. horizon(start, step, n) is shorthand
+for that.
+
+Compiled tables are cached as .npz under .gld_cache/ next to the source
+(the directory gld_csv uses), keyed by path, size and mtime.
+
+    python schedule_tables.py include/players/*.player include/schedules/*.csv
+    python schedule_tables.py include/players/ev6_load_schedule.player --at 21600 43200
+    python schedule_tables.py include/schedules/EV_trips.csv --horizon 0 3600 24
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from gld_csv import CACHE_DIR, parse_complex
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+DAY = 86400
+
+_RELATIVE_RE = re.compile(r"^\+(\d+(?:\.\d*)?)([smhd]?)$")
+_ABSOLUTE_RE = re.compile(r"^(\d{4}-\d\d-\d\d)[ T](\d{1,2}):(\d\d):(\d\d(?:\.\d*)?)(?:\s+(\S+))?$")
+_UNIT_SECONDS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": DAY}
+
+# EV_trips.csv with the clock columns in minutes after midnight
+TripTable = namedtuple("TripTable", ["vehicle", "vehicle_type", "urban_rural", "arrive_home", "home_minutes",
+                                     "depart_home", "miles", "arrive_work", "work_minutes", "depart_work"])
+_TRIP_COLUMNS = ("HH.VEH.ID", "VEHTYPE", "URBRUR", "ARRHOME", "DUR.HOME", "DEPHOME", "HHVEHMILES",
+                 "ARRWORK", "DUR.WORK", "DEPWORK")
+_HHMM_COLUMNS = ("ARRHOME", "DEPHOME", "ARRWORK", "DEPWORK")
+
+
+class Schedule:
+    """
+    Step function of time: values[i] holds from times[i] until times[i + 1].
+
+    times are seconds after epoch (datetime64[s], None for a schedule of
+    the time of day), sorted; values is (n, k). With period set, lookups
+    wrap t into [0, period).
+    """
+
+    def __init__(self, times, values, columns, epoch=None, period=None, zone=None, source=None):
+        times = np.asarray(times, dtype=float)
+        values = np.asarray(values)
+        if values.ndim == 1:
+            values = values[:, None]
+        if len(times) != len(values):
+            raise ValueError(f"{len(times)} times but {len(values)} value rows")
+        if len(times) > 1 and np.any(np.diff(times) < 0):
+            # Stable: of equal times the last line wins, as in a player
+            order = np.argsort(times, kind="stable")
+            times, values = times[order], values[order]
+        self.times = times
+        self.values = values
+        self.columns = list(columns)
+        self.epoch = None if epoch is None else np.datetime64(epoch, "s")
+        self.period = period
+        self.zone = zone
+        self.source = source
+        self._index = {name: i for i, name in enumerate(self.columns)}
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        return (f"Schedule({os.path.basename(self.source or '')!r}, {len(self)} points, "
+                f"columns={self.columns}, epoch={self.epoch})")
+
+    def column(self, name):
+        """Index of column name (or pass an int through)."""
+        return name if isinstance(name, (int, np.integer)) else self._index[name]
+
+    def seconds(self, stamps):
+        """Seconds after epoch of datetime64 / ISO string timestamps."""
+        if self.epoch is None:
+            raise ValueError("schedule has no epoch; look it up by seconds of the day")
+        return (np.asarray(stamps, dtype="datetime64[s]") - self.epoch).astype(float)
+
+    def index(self, t):
+        """Row in force at t (seconds, scalar or array); -1 before the first row."""
+        t = np.asarray(t, dtype=float)
+        if self.period:
+            t = np.mod(t, self.period)
+        return np.searchsorted(self.times, t, side="right") - 1
+
+    def at(self, t, column=None, before=np.nan):
+        """
+        Value(s) in force at t: shape t.shape + (k,), or t.shape for one column.
+
+        Times before the first row give before (a player leaves the property
+        unchanged until its first line).
+        """
+        idx = self.index(t)
+        values = self.values if column is None else self.values[:, self.column(column)]
+        out = values[np.clip(idx, 0, None)]
+        if np.ndim(idx) == 0:
+            return out if idx >= 0 else np.full_like(out, before, dtype=np.result_type(out, type(before)))
+        if np.any(idx < 0):
+            out = out.astype(np.result_type(out, type(before)))
+            out[idx < 0] = before
+        return out
+
+    def interpolate(self, t, column=0):
+        """Linear interpolation of one column at t (for forecasts of smooth shapes)."""
+        t = np.asarray(t, dtype=float)
+        if self.period:
+            t = np.mod(t, self.period)
+        return np.interp(t, self.times, self.values[:, self.column(column)])
+
+    def horizon(self, start, step, n, column=None):
+        """(times, values) of n lookups at start, start + step, ..."""
+        times = start + step * np.arange(n, dtype=float)
+        return times, self.at(times, column)
+
+
+# ---------------------------------------------------------------------------
+# Players
+# ---------------------------------------------------------------------------
+def _player_times(stamps):
+    """(seconds after epoch, epoch datetime64[s], zone) of player timestamps."""
+    seconds = np.empty(len(stamps))
+    epoch = None
+    zone = None
+    current = None
+    days = {}
+    for i, stamp in enumerate(stamps):
+        m = _RELATIVE_RE.match(stamp)
+        if m:
+            if current is None:
+                raise ValueError(f"relative time {stamp!r} before any absolute time")
+            current += float(m.group(1)) * _UNIT_SECONDS[m.group(2)]
+        else:
+            m = _ABSOLUTE_RE.match(stamp)
+            if m is None:
+                raise ValueError(f"unrecognised player timestamp {stamp!r}")
+            date, hh, mm, ss, tz = m.groups()
+            if date not in days:
+                days[date] = np.datetime64(date, "s")
+                if epoch is None:
+                    epoch = days[date]
+            # Hours up to 24 are allowed ("24:00:00" is the next midnight)
+            current = float((days[date] - epoch).astype(np.int64)) + int(hh) * 3600 + int(mm) * 60 + float(ss)
+            zone = zone or tz
+        seconds[i] = current
+    return seconds, epoch, zone
+
+
+def _parse_values(fields):
+    """(n, k) float64 or complex128 array of the value fields of each line."""
+    k = max(len(f) for f in fields)
+    columns = []
+    for j in range(k):
+        column = [f[j].strip() if j < len(f) else "nan" for f in fields]
+        parsed = np.fromstring(" ".join(column), dtype=float, sep=" ")
+        if len(parsed) != len(column):
+            # Complex or unit-suffixed values
+            parsed = parse_complex(column)
+            if not np.any(parsed.imag):
+                parsed = parsed.real
+        columns.append(parsed)
+    return np.column_stack(columns) if columns else np.empty((len(fields), 0))
+
+
+def parse_player(path):
+    """Schedule of a GridLAB-D player file (or player-style CSV)."""
+    stamps, fields, header = [], [], None
+    with open(path) as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                names = [c.strip() for c in line[1:].split(",")]
+                if header is None and len(names) > 1:
+                    header = names[1:]
+                continue
+            stamp, _, rest = line.partition(",")
+            stamps.append(stamp.strip())
+            fields.append(rest.split(","))
+    if not stamps:
+        raise ValueError(f"{path}: no player lines")
+    seconds, epoch, zone = _player_times(stamps)
+    values = _parse_values(fields)
+    k = values.shape[1]
+    if header is None or len(header) != k or len(set(header)) != k:
+        base = os.path.splitext(os.path.basename(path))[0]
+        header = [base] if k == 1 else [f"{base}_{j}" for j in range(k)]
+    return Schedule(seconds, values, header, epoch=epoch, zone=zone, source=os.path.abspath(path))
+
+
+# ---------------------------------------------------------------------------
+# EV trips
+# ---------------------------------------------------------------------------
+def hhmm_to_minutes(hhmm):
+    """Minutes after midnight of HHMM clock times (1345 -> 825); rejects MM >= 60 and HH > 24."""
+    hhmm = np.asarray(hhmm, dtype=np.int64)
+    hours, minutes = np.divmod(hhmm, 100)
+    bad = (minutes >= 60) | (hours > 24) | (hhmm < 0)
+    if np.any(bad):
+        raise ValueError(f"invalid HHMM value(s): {np.unique(hhmm[bad])[:5].tolist()}")
+    return hours * 60 + minutes
+
+
+def load_trips(path):
+    """TripTable of EV_trips.csv; clock times in minutes after midnight."""
+    with open(path) as fh:
+        header = [c.strip() for c in fh.readline().split(",")]
+        data = fh.read()
+    if tuple(header) != _TRIP_COLUMNS:
+        raise ValueError(f"{path}: unexpected trip columns {header}")
+    lines = data.split()
+    # Vehicle ids are strings; miles are fractional, every other field an integer
+    ids = np.array([line.partition(",")[0] for line in lines])
+    numbers = np.fromstring(" ".join(line.partition(",")[2] for line in lines).replace(",", " "),
+                            dtype=float, sep=" ").reshape(len(lines), len(header) - 1)
+    cols = {name: numbers[:, i] if name == "HHVEHMILES" else numbers[:, i].astype(np.int64)
+            for i, name in enumerate(header[1:])}
+    for name in _HHMM_COLUMNS:
+        cols[name] = hhmm_to_minutes(cols[name])
+    return TripTable(ids, cols["VEHTYPE"], cols["URBRUR"], cols["ARRHOME"], cols["DUR.HOME"], cols["DEPHOME"],
+                     cols["HHVEHMILES"], cols["ARRWORK"], cols["DUR.WORK"], cols["DEPWORK"])
+
+
+def _occupancy(arrive, depart):
+    """Vehicles present per minute of the day for stays [arrive, depart), wrapping past midnight."""
+    day = 24 * 60
+    arrive, depart = arrive % day, depart % day
+    delta = np.bincount(arrive, minlength=day + 1)[:day] - np.bincount(depart, minlength=day + 1)[:day]
+    # Stays over midnight are present at 00:00
+    return np.count_nonzero(depart < arrive) + np.cumsum(delta)
+
+
+def compile_trips(path):
+    """Daily Schedule of the number of vehicles at home and at work, at each minute it changes."""
+    trips = load_trips(path)
+    counts = np.column_stack([_occupancy(trips.arrive_home, trips.depart_home),
+                              _occupancy(trips.arrive_work, trips.depart_work)])
+    change = np.ones(len(counts), dtype=bool)
+    change[1:] = np.any(counts[1:] != counts[:-1], axis=1)
+    minutes = np.flatnonzero(change)
+    return Schedule(minutes * 60.0, counts[change].astype(float), ["at_home", "at_work"],
+                    period=DAY, source=os.path.abspath(path))
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+def _cache_path(path):
+    head, tail = os.path.split(os.path.abspath(path))
+    return os.path.join(head, CACHE_DIR, tail + ".schedule.npz")
+
+
+def _cache_key(path):
+    st = os.stat(path)
+    return {"version": CACHE_VERSION, "path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _load_cache(path, key):
+    try:
+        with np.load(_cache_path(path), allow_pickle=False) as npz:
+            header = json.loads(str(npz["__header__"]))
+            if header["key"] != key:
+                return None
+            epoch = header["epoch"]
+            return Schedule(npz["times"], npz["values"], header["columns"],
+                            epoch=None if epoch is None else np.datetime64(epoch, "s"),
+                            period=header["period"], zone=header["zone"], source=header["key"]["path"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_cache(path, key, schedule):
+    cache = _cache_path(path)
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    header = {"key": key, "columns": schedule.columns, "period": schedule.period, "zone": schedule.zone,
+              "epoch": None if schedule.epoch is None else str(schedule.epoch)}
+    tmp = cache + ".tmp.npz"
+    np.savez(tmp, __header__=np.array(json.dumps(header)), times=schedule.times, values=schedule.values)
+    os.replace(tmp, cache)
+
+
+def compile_schedule(path):
+    """Schedule of path without the cache: trips for EV_trips-style CSVs, else a player."""
+    with open(path) as fh:
+        first = fh.readline()
+    if first.startswith(_TRIP_COLUMNS[0] + ","):
+        return compile_trips(path)
+    return parse_player(path)
+
+
+def load_schedule(path, cache=True):
+    """Compiled Schedule of a player, player-style CSV or EV_trips.csv, through the .gld_cache sidecar."""
+    if not cache:
+        return compile_schedule(path)
+    key = _cache_key(path)
+    schedule = _load_cache(path, key)
+    if schedule is not None:
+        return schedule
+    schedule = compile_schedule(path)
+    try:
+        _save_cache(path, key, schedule)
+    except OSError as e:
+        logger.warning(f"Could not write cache for {path}: {e}")
+    return schedule
+
+
+def load_schedules(paths, cache=True):
+    """{file stem: Schedule} of several files."""
+    return {os.path.splitext(os.path.basename(p))[0]: load_schedule(p, cache) for p in paths}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compile schedule/player files into cached lookup tables')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--at', nargs='+', type=float, default=[], help='look up these times (s after epoch)')
+    parser.add_argument('--horizon', nargs=3, type=float, metavar=('START', 'STEP', 'N'),
+                        help='look up N times from START every STEP seconds')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        start = time.perf_counter()
+        schedule = compile_schedule(path)
+        t_compile = time.perf_counter() - start
+        load_schedule(path)
+        start = time.perf_counter()
+        load_schedule(path)
+        t_cached = time.perf_counter() - start
+        span = f"epoch {schedule.epoch}" if schedule.epoch is not None else f"period {schedule.period} s"
+        print(f"{path}: {len(schedule)} points x {schedule.columns}, {span}, "
+              f"compile {t_compile * 1e3:.2f} ms, cached {t_cached * 1e3:.2f} ms")
+        if args.at:
+            for t, row in zip(args.at, schedule.at(np.array(args.at))):
+                print(f"    t={t:g} s: {row.tolist()}")
+        if args.horizon:
+            t0, step, n = args.horizon
+            times, values = schedule.horizon(t0, step, int(n))
+            for t, row in zip(times, values):
+                print(f"    t={t:g} s: {row.tolist()}")
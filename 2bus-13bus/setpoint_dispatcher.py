@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Send-on-change setpoint dispatcher for the EV controller endpoints.
+
+Remembers the last command sent to each EV_Controller/EVn endpoint and only
+sends when the command changes. Because GridLAB-D applies whichever message
+on gld_hlc_conn/EVn arrived last (see SYSTEM_DIAGRAM.txt), an optional
+keep-alive re-sends unchanged commands once they are keepalive seconds old,
+so a competing sender cannot hold an endpoint indefinitely.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SetpointDispatcher:
+    """
+    Per-endpoint command cache in front of helicsEndpointSendBytes.
+
+    keepalive is in simulation seconds; None or 0 disables re-sends.
+    """
+
+    def __init__(self, endpoints, keepalive=None, api=None):
+        if api is None:
+            import helics as api
+        self.h = api
+        self.endpoints = list(endpoints)
+        n = len(self.endpoints)
+        self.keepalive = keepalive or None
+        self.last_command = np.full(n, np.nan)
+        self.last_sent_time = np.full(n, -np.inf)
+        self.sent_per_endpoint = np.zeros(n, dtype=np.int64)
+        self.sent = 0
+        self.suppressed = 0
+        self.keepalives = 0
+
+    def due(self, setpoints, now):
+        """Boolean mask of endpoints that need a message for setpoints at now."""
+        wanted = ~np.isnan(setpoints)
+        changed = wanted & (setpoints != self.last_command)
+        if self.keepalive is None:
+            return changed, wanted
+        stale = wanted & ~changed & (now - self.last_sent_time >= self.keepalive)
+        self.keepalives += int(np.count_nonzero(stale))
+        return changed | stale, wanted
+
+    def dispatch(self, setpoints, commands, now):
+        """
+        Send commands[i] for every endpoint whose setpoint changed (or is due
+        a keep-alive). setpoints are in W, NaN meaning no command. Returns the
+        number of messages sent.
+        """
+        send_mask, wanted = self.due(setpoints, now)
+        idx = np.flatnonzero(send_mask)
+        send_bytes = self.h.helicsEndpointSendBytes
+        endpoints = self.endpoints
+        for i in idx.tolist():
+            send_bytes(endpoints[i], commands[i])
+        self.last_command[idx] = setpoints[idx]
+        self.last_sent_time[idx] = now
+        self.sent_per_endpoint[idx] += 1
+        n_sent = len(idx)
+        self.sent += n_sent
+        self.suppressed += int(np.count_nonzero(wanted)) - n_sent
+        return n_sent
+
+    def forget(self):
+        """Drop the cache so the next dispatch re-sends every command."""
+        self.last_command.fill(np.nan)
+        self.last_sent_time.fill(-np.inf)
+
+    def report(self):
+        total = self.sent + self.suppressed
+        share = 100.0 * self.suppressed / total if total else 0.0
+        return (f"messages sent={self.sent} (keep-alive {self.keepalives}) "
+                f"suppressed={self.suppressed} ({share:.1f}% of {total} commands)")
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Per-step phase timing for the controller federates.
+
+A StepProfiler splits every control step into named phases (time request,
+reading inputs, draining messages, control logic, recording, logging).
+lap(phase) charges the monotonic time since the previous lap to that phase;
+a phase may be lapped more than once per step. end_step() then adds each
+phase's time in the step to its count, total, maximum and histogram
+(power-of-two nanosecond buckets). That is a few integer operations per
+phase and step, so the profiler can stay on for a whole run. At finalize,
+report() gives the totals, percentiles and histograms, and with raw_path set
+every step's per-phase timings are written out as well (CSV, or the columnar
+.tlm format).
+
+Work after the loop (CSV export, plotting, finalizing the federate) is timed
+with lap_span(name) and reported with the totals.
+
+Disabled profiling uses NullProfiler, whose methods do nothing:
+
+    profiler = make_profiler(CONTROLLER_PHASES, enabled=True, raw_path="steps.csv")
+    profiler.start()
+    for t in clock:
+        profiler.lap(REQUEST_TIME)       # time blocked in helicsFederateRequestTime
+        ...
+        profiler.lap(CONTROL)
+        profiler.end_step(t)
+    profiler.start()
+    export_csv(...)
+    profiler.lap_span("export_csv")
+    profiler.finish(logger)         # report, and the raw dump if requested
+"""
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Phases of the controller steps
+REQUEST_TIME, READ_INPUTS, READ_MESSAGES, CONTROL, RECORD, LOG = range(6)
+CONTROLLER_PHASES = ("request_time", "read_inputs", "read_messages", "control", "record", "log")
+
+# Bucket k holds step times of [2**(k-1), 2**k) ns; 40 buckets reach 550 s
+N_BUCKETS = 40
+
+
+class StepProfiler:
+    """Phase counters, totals and log2 histograms, plus optional raw per-step timings."""
+
+    def __init__(self, phases, raw_path=None):
+        self.phases = list(phases)
+        n = len(self.phases)
+        self.counts = [0] * n
+        self.totals = [0] * n
+        self.maxima = [0] * n
+        self.histograms = [[0] * N_BUCKETS for _ in range(n)]
+        self.spans = {}
+        self.steps = 0
+        self.raw_path = raw_path
+        # Per-phase time (ns) of the current step, and of all steps when dumping
+        self._step = [0] * n
+        self._raw = [] if raw_path else None
+        self._clock = time.perf_counter_ns
+        self._last = self._clock()
+
+    def start(self):
+        """Restart the lap clock, e.g. right before the time loop."""
+        self._last = self._clock()
+
+    def lap(self, phase):
+        """Charge the time since the previous lap to phase."""
+        now = self._clock()
+        self._step[phase] += now - self._last
+        self._last = now
+
+    def end_step(self, t):
+        """Close the current step (simulation time t) and update the counters."""
+        self.steps += 1
+        step = self._step
+        for i, dt in enumerate(step):
+            if dt:
+                self.counts[i] += 1
+                self.totals[i] += dt
+                if dt > self.maxima[i]:
+                    self.maxima[i] = dt
+                self.histograms[i][min(dt.bit_length(), N_BUCKETS - 1)] += 1
+        if self._raw is not None:
+            self._raw.append([t] + step)
+        self._step = [0] * len(step)
+
+    def lap_span(self, name):
+        """Charge the time since the previous lap to the out-of-loop span name."""
+        now = self._clock()
+        self.spans[name] = self.spans.get(name, 0) + now - self._last
+        self._last = now
+
+    def percentile(self, phase, q):
+        """
+        Upper bucket edge (ns) below which a fraction q of the steps of phase
+        fall, capped at the largest step seen.
+        """
+        counts = np.array(self.histograms[phase])
+        if not counts.sum():
+            return 0
+        k = int(np.searchsorted(np.cumsum(counts), q * counts.sum()))
+        return min(1 << k, self.maxima[phase])
+
+    def summary(self):
+        """
+        ({phase: {count, total_s, mean_us, p50_us, p99_us, max_us}}, {span: s}).
+
+        count is the number of steps in which the phase ran; the other fields
+        are per step.
+        """
+        out = {}
+        for i, name in enumerate(self.phases):
+            n = self.counts[i]
+            out[name] = {
+                "count": n,
+                "total_s": self.totals[i] / 1e9,
+                "mean_us": self.totals[i] / n / 1e3 if n else 0.0,
+                "p50_us": self.percentile(i, 0.5) / 1e3,
+                "p99_us": self.percentile(i, 0.99) / 1e3,
+                "max_us": self.maxima[i] / 1e3,
+            }
+        return out, {name: ns / 1e9 for name, ns in self.spans.items()}
+
+    def report(self, histograms=True):
+        """Multi-line text of the per-phase totals, percentiles and histograms."""
+        phases, spans = self.summary()
+        step_total = sum(p["total_s"] for p in phases.values()) or 1.0
+        lines = [f"step profile: {self.steps} steps, {step_total:.3f} s in the time loop",
+                 f"  {'phase':<14} {'total (s)':>10} {'share':>6} {'mean (us)':>10} "
+                 f"{'p50 (us)':>9} {'p99 (us)':>9} {'max (us)':>10}"]
+        for name, p in phases.items():
+            lines.append(f"  {name:<14} {p['total_s']:>10.3f} {p['total_s'] / step_total:>6.1%} "
+                         f"{p['mean_us']:>10.1f} {p['p50_us']:>9.1f} {p['p99_us']:>9.1f} {p['max_us']:>10.1f}")
+        for name, seconds in spans.items():
+            lines.append(f"  {name:<14} {seconds:>10.3f}   (outside the loop)")
+        if histograms:
+            for i, name in enumerate(self.phases):
+                lines.append(f"  {name} histogram (steps below each bound):")
+                lines.extend(_histogram_lines(self.histograms[i]))
+        return "\n".join(lines)
+
+    def dump_raw(self, path=None):
+        """Write the raw per-step timings (ns); returns the path or None."""
+        path = path or self.raw_path
+        if not path or self._raw is None:
+            return None
+        columns = ["time"] + [f"{name}_ns" for name in self.phases]
+        data = np.array(self._raw, dtype=float).reshape(-1, len(columns))
+        if path.endswith(".tlm"):
+            from telemetry_recorder import TelemetryRecorder
+            with TelemetryRecorder(path, columns, max(len(data), 1)) as recorder:
+                for row in data:
+                    recorder.append(row)
+        else:
+            np.savetxt(path, data, delimiter=",", header=",".join(columns), comments="",
+                       fmt=["%.17g"] + ["%d"] * len(self.phases))
+        return path
+
+    def finish(self, log=logger, prefix=""):
+        """Log the report and dump the raw timings, as done at finalize."""
+        for line in self.report().splitlines():
+            log.info(f"{prefix}{line}")
+        path = self.dump_raw()
+        if path:
+            log.info(f"{prefix}raw step timings written to {path}")
+
+
+def _histogram_lines(counts, width=40):
+    nonzero = [k for k, c in enumerate(counts) if c]
+    if not nonzero:
+        return ["    (no steps)"]
+    peak = max(counts)
+    lines = []
+    for k in range(nonzero[0], nonzero[-1] + 1):
+        bar = "#" * max(1, round(width * counts[k] / peak)) if counts[k] else ""
+        lines.append(f"    < {_fmt_ns(1 << k):>8} {counts[k]:>8} {bar}")
+    return lines
+
+
+def _fmt_ns(ns):
+    for unit, scale in (("s", 1e9), ("ms", 1e6), ("us", 1e3)):
+        if ns >= scale:
+            return f"{ns / scale:.3g} {unit}"
+    return f"{ns} ns"
+
+
+class NullProfiler:
+    """Same interface as StepProfiler; does nothing."""
+
+    steps = 0
+
+    def start(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def end_step(self, t):
+        pass
+
+    def lap_span(self, name):
+        pass
+
+    def finish(self, log=logger, prefix=""):
+        pass
+
+
+def make_profiler(phases=CONTROLLER_PHASES, enabled=False, raw_path=None):
+    """StepProfiler when enabled, otherwise NullProfiler."""
+    return StepProfiler(phases, raw_path) if enabled else NullProfiler()
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Replay-driven surrogate of the GridLAB-D feeder federate (gld_hlc_conn).
+
+Stands in for 1c_IEEE_123_feeder.glm when exercising the EV controllers:
+publishes gld_hlc_conn/Sa|Sb|Sc from a recorded feeder-load trace
+(extracted_feeder_load.csv, or a controller output such as
+1c_EV_Outputs.csv), accepts setpoint messages on gld_hlc_conn/EV1..EV6 and
+adds a linear response of the feeder load to them:
+
+    P_phase(t) = split_phase * P_trace(t)
+                 + sum over EVs on the phase of gain_ev * (setpoint_ev - baseline_ev(t))
+
+baseline_ev(t) is the EV power recorded in the trace (EV columns in kW, as
+in 1c_EV_Outputs.csv) or the configured baseline_W. Reactive power follows
+the trace at the configured power factor. Each publish step the surrogate
+also reports every EV's power on its endpoint, as GridLAB-D does, so the
+controller sees readings. feeder_key and controller_key rename the
+gld_hlc_conn and EV_Controller prefixes, e.g. to stand in for feeder B
+(gld_hlc_conn_2, EV_Controller_2).
+
+Configuration is surrogate_feeder.json (any key may be omitted). Modes:
+    python surrogate_feeder.py                # zmq federate; start a broker and the controller
+    helics run --path=surrogate_cosim_runner.json
+    python surrogate_feeder.py --inproc       # broker, surrogate and EVFleet controller in one process
+"""
+import argparse
+import copy
+import csv
+import json
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+
+from ev_messages import decode, encode_string
+
+logger = logging.getLogger(__name__)
+
+PHASES = "abc"
+DEFAULT_CONFIG = {
+    "name": "surrogate_feeder",
+    # Key prefixes of the feeder's publications and endpoints and of the controller endpoints
+    "feeder_key": "gld_hlc_conn",
+    "controller_key": "EV_Controller",
+    "trace": "extracted_feeder_load.csv",
+    "trace_column": "feeder_load_W",
+    "trace_interval": 1200,
+    "publish_interval": 60,
+    "hours": 24,
+    "power_factor": 0.95,
+    "phase_split": [1 / 3, 1 / 3, 1 / 3],
+    "baseline_W": 200000.0,
+    # Phases follow mainglm.json (constant_power_A/B/C of each EV load)
+    "evs": {
+        "EV1": {"phase": "C", "gain": 1.0},
+        "EV2": {"phase": "B", "gain": 1.0},
+        "EV3": {"phase": "A", "gain": 1.0},
+        "EV4": {"phase": "C", "gain": 1.0},
+        "EV5": {"phase": "B", "gain": 1.0},
+        "EV6": {"phase": "A", "gain": 1.0},
+    },
+}
+
+
+def load_config(path=None):
+    """DEFAULT_CONFIG updated with the keys of a JSON file."""
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if path:
+        with open(path) as fh:
+            config.update(json.load(fh))
+    return config
+
+
+def load_trace(path, column="feeder_load_W", ev_names=()):
+    """
+    (times s, load W, {ev: recorded power W}) of a trace CSV.
+
+    times is None unless the CSV has a "time" column (hours). column falls
+    back to "feeder_load" (the current controller output name); EV columns
+    are in kW and missing readings are carried forward.
+    """
+    with open(path, newline="") as fh:
+        rows = list(csv.reader(fh))
+    header, rows = rows[0], [r for r in rows[1:] if r]
+    cols = {name: i for i, name in enumerate(header)}
+    if column not in cols:
+        column = "feeder_load" if "feeder_load" in cols else header[0]
+
+    def values(name):
+        return np.array([float(r[cols[name]]) if r[cols[name]] else np.nan for r in rows])
+
+    times = values("time") * 3600.0 if "time" in cols else None
+    evs = {}
+    for name in ev_names:
+        if name in cols:
+            kw = values(name)
+            # Carry the last reading forward over steps with no message
+            idx = np.where(np.isnan(kw), 0, np.arange(len(kw)))
+            np.maximum.accumulate(idx, out=idx)
+            evs[name] = np.nan_to_num(kw[idx]) * 1000.0
+    return times, values(column), evs
+
+
+class SurrogateFeeder:
+    """Trace replay plus linear EV response; the federate-independent model."""
+
+    def __init__(self, config):
+        self.config = config
+        self.ev_names = list(config["evs"])
+        self.phase = np.array([PHASES.index(config["evs"][n]["phase"].lower()) for n in self.ev_names])
+        self.gain = np.array([config["evs"][n].get("gain", 1.0) for n in self.ev_names])
+        times, self.trace, recorded = load_trace(config["trace"], config["trace_column"], self.ev_names)
+        n = len(self.trace)
+        self.times = times if times is not None else np.arange(n) * float(config["trace_interval"])
+        self.baseline = np.empty((len(self.ev_names), n))
+        for i, name in enumerate(self.ev_names):
+            self.baseline[i] = recorded.get(name, config["evs"][name].get("baseline_W", config["baseline_W"]))
+        self.setpoints = self.baseline[:, 0].copy()
+        self.split = np.asarray(config["phase_split"], dtype=float)
+        self.q_ratio = math.tan(math.acos(config["power_factor"]))
+        self.commands = 0
+        # (time s, total P W, sum of applied setpoints W) of every publish step
+        self.history = []
+
+    def _index(self, t):
+        return max(int(np.searchsorted(self.times, t, side="right")) - 1, 0)
+
+    def apply(self, ev_index, value):
+        """New setpoint (W) for one EV."""
+        self.setpoints[ev_index] = value
+        self.commands += 1
+
+    def phase_load(self, t):
+        """Complex load (VA) per phase, shape (3,), at time t (s)."""
+        k = self._index(t)
+        p_base = self.trace[k] * self.split
+        delta = np.bincount(self.phase, weights=self.gain * (self.setpoints - self.baseline[:, k]),
+                            minlength=3)
+        return (p_base + delta) + 1j * (p_base * self.q_ratio)
+
+
+def run_surrogate(fed, model, api=None):
+    """Register gld_hlc_conn/* (the feeder_key) on fed and replay the day; fed must be in created state."""
+    if api is None:
+        import helics as api
+    h = api
+    feeder, controller = model.config["feeder_key"], model.config["controller_key"]
+    pubs = [h.helicsFederateRegisterGlobalPublication(fed, f"{feeder}/S{ph}", h.HELICS_DATA_TYPE_COMPLEX, "VA")
+            for ph in PHASES]
+    endpoints = []
+    for name in model.ev_names:
+        ep = h.helicsFederateRegisterGlobalEndpoint(fed, f"{feeder}/{name}", "")
+        h.helicsEndpointSetDefaultDestination(ep, f"{controller}/{name}")
+        endpoints.append(ep)
+    h.helicsFederateEnterExecutingMode(fed)
+
+    total = int(3600 * model.config["hours"])
+    step = int(model.config["publish_interval"])
+    granted = -1
+    for t in range(0, total, step):
+        while granted < t:
+            granted = h.helicsFederateRequestTime(fed, t)
+        for i, ep in enumerate(endpoints):
+            while h.helicsEndpointHasMessage(ep):
+                try:
+                    _, value = decode(h.helicsMessageGetBytes(h.helicsEndpointGetMessage(ep)))
+                except (ValueError, UnicodeDecodeError) as e:
+                    logger.warning(f"Surrogate: unreadable setpoint for {model.ev_names[i]}: {e}")
+                    continue
+                model.apply(i, value.real)
+        load = model.phase_load(granted)
+        for pub, s in zip(pubs, load.tolist()):
+            h.helicsPublicationPublishComplex(pub, s.real, s.imag)
+        model.history.append((granted, load.real.sum(), model.setpoints.sum()))
+        for ep, p in zip(endpoints, model.setpoints.tolist()):
+            h.helicsEndpointSendBytes(ep, encode_string(p))
+    h.helicsFederateDisconnect(fed)
+    return model
+
+
+def _federate_info(h, core_type, core_init):
+    fi = h.helicsCreateFederateInfo()
+    h.helicsFederateInfoSetCoreTypeFromString(fi, core_type)
+    h.helicsFederateInfoSetCoreInitString(fi, core_init)
+    # Step on the requested times only, like GridLAB-D on its period; EV
+    # messages arriving in between are read at the next step
+    h.helicsFederateInfoSetFlagOption(fi, h.HELICS_FLAG_UNINTERRUPTIBLE, True)
+    return fi
+
+
+def _inproc_controller(h, broker_name, model, interval, lower, upper, table, result, plan=None,
+                       overload_at_upper=True):
+    """The 1bc_EV_Controller.py time loop on an EVFleet, without logging or plots."""
+    from ev_fleet import EVFleet, primary_setpoint_table
+
+    fed = h.helicsCreateCombinationFederate("EVControllerSim", _federate_info(h, "inproc", f"--broker={broker_name}"))
+    feeder, controller = model.config["feeder_key"], model.config["controller_key"]
+    endpoints = []
+    for name in model.ev_names:
+        ep = h.helicsFederateRegisterGlobalEndpoint(fed, f"{controller}/{name}", "")
+        h.helicsEndpointSetDefaultDestination(ep, f"{feeder}/{name}")
+        endpoints.append(ep)
+    inputs = [h.helicsFederateRegisterSubscription(fed, f"{feeder}/S{ph}", "VA") for ph in PHASES]
+    for sub in inputs:
+        h.helicsInputSetDefaultComplex(sub, 0, 0)
+    if table is None:
+        table = primary_setpoint_table(len(endpoints))
+    fleet = EVFleet(model.ev_names, endpoints, inputs, table, lower, upper, api=h,
+                    overload_at_upper=overload_at_upper)
+    if plan is not None:
+        fleet.follow_plan(plan)
+    h.helicsFederateEnterExecutingMode(fed)
+    total = int(3600 * model.config["hours"])
+    granted = -1
+    busy = 0.0
+    load, branches, sent = [], [], []
+    for t in range(0, total, interval):
+        while granted < t:
+            granted = h.helicsFederateRequestTime(fed, t)
+        start = time.perf_counter()
+        s = fleet.read_load()
+        fleet.read_messages()
+        branches.append(fleet.step(s.real, now=granted))
+        busy += time.perf_counter() - start
+        load.append(s.real)
+        sent.append(fleet.last_sent)
+    h.helicsFederateDisconnect(fed)
+    result["load"] = np.array(load)
+    result["branches"] = np.array(branches)
+    result["sent"] = np.array(sent)
+    result["control_s"] = busy
+
+
+def run_inprocess(config, interval=60, lower=2.6e6, upper=4.8e6, table=None, broker_name="surrogate_inproc",
+                  plan=None, overload_at_upper=True):
+    """
+    Surrogate and EVFleet controller on an inproc broker; returns (result, wall s).
+
+    table is the (3, n_evs) setpoint table of the controller (default: the
+    primary one) and overload_at_upper its boundary at the upper limit (False
+    for the secondary table, see ev_fleet.classify_load); with a
+    dispatch_planner.DispatchPlan the controller follows the plan instead.
+    result holds the controller's load, branches and sent arrays, its time in
+    the control steps (control_s), the commands applied by the surrogate and
+    its history.
+    """
+    import helics as h
+
+    broker = h.helicsCreateBroker("inproc", broker_name, "-f 2 --loglevel=error")
+    model = SurrogateFeeder(config)
+    result = {}
+    start = time.perf_counter()
+
+    def feeder():
+        fed = h.helicsCreateCombinationFederate(config["name"], _federate_info(h, "inproc", f"--broker={broker_name}"))
+        run_surrogate(fed, model, api=h)
+
+    threads = [threading.Thread(target=feeder),
+               threading.Thread(target=_inproc_controller,
+                                args=(h, broker_name, model, interval, lower, upper, table, result, plan,
+                                      overload_at_upper))]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    h.helicsBrokerWaitForDisconnect(broker, -1)
+    h.helicsBrokerFree(broker)
+    result["commands"] = model.commands
+    result["history"] = np.array(model.history).reshape(-1, 3)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Replay-driven surrogate feeder federate')
+    parser.add_argument('-c', '--config', default='surrogate_feeder.json')
+    parser.add_argument('--trace', help='override the trace CSV of the config')
+    parser.add_argument('--inproc', action='store_true',
+                        help='run surrogate and an EVFleet controller on an in-process broker')
+    parser.add_argument('--interval', type=int, default=60, help='controller interval for --inproc (s)')
+    parser.add_argument('--core-type', default='zmq')
+    parser.add_argument('--broker', default='', help='core init string, e.g. --broker_address=tcp://127.0.0.1')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.trace:
+        config["trace"] = args.trace
+
+    if args.inproc:
+        result, wall = run_inprocess(config, args.interval)
+        counts = np.bincount(result["branches"], minlength=3)
+        print(f"{config['hours']} h with {config['trace']} in {wall:.2f} s: {len(result['load'])} control steps, "
+              f"{result['commands']} EV commands applied")
+        print(f"  feeder load {result['load'].min() / 1e6:.2f} .. {result['load'].max() / 1e6:.2f} MW; "
+              f"steps overload/safe/low = {counts.tolist()}")
+    else:
+        import helics as h
+        fed = h.helicsCreateCombinationFederate(
+            config["name"], _federate_info(h, args.core_type, f"--federates=1 {args.broker}".strip()))
+        logger.info(f"{config['name']}: replaying {config['trace']}")
+        start = time.perf_counter()
+        model = run_surrogate(fed, SurrogateFeeder(config), api=h)
+        h.helicsFederateFree(fed)
+        logger.info(f"{config['name']}: {model.commands} EV commands applied, "
+                    f"wall time {time.perf_counter() - start:.2f} s")
+        h.helicsCloseLibrary()
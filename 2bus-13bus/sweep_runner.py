@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel parameter sweep of the EV controller policy.
+
+Evaluates the overload / safe-range / low-load policy of the controllers for
+every combination of feeder traces, controller intervals, setpoint tables and
+lower/upper feeder limits, against the replay surrogate of surrogate_feeder.py
+(the recorded trace plus the linear EV response), and writes one results row
+per configuration:
+
+    peak_load_W        highest total feeder load published
+    time_over_limit_s  time the load was at or above the configuration's upper limit
+    ev_energy_kWh      energy delivered to the EVs (sum of applied setpoints)
+    commands           EV setpoint messages sent by the controller
+    *_steps            control steps per branch
+
+The default "array" engine steps all configurations that share a trace and
+interval in lock step on NumPy arrays, reproducing the message timing of the
+co-simulation (the controller sees the load published before its step, the
+surrogate applies commands sent before its step). The "helics" engine runs
+each configuration as a real in-process federation (surrogate_feeder.run_inprocess)
+to cross-check it. Either way the work is spread over a process pool.
+
+Values are lists, or start:stop:step ranges (stop included). Tables are
+"primary", "secondary" or a JSON file with a 3 x n_evs list (null = no command).
+
+    python sweep_runner.py --upper 4.2e6 4.8e6 --interval 60 300 --table primary secondary
+    python sweep_runner.py --upper 4.0e6:5.0e6:0.05e6 --lower 2.0e6:3.0e6:0.05e6 -o sweep_results.csv
+    python sweep_runner.py --grid sweep.json --trace extracted_feeder_load.csv 1c_EV_Outputs.csv
+    python sweep_runner.py --engine helics --upper 4.2e6 4.8e6
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ev_fleet import (
+    BRANCH_NAMES, PLANNED, classify_load, primary_setpoint_table, secondary_setpoint_table, upper_is_overload
+)
+from surrogate_feeder import SurrogateFeeder, load_config
+
+logger = logging.getLogger(__name__)
+
+SweepPoint = namedtuple("SweepPoint", ["trace", "interval", "table", "lower", "upper"])
+
+RESULT_COLUMNS = list(SweepPoint._fields) + [
+    "peak_load_W", "time_over_limit_s", "ev_energy_kWh", "commands",
+    "overload_steps", "safe_steps", "low_steps",
+]
+
+TABLES = {"primary": primary_setpoint_table, "secondary": secondary_setpoint_table}
+
+DEFAULT_GRID = {
+    "trace": ["extracted_feeder_load.csv"],
+    "interval": [60],
+    "table": ["primary"],
+    "lower": [2.6e6],
+    "upper": [4.2e6, 4.8e6],
+}
+
+# Surrogate models of the traces already loaded by this worker process
+_MODELS = {}
+
+
+def parse_values(values, kind=float):
+    """Expand "start:stop:step" entries (stop included) and convert the rest."""
+    out = []
+    for value in values:
+        if isinstance(value, str) and value.count(":") == 2:
+            start, stop, step = (float(v) for v in value.split(":"))
+            n = int(round((stop - start) / step)) + 1
+            out.extend(kind(v) for v in np.round(start + step * np.arange(n), 9))
+        else:
+            out.append(kind(value))
+    return out
+
+
+def load_table(spec, n_evs):
+    """(3, n_evs) setpoint table (W, NaN = no command) by name or JSON file."""
+    if spec in TABLES:
+        return TABLES[spec](n_evs)
+    with open(spec) as fh:
+        rows = json.load(fh)
+    table = np.array([[np.nan if v is None else v for v in row] for row in rows], dtype=float)
+    if table.shape != (3, n_evs):
+        raise ValueError(f"{spec}: setpoint table shape {table.shape}, expected (3, {n_evs})")
+    return table
+
+
+def table_overload_at_upper(spec):
+    """OVERLOAD boundary of a table spec: the named table's controller, else load >= upper."""
+    return upper_is_overload(TABLES[spec]) if spec in TABLES else True
+
+
+def expand_grid(grid):
+    """Every SweepPoint of the grid, skipping lower >= upper."""
+    points = itertools.product(
+        grid["trace"],
+        parse_values(grid["interval"], int),
+        grid["table"],
+        parse_values(grid["lower"]),
+        parse_values(grid["upper"]),
+    )
+    return [SweepPoint(*p) for p in points if p[3] < p[4]]
+
+
+def _model(config, trace):
+    if trace not in _MODELS:
+        _MODELS[trace] = SurrogateFeeder(dict(config, trace=trace))
+    return _MODELS[trace]
+
+
+def simulate_batch(model, interval, tables, lower, upper, overload_at_upper=True):
+    """
+    Closed-loop policy vs. surrogate for B configurations in lock step.
+
+    tables is (B, 3, n_evs), lower and upper are (B,), overload_at_upper is
+    a bool or (B,) bools (see ev_fleet.classify_load). Returns a dict of (B,)
+    metric arrays (see RESULT_COLUMNS).
+    """
+    publish = int(model.config["publish_interval"])
+    total = int(3600 * model.config["hours"])
+    times = sorted(set(range(0, total, publish)) | set(range(0, total, interval)))
+    n_cfg = len(tables)
+    rows = np.arange(n_cfg)
+    base_load = model.trace * model.split.sum()
+    # Latest command received by the surrogate per EV, and the load the
+    # controller can see (0 until the first publication, like the input default)
+    received = np.repeat(model.baseline[:, :1].T, n_cfg, axis=0)
+    visible = np.zeros(n_cfg)
+    peak = np.full(n_cfg, -np.inf)
+    over = np.zeros(n_cfg)
+    energy = np.zeros(n_cfg)
+    commands = np.zeros(n_cfg, dtype=np.int64)
+    branch_steps = np.zeros((n_cfg, 3), dtype=np.int64)
+    for t in times:
+        published = t % publish == 0
+        if published:
+            k = model._index(t)
+            load = base_load[k] + (received - model.baseline[:, k]) @ model.gain
+            np.maximum(peak, load, out=peak)
+            over += (load >= upper) * publish
+            energy += received.sum(axis=1) * publish
+        if t % interval == 0:
+            branch = classify_load(visible, lower, upper, overload_at_upper)
+            branch_steps[rows, branch] += 1
+            cmds = tables[rows, branch]
+            sent = ~np.isnan(cmds)
+            commands += sent.sum(axis=1)
+            received = np.where(sent, cmds, received)
+        if published:
+            visible = load
+    return {
+        "peak_load_W": peak,
+        "time_over_limit_s": over,
+        "ev_energy_kWh": energy / 3.6e6,
+        "commands": commands,
+        "overload_steps": branch_steps[:, 0],
+        "safe_steps": branch_steps[:, 1],
+        "low_steps": branch_steps[:, 2],
+    }
+
+
+def _rows(points, metrics):
+    return [list(p) + [metrics[c][i].item() for c in RESULT_COLUMNS[len(SweepPoint._fields):]]
+            for i, p in enumerate(points)]
+
+
+def run_array(config, points):
+    """Result rows of points that share one trace and interval."""
+    model = _model(config, points[0].trace)
+    n_evs = len(model.ev_names)
+    tables = {spec: load_table(spec, n_evs) for spec in {p.table for p in points}}
+    metrics = simulate_batch(
+        model, points[0].interval,
+        np.stack([tables[p.table] for p in points]),
+        np.array([p.lower for p in points]),
+        np.array([p.upper for p in points]),
+        np.array([table_overload_at_upper(p.table) for p in points]),
+    )
+    return _rows(points, metrics)
+
+
+def run_helics(config, points):
+    """Result rows of points, each run as an in-process HELICS federation."""
+    from surrogate_feeder import run_inprocess
+
+    out = []
+    for n, p in enumerate(points):
+        cfg = dict(config, trace=p.trace)
+        n_evs = len(cfg["evs"])
+        result, _ = run_inprocess(cfg, p.interval, p.lower, p.upper, load_table(p.table, n_evs),
+                                  broker_name=f"sweep_{os.getpid()}_{n}",
+                                  overload_at_upper=table_overload_at_upper(p.table))
+        history = result["history"]
+        publish = int(cfg["publish_interval"])
+        branch_steps = np.bincount(result["branches"], minlength=3)
+        metrics = {
+            "peak_load_W": np.array([history[:, 1].max()]),
+            "time_over_limit_s": np.array([float(np.sum(history[:, 1] >= p.upper) * publish)]),
+            "ev_energy_kWh": np.array([history[:, 2].sum() * publish / 3.6e6]),
+            "commands": np.array([int(result["sent"].sum())]),
+            "overload_steps": branch_steps[:1],
+            "safe_steps": branch_steps[1:2],
+            "low_steps": branch_steps[2:],
+        }
+        out.extend(_rows([p], metrics))
+    return out
+
+
+ENGINES = {"array": run_array, "helics": run_helics}
+
+
+def _run_chunk(args):
+    engine, config, points = args
+    return ENGINES[engine](config, points)
+
+
+def chunk_points(points, engine, workers):
+    """Split points into pool tasks: lock-step batches per (trace, interval) for the array engine."""
+    if engine == "helics":
+        return [[p] for p in points]
+    groups = {}
+    for p in points:
+        groups.setdefault((p.trace, p.interval), []).append(p)
+    # Enough batches to keep every worker busy, large enough to amortize the step loop
+    size = max(16, -(-len(points) // (4 * workers)))
+    return [group[i:i + size] for group in groups.values() for i in range(0, len(group), size)]
+
+
+def run_sweep(points, config, engine="array", workers=None):
+    """Result rows (in points order) of every SweepPoint, on a process pool."""
+    workers = workers or os.cpu_count() or 1
+    chunks = chunk_points(points, engine, workers)
+    tasks = [(engine, config, chunk) for chunk in chunks]
+    if workers == 1 or len(tasks) < 2:
+        results = [_run_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_chunk, tasks))
+    order = {p: i for i, p in enumerate(points)}
+    rows = [row for chunk in results for row in chunk]
+    rows.sort(key=lambda row: order[SweepPoint(*row[:len(SweepPoint._fields)])])
+    return rows
+
+
+def write_results(rows, path):
+    with open(path, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(RESULT_COLUMNS)
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Parallel sweep of controller limits, intervals and setpoint tables')
+    parser.add_argument('--grid', help='JSON file with trace/interval/table/lower/upper lists')
+    parser.add_argument('--trace', nargs='+', help='feeder traces (CSV, as for surrogate_feeder.py)')
+    parser.add_argument('--interval', nargs='+', help='controller intervals (s)')
+    parser.add_argument('--table', nargs='+', help=f'setpoint tables: {", ".join(TABLES)} or JSON files')
+    parser.add_argument('--lower', nargs='+', help='feeder_limit_lower values (W)')
+    parser.add_argument('--upper', nargs='+', help='feeder_limit_upper values (W)')
+    parser.add_argument('-c', '--config', default='surrogate_feeder.json', help='surrogate configuration')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='array')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (1 = no pool)')
+    parser.add_argument('-o', '--output', default='sweep_results.csv')
+    parser.add_argument('--top', type=int, default=10, help='configurations to print')
+    args = parser.parse_args()
+
+    grid = dict(DEFAULT_GRID)
+    if args.grid:
+        with open(args.grid) as fh:
+            grid.update(json.load(fh))
+    for key in DEFAULT_GRID:
+        if getattr(args, key):
+            grid[key] = getattr(args, key)
+    config = load_config(args.config)
+    points = expand_grid(grid)
+
+    start = time.perf_counter()
+    rows = run_sweep(points, config, args.engine, args.workers)
+    wall = time.perf_counter() - start
+    write_results(rows, args.output)
+    print(f"{len(rows)} configurations ({args.engine} engine) in {wall:.2f} s, "
+          f"{len(rows) / wall * 3600:.0f} per hour; results in {args.output}")
+
+    # Least time over the limit first, then fewest commands
+    col = {name: i for i, name in enumerate(RESULT_COLUMNS)}
+    best = sorted(rows, key=lambda r: (r[col["time_over_limit_s"]], r[col["commands"]]))[:args.top]
+    print(f"{'trace':<28} {'int':>4} {'table':<10} {'lower MW':>8} {'upper MW':>8} {'peak MW':>8} "
+          f"{'over (h)':>8} {'EV kWh':>9} {'cmds':>6}  steps {'/'.join(BRANCH_NAMES[:PLANNED])}")
+    for r in best:
+        print(f"{os.path.basename(r[col['trace']]):<28} {r[col['interval']]:>4} {r[col['table']]:<10} "
+              f"{r[col['lower']] / 1e6:>8.3f} {r[col['upper']] / 1e6:>8.3f} {r[col['peak_load_W']] / 1e6:>8.3f} "
+              f"{r[col['time_over_limit_s']] / 3600:>8.2f} {r[col['ev_energy_kWh']]:>9.0f} {r[col['commands']]:>6}  "
+              f"{r[col['overload_steps']]}/{r[col['safe_steps']]}/{r[col['low_steps']]}")
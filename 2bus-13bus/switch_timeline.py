@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Switch-status timeline engine for GridLAB-D sw_status_*.csv recorders.
+
+Replaces the per-EV switch_status_EV*_plotting.py scripts. Any number of
+switch recorders are loaded concurrently in a process pool (through the
+gld_csv cache). Each switch is kept as a run-length-encoded OPEN/CLOSED
+series, and durations, transition counts and islanding intervals are
+computed for all switches at once on the concatenated runs.
+
+Switch names come from the file names: sw_status_l5_EV1.csv -> "l5_EV1".
+An EV is islanded while its grid switch (sw_status_<link>_EVn) is OPEN and
+its storage switch (sw_status_stor_EVn) is CLOSED, see GRID_DIAGRAM.md.
+
+    python switch_timeline.py                        # every sw_status*.csv here
+    python switch_timeline.py --plot EV1             # step plot of EV1's switches
+    python switch_timeline.py 'run42/sw_status_*.csv' --workers 8
+"""
+import argparse
+import glob
+import logging
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gld_csv import load_gld_csv
+
+logger = logging.getLogger(__name__)
+
+OPEN = 0
+CLOSED = 1
+STATE_NAMES = ("OPEN", "CLOSED")
+STORAGE_PREFIX = "stor_"
+_EV_RE = re.compile(r"(?:^|_)(EV\d+)$")
+
+# Runs of one switch: run_start (s since epoch) and run_state, with end the
+# time (s) at which the last recorded sample stops being valid
+SwitchSeries = namedtuple("SwitchSeries", ["name", "run_start", "run_state", "end"])
+
+
+def switch_name(path):
+    """sw_status_l5_EV1.csv -> l5_EV1 (sw_status.csv -> sw_status)."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem[len("sw_status_"):] if stem.startswith("sw_status_") else stem
+
+
+def encode_runs(times, states):
+    """Run-length encode a sampled state series; returns (run_start, run_state)."""
+    keep = np.ones(len(states), dtype=bool)
+    keep[1:] = states[1:] != states[:-1]
+    return times[keep], states[keep]
+
+
+def load_switch(path, cache=True):
+    """
+    SwitchSeries of one recorder file (None if it holds no samples).
+
+    The last sample is taken to hold for one recorder interval.
+    """
+    table = load_gld_csv(path, cache=cache)
+    if "status" not in table.data or len(table.data["status"]) == 0:
+        return None
+    times = table.data["timestamp"].astype("datetime64[s]").astype(np.int64)
+    states = (table.data["status"] == "CLOSED").astype(np.int8)
+    interval = table.meta.get("interval")
+    if not isinstance(interval, int) or interval <= 0:
+        interval = int(np.median(np.diff(times))) if len(times) > 1 else 0
+    run_start, run_state = encode_runs(times, states)
+    return SwitchSeries(switch_name(path), run_start, run_state, int(times[-1]) + interval)
+
+
+def _load_switch(path):
+    try:
+        return load_switch(path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Skipping {path}: {e}")
+        return None
+
+
+def load_timelines(paths, workers=None):
+    """
+    Load switch recorders concurrently and return a SwitchTimelines.
+
+    workers=1 loads in this process; otherwise a ProcessPoolExecutor with
+    workers processes (default: one per CPU) parses the files, and only the
+    run-length-encoded runs travel back.
+    """
+    paths = list(paths)
+    if workers == 1 or len(paths) < 2:
+        series = [_load_switch(p) for p in paths]
+    else:
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(paths) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            series = list(pool.map(_load_switch, paths, chunksize=chunksize))
+    return SwitchTimelines([s for s in series if s is not None])
+
+
+class SwitchTimelines:
+    """
+    Run-length-encoded status of many switches, concatenated.
+
+    The runs of switch i are run_start/run_state[offsets[i]:offsets[i + 1]];
+    run_switch holds the switch index of every run and end the end time of
+    every switch, run_end the end of every run. Times are seconds since the epoch of the (wall-clock)
+    GridLAB-D timestamps.
+    """
+
+    def __init__(self, series):
+        self.names = [s.name for s in series]
+        self._index = {name: i for i, name in enumerate(self.names)}
+        counts = np.array([len(s.run_start) for s in series], dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.run_start = np.concatenate([s.run_start for s in series]) if series else np.empty(0, np.int64)
+        self.run_state = np.concatenate([s.run_state for s in series]) if series else np.empty(0, np.int8)
+        self.run_switch = np.repeat(np.arange(len(series)), counts)
+        self.end = np.array([s.end for s in series], dtype=np.int64)
+        self.run_end = self._run_end()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def runs(self, name):
+        """(run_start, run_end, run_state) of one switch."""
+        i = self._index[name]
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return self.run_start[lo:hi], self.run_end[lo:hi], self.run_state[lo:hi]
+
+    def _run_end(self):
+        """End time of every run: the next run's start or the switch end."""
+        run_end = np.empty_like(self.run_start)
+        run_end[:-1] = self.run_start[1:]
+        last = self.offsets[1:] - 1
+        nonempty = self.offsets[1:] > self.offsets[:-1]
+        run_end[last[nonempty]] = self.end[nonempty]
+        return run_end
+
+    def state_at(self, name, t):
+        """State(s) of a switch at time(s) t (s); -1 outside its record."""
+        start, end, state = self.runs(name)
+        t = np.asarray(t)
+        idx = np.searchsorted(start, t, side="right") - 1
+        out = np.where(idx >= 0, state[np.clip(idx, 0, None)], -1)
+        return np.where(t < end[-1], out, -1) if len(end) else np.full(t.shape, -1)
+
+    def summary(self):
+        """
+        Per-switch arrays, all switches in one pass: closed_s, open_s,
+        transitions (state changes) and runs.
+        """
+        n = len(self.names)
+        duration = (self.run_end - self.run_start).astype(float)
+        closed = self.run_state == CLOSED
+        runs = np.bincount(self.run_switch, minlength=n)
+        return {
+            "closed_s": np.bincount(self.run_switch, weights=duration * closed, minlength=n),
+            "open_s": np.bincount(self.run_switch, weights=duration * ~closed, minlength=n),
+            "transitions": np.maximum(runs - 1, 0),
+            "runs": runs,
+        }
+
+    def ev_pairs(self):
+        """{EVn: (grid switch, storage switch)} for EVs that have both."""
+        grid, storage = {}, {}
+        for name in self.names:
+            m = _EV_RE.search(name)
+            if m is None:
+                continue
+            (storage if name.startswith(STORAGE_PREFIX) else grid)[m.group(1)] = name
+        return {ev: (grid[ev], storage[ev]) for ev in sorted(grid) if ev in storage}
+
+    def islanding_intervals(self, grid, storage):
+        """(start, end) pairs (s) during which grid is OPEN and storage CLOSED."""
+        g_start, g_end, _ = self.runs(grid)
+        s_start, s_end, _ = self.runs(storage)
+        if not len(g_start) or not len(s_start):
+            return np.empty((0, 2), dtype=np.int64)
+        lo, hi = max(g_start[0], s_start[0]), min(g_end[-1], s_end[-1])
+        edges = np.union1d(g_start, s_start)
+        edges = np.concatenate([[lo], edges[(edges > lo) & (edges < hi)], [hi]])
+        points = edges[:-1]
+        islanded = (self.state_at(grid, points) == OPEN) & (self.state_at(storage, points) == CLOSED)
+        # Merge consecutive islanded segments into intervals
+        change = np.diff(np.concatenate([[0], islanded.astype(np.int8), [0]]))
+        starts = edges[:-1][change[:-1] == 1]
+        ends = edges[1:][change[1:] == -1]
+        return np.column_stack([starts, ends])
+
+    def islanding(self):
+        """{EVn: islanding intervals} for every EV with a grid and a storage switch."""
+        return {ev: self.islanding_intervals(g, s) for ev, (g, s) in self.ev_pairs().items()}
+
+
+def _fmt_time(t):
+    return str(np.datetime64(int(t), "s")).replace("T", " ")
+
+
+def plot(timelines, names, title):
+    """Step plot of the given switches, in the style of the old per-EV scripts."""
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(12, 5))
+    for k, name in enumerate(names):
+        start, end, state = timelines.runs(name)
+        x = np.append(start, end[-1:]).astype("datetime64[s]")
+        y = np.append(state, state[-1:])
+        plt.step(x, y, label=f"SW-{name}", where='post', linestyle='-' if k == 0 else '--')
+    plt.ylim(-0.2, 1.2)
+    plt.yticks([OPEN, CLOSED], list(STATE_NAMES))
+    plt.xlabel('Timestamp')
+    plt.ylabel('Switch Status')
+    plt.title(title)
+    plt.legend()
+    plt.grid(True)
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Switch status timelines, durations and islanding')
+    parser.add_argument('paths', nargs='*', default=['sw_status*.csv'],
+                        help='recorder files or glob patterns')
+    parser.add_argument('--workers', type=int, default=None, help='loader processes (1 = no pool)')
+    parser.add_argument('--plot', metavar='EV', help='plot every switch whose name ends in _EV')
+    args = parser.parse_args()
+
+    paths = sorted({p for pattern in args.paths for p in glob.glob(pattern)})
+    timelines = load_timelines(paths, args.workers)
+    summary = timelines.summary()
+
+    print(f"{'switch':<20} {'closed (h)':>10} {'open (h)':>9} {'transitions':>11}")
+    for i, name in enumerate(timelines.names):
+        print(f"{name:<20} {summary['closed_s'][i] / 3600:>10.2f} {summary['open_s'][i] / 3600:>9.2f} "
+              f"{summary['transitions'][i]:>11}")
+    for ev, intervals in timelines.islanding().items():
+        total = float(np.sum(intervals[:, 1] - intervals[:, 0])) / 3600 if len(intervals) else 0.0
+        print(f"{ev}: islanded {len(intervals)} time(s), {total:.2f} h")
+        for start, end in intervals:
+            print(f"    {_fmt_time(start)} -> {_fmt_time(end)}")
+
+    if args.plot:
+        names = [n for n in timelines.names if n.endswith("_" + args.plot)]
+        # Grid switch first, storage switch dashed, as in the old scripts
+        names.sort(key=lambda n: n.startswith(STORAGE_PREFIX))
+        plot(timelines, names, f"{args.plot} Switch Status Over Time")
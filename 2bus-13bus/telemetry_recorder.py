@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Preallocated, streaming telemetry recorder for the EV controllers.
+
+Samples go into a fixed-size (columns x rows) float64 buffer. When the buffer
+is full it is appended to an on-disk columnar file as one block, so memory
+stays bounded for long or fine-grained runs and a crash keeps every block
+already flushed.
+
+File layout (.tlm):
+    b"TLM1" | uint32 header length | JSON header {"columns": [...]}
+    then repeated blocks: uint64 nrows | float64[ncols, nrows] (column-major)
+"""
+import json
+import logging
+import math
+import os
+import struct
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TLM1"
+DEFAULT_CHUNK_ROWS = 256
+
+
+def buffer_rows(total_interval, update_interval, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Rows per buffer: the whole run if it is short, else chunk_rows."""
+    n_steps = max(1, math.ceil(total_interval / update_interval))
+    return min(n_steps, chunk_rows)
+
+
+class TelemetryRecorder:
+    """
+    Fixed-size column buffers flushed to a .tlm file in blocks.
+
+    columns is the ordered list of column names; every appended row must
+    supply one value per column. With resume=(column, limit) an existing file
+    with the same columns is kept up to its first row whose column exceeds
+    limit (or up to a block cut short by a crash) and appended to.
+    """
+
+    def __init__(self, path, columns, rows, resume=None):
+        self.path = path
+        self.columns = list(columns)
+        self._index = {name: i for i, name in enumerate(self.columns)}
+        self._buf = np.full((len(self.columns), rows), np.nan)
+        self._n = 0
+        self.rows_flushed = 0
+        if resume is not None and os.path.exists(path) and read_columns(path) == self.columns:
+            self._resume(*resume)
+            return
+        header = json.dumps({"columns": self.columns}).encode()
+        self._fh = open(path, "wb")
+        self._fh.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self._fh.flush()
+
+    def _resume(self, column, limit):
+        i = self._index[column]
+        tail = None
+        with open(self.path, "rb") as fh:
+            _read_header(fh)
+            end = fh.tell()
+            for block in _blocks(fh, len(self.columns), self.path):
+                over = np.flatnonzero(block[i] > limit)
+                if len(over):
+                    # Re-append the rows of this block up to limit
+                    tail = block[:, :over[0]]
+                    break
+                end = fh.tell()
+                self.rows_flushed += block.shape[1]
+        self._fh = open(self.path, "r+b")
+        self._fh.truncate(end)
+        self._fh.seek(end)
+        if tail is not None:
+            for row in tail.T:
+                self.append(row)
+
+    def __len__(self):
+        return self.rows_flushed + self._n
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, row):
+        """Append one sample; row is a sequence with one value per column."""
+        if self._n == self._buf.shape[1]:
+            self.flush()
+        self._buf[:, self._n] = row
+        self._n += 1
+
+    def flush(self):
+        """Write the buffered rows as one block and reset the buffer."""
+        if self._n == 0:
+            return
+        self._fh.write(struct.pack("<Q", self._n))
+        self._fh.write(np.ascontiguousarray(self._buf[:, :self._n]).tobytes())
+        self._fh.flush()
+        self.rows_flushed += self._n
+        self._n = 0
+        self._buf.fill(np.nan)
+
+    def close(self):
+        """Flush what is left and close the file."""
+        if self._fh.closed:
+            return
+        self.flush()
+        self._fh.close()
+        logger.info(f"Telemetry: {self.rows_flushed} rows written to {self.path}")
+
+    def column(self, name):
+        """Full history of one column, from disk plus the live buffer."""
+        i = self._index[name]
+        self._fh.flush()
+        on_disk = [block[i] for block in iter_blocks(self.path)]
+        return np.concatenate(on_disk + [self._buf[i, :self._n]])
+
+
+def _read_header(fh):
+    if fh.read(4) != MAGIC:
+        raise ValueError(f"{fh.name} is not a telemetry recording")
+    (length,) = struct.unpack("<I", fh.read(4))
+    return json.loads(fh.read(length))
+
+
+def iter_blocks(path):
+    """
+    Yield each block of a .tlm file as a (ncols, nrows) array.
+
+    A trailing block cut short by a crash is dropped.
+    """
+    with open(path, "rb") as fh:
+        ncols = len(_read_header(fh)["columns"])
+        yield from _blocks(fh, ncols, path)
+
+
+def _blocks(fh, ncols, path):
+    # Every complete block from the current position of fh
+    while True:
+        prefix = fh.read(8)
+        if len(prefix) < 8:
+            return
+        (nrows,) = struct.unpack("<Q", prefix)
+        data = fh.read(8 * ncols * nrows)
+        if len(data) < 8 * ncols * nrows:
+            logger.warning(f"{path}: ignoring truncated final block")
+            return
+        yield np.frombuffer(data).reshape(ncols, nrows)
+
+
+def read_columns(path):
+    """Column names of a .tlm file."""
+    with open(path, "rb") as fh:
+        return _read_header(fh)["columns"]
+
+
+def load_recording(path):
+    """Load a whole .tlm file as {column: 1-D array}."""
+    columns = read_columns(path)
+    blocks = list(iter_blocks(path))
+    if blocks:
+        data = np.concatenate(blocks, axis=1)
+    else:
+        data = np.empty((len(columns), 0))
+    return {name: data[i] for i, name in enumerate(columns)}
+
+
+def _csv_field(value):
+    # Same text as DataFrame.to_csv: shortest repr, NaN as an empty field
+    return "" if value != value else repr(value)
+
+
+def export_csv(path, csv_path, columns=None):
+    """
+    Write a .tlm file to CSV block by block, optionally reordering columns.
+
+    Produces the same text as DataFrame.to_csv(index=False) without
+    importing pandas.
+    """
+    names = read_columns(path)
+    order = [names.index(c) for c in columns] if columns else list(range(len(names)))
+    with open(csv_path, "w", newline="") as out:
+        out.write(",".join(names[i] for i in order) + "\n")
+        for block in iter_blocks(path):
+            for row in block[order].T.tolist():
+                out.write(",".join(map(_csv_field, row)) + "\n")
+    logger.info(f"Telemetry: exported {path} to {csv_path}")
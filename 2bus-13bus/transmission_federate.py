@@ -0,0 +1,542 @@
+# -*- coding: utf-8 -*-
+"""
+Sparse Newton-Raphson transmission federate, a Python stand-in for gpk-left-fed.x.
+
+gpk-left-fed.cpp re-runs PFApp.execute three times per 5 s step, once per
+phase, and each run re-reads the .raw file, rebuilds the network, Ybus and
+Jacobian and solves from the case's starting point. That is what kept the
+300-bus case (300bus_v23_no0imp_pslf.raw) off a laptop. This federate keeps
+the same HELICS interface:
+
+    subscribes  gld_hlc_conn/Sa|Sb|Sc, gld_hlc_conn_2/Sa|Sb|Sc     (VA)
+    publishes   gridpack/Va|Vb|Vc, gridpack/Va_2|Vb_2|Vc_2          (V, 138 kV base)
+
+and builds everything that does not change once per run:
+
+- the PSS/E v23 case (buses, generators, branches, switched shunts at BINIT,
+  two-terminal DC lines as constant-power converter loads),
+- Ybus (CSR) and the polar Jacobian's sparsity pattern, with a scatter map
+  that fills the Jacobian's CSC data straight from the Ybus entries,
+- a fill-reducing column ordering (COLAMD of the first Jacobian), applied to
+  the pattern so that every later factorization runs on pre-ordered columns.
+
+Each phase keeps its own solution and LU factors. A step warm-starts from
+the phase's previous voltages and reuses its previous factors as long as the
+mismatch keeps shrinking fast enough (chord iterations); only then is the
+Jacobian refactored. The boundary loads change little between 5 s steps, so
+most steps converge in one or two solves with no factorization at all.
+
+Coupling follows gpk-left-fed: every phase is solved as a balanced network,
+feeder k's load is added at its connect bus (input.xml <connectNode>s: 2 for
+gld_hlc_conn, 3 for gld_hlc_conn_2), and the connect-bus voltage is rotated
+by -120/+120 degrees for phases b and c. Unlike the C++ federate, the
+phase's power is taken as its balanced equivalent (3 x S, in VA, times
+--load-scale) added to the bus load from the case; gpk-left-fed overwrote the
+bus load with S / 1e8 as if it were MW. Generator reactive limits are not
+enforced, as in GridPACK's powerflow application. The boundary signals are
+written to gpk.csv in gpk-left-fed's format (see gpk_boundary.py), without
+its Vb_2 label slip.
+
+    python transmission_federate.py                                # input.xml case (Tr2bus.raw)
+    python transmission_federate.py 300bus_v23_no0imp_pslf.raw --stop 86400
+    python transmission_federate.py 300bus_v23_no0imp_pslf.raw --benchmark 720
+    helics run --path=gpk-gld-cosim-300bus.json
+"""
+import argparse
+import csv
+import logging
+import math
+import time
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+
+logger = logging.getLogger(__name__)
+
+PHASES = "abc"
+# Phase b and c voltages are the solved voltage rotated like in gpk-left-fed
+ROTATION = np.exp(-2j * np.pi / 3 * np.arange(3))
+DEFAULT_V_BASE = 138000.0
+DEFAULT_FEEDERS = ("gld_hlc_conn", "gld_hlc_conn_2")
+BUS_PQ, BUS_PV, BUS_SLACK, BUS_ISOLATED = 1, 2, 3, 4
+
+Buses = namedtuple("Buses", ["number", "kind", "load", "shunt", "vm", "va", "base_kv", "name"])
+Generators = namedtuple("Generators", ["bus", "p", "q", "vs", "status"])
+Branches = namedtuple("Branches", ["from_bus", "to_bus", "r", "x", "b", "ratio", "angle",
+                                   "g_from", "b_from", "g_to", "b_to", "status"])
+# sbase in MVA; loads and shunts in MW + jMvar (shunts at 1 pu), angles in degrees;
+# dc_load the two-terminal DC converters as constant-power loads, per bus
+RawCase = namedtuple("RawCase", ["sbase", "buses", "generators", "branches", "dc_load", "title"])
+# V complex pu per bus; lu the factors the last iteration used (reused by the next solve)
+Solution = namedtuple("Solution", ["V", "iterations", "factorizations", "mismatch", "converged", "lu"])
+
+
+# ---------------------------------------------------------------------------
+# PSS/E v23 reader
+# ---------------------------------------------------------------------------
+def _fields(line):
+    return [f.strip() for f in next(csv.reader([line], quotechar="'", skipinitialspace=True))]
+
+
+def _sections(lines):
+    """Lists of records (field lists) of the data sections after the three header lines."""
+    sections, records = [], []
+    for line in lines[3:]:
+        head = line.split("/")[0].strip()
+        if head in ("0", "Q"):
+            sections.append(records)
+            records = []
+            if head == "Q":
+                break
+        elif head:
+            records.append(_fields(head))
+    if records:
+        sections.append(records)
+    return sections
+
+
+def read_raw(path):
+    """RawCase of a PSS/E version 23 .raw file (the format GridPACK's PTI23 parser reads)."""
+    with open(path) as fh:
+        lines = fh.read().splitlines()
+    sbase = float(lines[0].replace(",", " ").split()[1])
+    sections = _sections(lines) + [[]] * 6
+    bus, gen, branch, dc, switched = sections[0], sections[1], sections[2], sections[5], sections[6]
+
+    shunt = {int(r[0]): 1j * float(r[5]) for r in switched}
+    buses = Buses(
+        np.array([int(r[0]) for r in bus]),
+        np.array([int(r[1]) for r in bus]),
+        np.array([complex(float(r[2]), float(r[3])) for r in bus]),
+        np.array([complex(float(r[4]), float(r[5])) + shunt.get(int(r[0]), 0) for r in bus]),
+        np.array([float(r[7]) for r in bus]),
+        np.array([float(r[8]) for r in bus]),
+        np.array([float(r[10]) for r in bus]),
+        [r[9].strip() for r in bus])
+    generators = Generators(
+        np.array([int(r[0]) for r in gen], dtype=int),
+        np.array([float(r[2]) for r in gen]),
+        np.array([float(r[3]) for r in gen]),
+        np.array([float(r[6]) for r in gen]),
+        np.array([int(r[14]) for r in gen], dtype=int))
+    columns = [[float(r[k]) for r in branch] for k in (3, 4, 5, 9, 10, 11, 12, 13, 14)]
+    branches = Branches(
+        np.array([abs(int(r[0])) for r in branch], dtype=int),
+        np.array([abs(int(r[1])) for r in branch], dtype=int),
+        *(np.array(c) for c in columns),
+        np.array([int(r[15]) for r in branch], dtype=int))
+    dc_load = np.zeros(len(buses.number), complex)
+    position = {int(n): i for i, n in enumerate(buses.number)}
+    for bus_number, s in _dc_converters(dc):
+        dc_load[position[bus_number]] += s
+    return RawCase(sbase, buses, generators, branches, dc_load, [lines[1].strip(), lines[2].strip()])
+
+
+def _dc_converters(records):
+    """
+    (bus, MW + jMvar drawn) of every converter of the two-terminal DC lines
+    (three records each). The scheduled power flows at the metered end; the
+    rectifier also supplies the RDC losses. Reactive power is P tan(angle) at
+    the minimum firing/extinction angle, without commutation overlap.
+    """
+    converters = []
+    for line, rect, inv in zip(records[0::3], records[1::3], records[2::3]):
+        mode, rdc, setvl, vschd = int(line[1]), float(line[2]), float(line[3]), float(line[4])
+        if mode == 0:
+            continue
+        power = abs(setvl) if mode == 1 else abs(setvl) * vschd / 1000
+        loss = rdc * (power / vschd) ** 2
+        p_rect, p_inv = (power, power - loss) if setvl > 0 else (power + loss, power)
+        q_rect = p_rect * math.tan(math.radians(float(rect[3])))
+        q_inv = p_inv * math.tan(math.radians(float(inv[3])))
+        converters += [(abs(int(rect[0])), complex(p_rect, q_rect)), (abs(int(inv[0])), complex(-p_inv, q_inv))]
+    return converters
+
+
+def read_input(path="input.xml"):
+    """{network, tolerance, max_iterations, connect_buses} of a GridPACK powerflow input.xml."""
+    pf = ET.parse(path).getroot().find("Powerflow")
+    helics = pf.find("Helics")
+    buses = [int(node.text) for node in helics.iter("connectNode")] if helics is not None else []
+    return {"network": pf.findtext("networkConfiguration", "").strip(),
+            "tolerance": float(pf.findtext("tolerance", "1e-6")),
+            "max_iterations": int(pf.findtext("maxIteration", "50")),
+            "connect_buses": buses}
+
+
+# ---------------------------------------------------------------------------
+# Power flow
+# ---------------------------------------------------------------------------
+class PowerFlow:
+    """
+    Polar Newton-Raphson power flow of a RawCase with a fixed sparsity pattern.
+
+    Ybus, the Jacobian pattern, its scatter map and the column ordering are
+    built here once; solve() only fills numbers. contraction is the factor
+    by which the mismatch must shrink per iteration for the current LU
+    factors to be kept (0 refactors on every iteration, i.e. plain Newton).
+    """
+
+    def __init__(self, case, tolerance=1e-6, max_iterations=50, contraction=0.25):
+        self.case = case
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.contraction = contraction
+        buses, gens, branches = case.buses, case.generators, case.branches
+        live = buses.kind != BUS_ISOLATED
+        self.numbers = buses.number[live]
+        self.index = {int(n): i for i, n in enumerate(self.numbers)}
+        n = len(self.numbers)
+
+        # Generation and the regulated voltage per bus
+        on = (gens.status > 0) & np.isin(gens.bus, self.numbers)
+        gen_at = np.array([self.index[int(b)] for b in gens.bus[on]], dtype=int)
+        s_gen = np.zeros(n, complex)
+        np.add.at(s_gen, gen_at, gens.p[on] + 1j * gens.q[on])
+        vm = buses.vm[live].copy()
+        vm[gen_at[::-1]] = gens.vs[on][::-1]
+        kind = buses.kind[live].copy()
+        has_gen = np.zeros(n, bool)
+        has_gen[gen_at] = True
+        kind[(kind == BUS_PV) & ~has_gen] = BUS_PQ
+        self.slack = np.flatnonzero(kind == BUS_SLACK)
+        if not len(self.slack):
+            raise ValueError("the case has no slack bus (type 3)")
+        self.pv = np.flatnonzero(kind == BUS_PV)
+        self.pq = np.flatnonzero(kind == BUS_PQ)
+        self.pvpq = np.concatenate([self.pv, self.pq])
+        self.s_base = (s_gen - buses.load[live] - case.dc_load[live]) / case.sbase
+        self.v_start = vm * np.exp(1j * np.radians(buses.va[live]))
+
+        self.ybus = self._admittance(n)
+        self._jacobian_pattern()
+
+    def _admittance(self, n):
+        case = self.case
+        br = case.branches
+        use = (br.status > 0) & np.isin(br.from_bus, self.numbers) & np.isin(br.to_bus, self.numbers)
+        z = br.r[use] + 1j * br.x[use]
+        if np.any(z == 0):
+            raise ValueError("zero-impedance branches are not supported")
+        f = np.array([self.index[int(b)] for b in br.from_bus[use]], dtype=int)
+        t = np.array([self.index[int(b)] for b in br.to_bus[use]], dtype=int)
+        ys = 1 / z
+        charging = 0.5j * br.b[use]
+        tap = np.where(br.ratio[use] != 0, br.ratio[use], 1.0) * np.exp(1j * np.radians(br.angle[use]))
+        y_ff = (ys + charging) / (tap * tap.conj()) + br.g_from[use] + 1j * br.b_from[use]
+        y_tt = ys + charging + br.g_to[use] + 1j * br.b_to[use]
+        y_ft = -ys / tap.conj()
+        y_tf = -ys / tap
+        diag = np.arange(n)
+        # Every diagonal is stored (explicitly, even if zero) for the Jacobian pattern
+        rows = np.concatenate([f, t, f, t, diag])
+        cols = np.concatenate([f, t, t, f, diag])
+        data = np.concatenate([y_ff, y_tt, y_ft, y_tf, case.buses.shunt[case.buses.kind != BUS_ISOLATED]
+                               / case.sbase])
+        ybus = sp.coo_matrix((data, (rows, cols)), shape=(n, n)).tocsr()
+        ybus.sum_duplicates()
+        return ybus
+
+    def _jacobian_pattern(self):
+        """Scatter map from the Ybus entries to the Jacobian's CSC data, with the column ordering applied."""
+        n = len(self.numbers)
+        coo = self.ybus.tocoo()
+        self._row, self._col = coo.row, coo.col
+        self._y = coo.data
+        self._diag = np.flatnonzero(coo.row == coo.col)
+        self._diag = self._diag[np.argsort(coo.row[self._diag])]
+        npvpq, npq = len(self.pvpq), len(self.pq)
+        p_eq = np.full(n, -1)
+        p_eq[self.pvpq] = np.arange(npvpq)
+        q_eq = np.full(n, -1)
+        q_eq[self.pq] = np.arange(npq)
+        r_p, r_q, c_p, c_q = p_eq[self._row], q_eq[self._row], p_eq[self._col], q_eq[self._col]
+        # dP/dtheta, dP/dVm, dQ/dtheta, dQ/dVm blocks, as (Ybus entries, J rows, J cols)
+        blocks = [(r_p >= 0) & (c_p >= 0), (r_p >= 0) & (c_q >= 0), (r_q >= 0) & (c_p >= 0), (r_q >= 0) & (c_q >= 0)]
+        self._entries = [np.flatnonzero(mask) for mask in blocks]
+        e11, e12, e21, e22 = self._entries
+        j_rows = np.concatenate([r_p[e11], r_p[e12], npvpq + r_q[e21], npvpq + r_q[e22]])
+        j_cols = np.concatenate([c_p[e11], npvpq + c_q[e12], c_p[e21], npvpq + c_q[e22]])
+        self.size = npvpq + npq
+
+        # Column ordering once, from the first Jacobian's pattern
+        first = sp.csc_matrix((np.ones(len(j_rows)), (j_rows, j_cols)), shape=(self.size, self.size))
+        self.order = splu(first + sp.identity(self.size, format="csc"), permc_spec="COLAMD").perm_c
+        position = np.empty_like(self.order)
+        position[self.order] = np.arange(self.size)
+        slots = np.arange(1, len(j_rows) + 1, dtype=float)
+        pattern = sp.csc_matrix((slots, (j_rows, position[j_cols])), shape=(self.size, self.size))
+        self._scatter = pattern.data.astype(np.int64) - 1
+        self._jacobian = pattern
+
+    def jacobian(self, V, current):
+        """Jacobian at V (CSC, columns in self.order); current = Ybus @ V."""
+        row_v = V[self._row]
+        d_angle = -1j * row_v * np.conj(self._y * V[self._col])
+        d_angle[self._diag] += 1j * V * np.conj(current)
+        vn = V / np.abs(V)
+        d_mag = row_v * np.conj(self._y * vn[self._col])
+        d_mag[self._diag] += np.conj(current) * vn
+        e11, e12, e21, e22 = self._entries
+        values = np.concatenate([d_angle.real[e11], d_mag.real[e12], d_angle.imag[e21], d_mag.imag[e22]])
+        J = self._jacobian.copy()
+        J.data = values[self._scatter]
+        return J
+
+    def _mismatch(self, V, s_bus):
+        current = self.ybus @ V
+        mis = V * np.conj(current) - s_bus
+        return np.concatenate([mis.real[self.pvpq], mis.imag[self.pq]]), current
+
+    def solve(self, load=None, start=None):
+        """
+        Solution for the case with load (complex pu per bus, added to the
+        case's loads), starting from a previous Solution (its voltages and
+        LU factors) or from the case's voltages.
+        """
+        s_bus = self.s_base if load is None else self.s_base - load
+        if start is None:
+            V, lu = self.v_start.copy(), None
+        else:
+            V, lu = start.V.copy(), start.lu
+        va, vm = np.angle(V), np.abs(V)
+        npvpq = len(self.pvpq)
+        F, current = self._mismatch(V, s_bus)
+        norm = np.abs(F).max(initial=0.0)
+        iterations = factorizations = 0
+        fresh = False
+        while norm > self.tolerance and iterations < self.max_iterations:
+            if lu is None:
+                lu = splu(self.jacobian(V, current), permc_spec="NATURAL")
+                factorizations += 1
+                fresh = True
+            dx = np.empty(self.size)
+            dx[self.order] = lu.solve(F)
+            va_new, vm_new = va.copy(), vm.copy()
+            va_new[self.pvpq] -= dx[:npvpq]
+            vm_new[self.pq] -= dx[npvpq:]
+            V_new = vm_new * np.exp(1j * va_new)
+            F_new, current_new = self._mismatch(V_new, s_bus)
+            new_norm = np.abs(F_new).max()
+            iterations += 1
+            if new_norm > self.contraction * norm:
+                if not fresh and new_norm > norm:
+                    # Stale factors made things worse: retry this step with a new Jacobian
+                    lu = None
+                    continue
+                lu = None
+            fresh = False
+            V, va, vm, F, current, norm = V_new, va_new, vm_new, F_new, current_new, new_norm
+        converged = norm <= self.tolerance
+        if not converged:
+            logger.warning(f"Power flow did not converge in {iterations} iterations (mismatch {norm:.3g} pu)")
+        return Solution(V, iterations, factorizations, norm, converged, lu)
+
+
+# ---------------------------------------------------------------------------
+# Boundary model and federate
+# ---------------------------------------------------------------------------
+class TransmissionModel:
+    """
+    Three per-phase power flows of one case with feeders at connect buses;
+    the federate-independent part. feeders maps a feeder key (gld_hlc_conn)
+    to its connect bus number.
+    """
+
+    def __init__(self, case, feeders, load_scale=1.0, tolerance=1e-6, max_iterations=50, contraction=0.25):
+        self.flow = PowerFlow(case, tolerance, max_iterations, contraction)
+        self.feeders = list(feeders)
+        missing = [b for b in feeders.values() if b not in self.flow.index]
+        if missing:
+            raise ValueError(f"connect buses {missing} are not in the case")
+        self.buses = np.array([self.flow.index[b] for b in feeders.values()], dtype=int)
+        self.scale = 3 * load_scale / (case.sbase * 1e6)
+        base = self.flow.solve()
+        self.solutions = [base] * 3
+        # Counters include the initial solve of the case
+        self.steps = 0
+        self.iterations, self.factorizations = base.iterations, base.factorizations
+        self.solve_s = 0.0
+
+    def voltages(self):
+        """Connect-bus voltages (n_feeders, 3) in pu, phases rotated."""
+        return np.stack([s.V[self.buses] for s in self.solutions], axis=1) * ROTATION
+
+    def step(self, S):
+        """Solve the three phases for feeder loads S (n_feeders, 3) in VA; returns voltages()."""
+        start = time.perf_counter()
+        n = len(self.flow.numbers)
+        for p in range(3):
+            load = np.zeros(n, complex)
+            np.add.at(load, self.buses, np.asarray(S)[:, p] * self.scale)
+            solution = self.flow.solve(load, start=self.solutions[p])
+            self.solutions[p] = solution
+            self.iterations += solution.iterations
+            self.factorizations += solution.factorizations
+        self.steps += 1
+        self.solve_s += time.perf_counter() - start
+        return self.voltages()
+
+    def report(self):
+        per_step = self.solve_s / max(self.steps, 1)
+        return (f"{self.steps} steps, {self.iterations} iterations, {self.factorizations} factorizations, "
+                f"{per_step * 1e3:.3f} ms per step")
+
+
+def _fmt(z):
+    return f"({z.real:.6g},{z.imag:.6g})"
+
+
+def write_block(out, t, S, V, sbase):
+    """One gpk.csv block: S in pu of sbase (S / 1e8 for 100 MVA, as gpk-left-fed), V in pu."""
+    out.write(f"Time (s): {t:g}\n")
+    suffixes = [""] + [f"_{k + 1}" for k in range(1, len(S))]
+    for sfx, row in zip(suffixes, S):
+        values = " ".join(f"S{ph}{sfx}: {_fmt(s / (sbase * 1e6))}" for ph, s in zip(PHASES, row))
+        out.write(f"S received from Gridlab-D, {values}\n")
+    for sfx, row in zip(suffixes, V):
+        values = " ".join(f"V{ph}{sfx}: {_fmt(v)}" for ph, v in zip(PHASES, row))
+        out.write(f"Updated Vv by GridPACK, {values}\n")
+    out.write("\n")
+
+
+def run_federate(fed, model, stop=7200.0, period=5.0, log_path="gpk.csv", v_base=DEFAULT_V_BASE, api=None):
+    """
+    Register the gridpack publications and feeder subscriptions on fed (in
+    created state, named gridpack) and run the time loop of gpk-left-fed.
+    """
+    if api is None:
+        import helics as api
+    h = api
+    suffixes = [""] + [f"_{k + 1}" for k in range(1, len(model.feeders))]
+    pubs = [[h.helicsFederateRegisterPublication(fed, f"V{ph}{sfx}", h.HELICS_DATA_TYPE_COMPLEX, "V")
+             for ph in PHASES] for sfx in suffixes]
+    subs = [[h.helicsFederateRegisterSubscription(fed, f"{key}/S{ph}", "VA") for ph in PHASES]
+            for key in model.feeders]
+    for row in subs:
+        for sub in row:
+            h.helicsInputSetDefaultComplex(sub, 0, 0)
+    h.helicsFederateEnterExecutingMode(fed)
+
+    def publish(V):
+        for row, values in zip(pubs, (V * v_base).tolist()):
+            for pub, v in zip(row, values):
+                h.helicsPublicationPublishComplex(pub, v.real, v.imag)
+
+    publish(model.voltages())
+    out = open(log_path, "w") if log_path else None
+    granted = 0.0
+    try:
+        while granted < stop:
+            granted = h.helicsFederateRequestTime(fed, granted + period)
+            S = np.array([[complex(h.helicsInputGetComplex(sub)) for sub in row] for row in subs])
+            V = model.step(S)
+            if out:
+                write_block(out, granted, S, V, model.flow.case.sbase)
+            publish(V)
+    finally:
+        if out:
+            out.write("End of Cosimulation.")
+            out.close()
+    h.helicsFederateDisconnect(fed)
+    return model
+
+
+def _feeder_buses(specs, input_config):
+    """{feeder key: bus} from KEY=BUS specs, else DEFAULT_FEEDERS on input.xml's connect buses."""
+    if specs:
+        return {key: int(bus) for key, bus in (spec.split("=", 1) for spec in specs)}
+    buses = input_config.get("connect_buses") or [2, 3]
+    return dict(zip(DEFAULT_FEEDERS, buses))
+
+
+def benchmark(case_path, feeders, steps, load_scale=1.0, tolerance=1e-6, max_iterations=50, trace=None):
+    """
+    Per-step solve time of gpk-left-fed's approach (read the case and solve
+    from scratch for each phase) against TransmissionModel, driven by the
+    feeder load trace; returns {mode: seconds per step}.
+    """
+    load = None
+    if trace:
+        from surrogate_feeder import load_trace
+        _, load, _ = load_trace(trace)
+    if load is None or not len(load):
+        load = 3e6 + 1e6 * np.sin(np.linspace(0, 2 * np.pi, steps))
+    k = np.linspace(0, len(load) - 1, steps).astype(int)
+    split = np.array([0.34, 0.33, 0.33])
+    S = [np.outer(np.ones(len(feeders)), load[i] * split) * (1 + 0.33j) for i in k]
+
+    case = read_raw(case_path)
+    model = TransmissionModel(case, feeders, load_scale, tolerance, max_iterations)
+    for s in S:
+        model.step(s)
+    results = {"warm": model.solve_s / steps}
+
+    cold_steps = min(steps, 20)
+    start = time.perf_counter()
+    for s in S[:cold_steps]:
+        for p in range(3):
+            flow = PowerFlow(read_raw(case_path), tolerance, max_iterations, contraction=0.0)
+            load_pu = np.zeros(len(flow.numbers), complex)
+            np.add.at(load_pu, model.buses, s[:, p] * model.scale)
+            flow.solve(load_pu)
+    results["rebuild"] = (time.perf_counter() - start) / cold_steps
+    logger.info(f"warm model: {model.report()}")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Sparse Newton-Raphson transmission federate (gpk-left-fed stand-in)')
+    parser.add_argument('raw', nargs='?', help='PSS/E v23 case (default: networkConfiguration of --input)')
+    parser.add_argument('--input', default='input.xml', help='GridPACK input.xml for case, tolerance and connect buses')
+    parser.add_argument('--feeder', action='append', metavar='KEY=BUS',
+                        help='feeder key and connect bus, e.g. gld_hlc_conn=2 (repeat; order gives the _2 suffixes)')
+    parser.add_argument('--name', default='gridpack', help='federate name (prefix of the V publications)')
+    parser.add_argument('--stop', type=float, default=7200.0)
+    parser.add_argument('--period', type=float, default=5.0)
+    parser.add_argument('--load-scale', type=float, default=1.0, help='multiplier on the feeder loads')
+    parser.add_argument('--v-base', type=float, default=DEFAULT_V_BASE, help='published voltage per pu (V)')
+    parser.add_argument('--log', default='gpk.csv', help='boundary signal log in gpk-left-fed format ("" for none)')
+    parser.add_argument('--benchmark', type=int, metavar='STEPS',
+                        help='time STEPS offline steps against per-step rebuilds, no HELICS')
+    parser.add_argument('--trace', default='extracted_feeder_load.csv', help='feeder load trace for --benchmark')
+    parser.add_argument('--core-type', default='zmq')
+    parser.add_argument('--broker', default='', help='core init string, e.g. --broker_address=tcp://127.0.0.1')
+    args = parser.parse_args()
+
+    try:
+        input_config = read_input(args.input)
+    except (OSError, ET.ParseError, AttributeError):
+        input_config = {}
+    raw = args.raw or input_config.get("network")
+    if not raw:
+        parser.error(f"no case given and no networkConfiguration in {args.input}")
+    feeders = _feeder_buses(args.feeder, input_config)
+    tolerance = input_config.get("tolerance", 1e-6)
+    max_iterations = input_config.get("max_iterations", 50)
+
+    if args.benchmark:
+        results = benchmark(raw, feeders, args.benchmark, args.load_scale, tolerance, max_iterations, args.trace)
+        print(f"{raw}: {results['rebuild'] * 1e3:.2f} ms per step rebuilding per phase, "
+              f"{results['warm'] * 1e3:.3f} ms warm ({results['rebuild'] / results['warm']:.0f}x)")
+    else:
+        import helics as h
+        model = TransmissionModel(read_raw(raw), feeders, args.load_scale, tolerance, max_iterations)
+        logger.info(f"{raw}: {len(model.flow.numbers)} buses, Ybus nnz {model.flow.ybus.nnz}, "
+                    f"feeders {feeders}")
+        fi = h.helicsCreateFederateInfo()
+        h.helicsFederateInfoSetCoreTypeFromString(fi, args.core_type)
+        h.helicsFederateInfoSetCoreInitString(fi, f"--federates=1 {args.broker}".strip())
+        h.helicsFederateInfoSetTimeProperty(fi, h.HELICS_PROPERTY_TIME_PERIOD, args.period)
+        h.helicsFederateInfoSetFlagOption(fi, h.HELICS_FLAG_TERMINATE_ON_ERROR, True)
+        h.helicsFederateInfoSetFlagOption(fi, h.HELICS_FLAG_WAIT_FOR_CURRENT_TIME_UPDATE, True)
+        fed = h.helicsCreateValueFederate(args.name, fi)
+        start = time.perf_counter()
+        run_federate(fed, model, args.stop, args.period, args.log, args.v_base, api=h)
+        h.helicsFederateFree(fed)
+        logger.info(f"{args.name}: {model.report()}, wall time {time.perf_counter() - start:.2f} s")
+        h.helicsCloseLibrary()
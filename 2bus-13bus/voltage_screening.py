@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized voltage-violation screening of GridLAB-D voltdump outputs.
+
+Any number of voltdump snapshots (Volt_Dump_NR.csv, one file per dump or
+several "# ... run at" sections in one file) are turned into one
+node x phase x time array of per-unit voltage magnitudes. Per-unit bases are
+the nominal_voltage of each node in the GLM (inherited from the parent
+object where missing), and phases a node does not have are NaN. Triplex
+nodes are screened on phases 1 and 2, which voltdump writes as A and B.
+
+From that array the screen reports, for a band (default 0.95-1.05 pu):
+violation counts per phase, the worst nodes (largest deviation from 1 pu)
+and the time each node phase spends outside the band (each snapshot holds
+until the next one). VoltageScreen.index maps node names to rows, so
+looking up one bus is a dict lookup.
+
+    python voltage_screening.py                                   # Volt_Dump_NR.csv vs 1c_IEEE_123_feeder.glm
+    python voltage_screening.py 'run/Volt_Dump_*.csv' --glm 1c_IEEE_123_feeder.glm --band 0.95 1.05
+    python voltage_screening.py Volt_Dump_NR_2.csv --glm 1c_IEEE_123_feeder_2.glm --node n8 --node n13
+"""
+import argparse
+import glob
+import logging
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from glm_parser import load_glm, property_float
+
+logger = logging.getLogger(__name__)
+
+PHASES = "ABC"
+DEFAULT_BAND = (0.95, 1.05)
+
+_RUN_AT_RE = re.compile(r"run at (\d{4}-\d\d-\d\d[ T]\d\d:\d\d:\d\d)")
+
+# One voltdump table: names (n,), voltages (n, 3) complex, time datetime64[s] (NaT if unknown)
+VoltageSnapshot = namedtuple("VoltageSnapshot", ["time", "names", "voltages"])
+# Per node phase: (node, phase letter, value in pu, time)
+WorstNode = namedtuple("WorstNode", ["node", "phase", "pu", "time"])
+
+
+def _snapshot(header, columns, lines):
+    m = _RUN_AT_RE.search(header)
+    stamp = np.datetime64(m.group(1).replace(" ", "T"), "s") if m else np.datetime64("NaT")
+    k = len(columns)
+    tokens = ",".join(lines).split(",")
+    if len(tokens) != k * len(lines):
+        raise ValueError(f"voltdump rows do not all have {k} fields")
+    names = np.array(tokens[0::k])
+    del tokens[0::k]
+    values = np.fromstring(" ".join(tokens), dtype=float, sep=" ").reshape(len(lines), k - 1)
+    col = {name: i - 1 for i, name in enumerate(columns)}
+    voltages = np.zeros((len(lines), 3), dtype=complex)
+    for p, ph in enumerate(PHASES):
+        if f"volt{ph}_real" in col:
+            voltages[:, p] = values[:, col[f"volt{ph}_real"]] + 1j * values[:, col[f"volt{ph}_imag"]]
+        elif f"volt{ph}_mag" in col:
+            # mode polar: magnitude and angle in degrees
+            voltages[:, p] = values[:, col[f"volt{ph}_mag"]] * np.exp(
+                1j * np.deg2rad(values[:, col[f"volt{ph}_angle"]]))
+    return VoltageSnapshot(stamp, names, voltages)
+
+
+def iter_snapshots(path):
+    """Yield every voltdump table in path, in file order."""
+    header, columns, lines = "", None, []
+    with open(path) as fh:
+        for line in fh:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            if line.startswith("#"):
+                if columns is not None and lines:
+                    yield _snapshot(header, columns, lines)
+                header, columns, lines = line, None, []
+            elif columns is None:
+                columns = [c.strip() for c in line.split(",")]
+            else:
+                lines.append(line)
+    if columns is not None and lines:
+        yield _snapshot(header, columns, lines)
+
+
+def nominal_voltages(glm_path):
+    """{object name: (nominal V, phase mask (3,) bool)} for the objects of a GLM."""
+    objects = {obj.name: obj for obj in load_glm(glm_path).objects}
+    out = {}
+    for name, obj in objects.items():
+        nominal = property_float(obj.properties.get("nominal_voltage"))
+        parent = obj.parent
+        # Children of a node (loads, meters) inherit its nominal voltage
+        while nominal is None and parent in objects:
+            nominal = property_float(objects[parent].properties.get("nominal_voltage"))
+            parent = objects[parent].parent
+        if nominal is None:
+            continue
+        phases = obj.properties.get("phases", "ABC").upper()
+        if obj.type.startswith("triplex"):
+            mask = np.array([True, True, False])
+        else:
+            mask = np.array([ph in phases for ph in PHASES])
+        out[name] = (nominal, mask)
+    return out
+
+
+class VoltageScreen:
+    """
+    Per-unit voltage magnitudes of many snapshots as one (node, phase, time) array.
+
+    pu[i, p, k] is node names[i], phase PHASES[p] at times[k]; NaN where the
+    node has no such phase or no nominal voltage is known.
+    """
+
+    def __init__(self, names, times, pu, nominal):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.times = np.asarray(times, dtype="datetime64[s]")
+        self.pu = pu
+        self.nominal = nominal
+
+    @classmethod
+    def from_snapshots(cls, snapshots, nominals=None, default_nominal=None):
+        """Build the screen from VoltageSnapshots and nominal_voltages() output."""
+        snapshots = sorted(snapshots, key=lambda s: s.time)
+        if not snapshots:
+            return cls([], [], np.empty((0, 3, 0)), np.empty(0))
+        names = list(dict.fromkeys(n for s in snapshots for n in s.names.tolist()))
+        index = {name: i for i, name in enumerate(names)}
+        mags = np.full((len(names), 3, len(snapshots)), np.nan)
+        first = snapshots[0].names
+        if all(np.array_equal(s.names, first) for s in snapshots):
+            # Same objects in every dump (the usual case): one stacked pass
+            mags[:] = np.abs(np.stack([s.voltages for s in snapshots], axis=2))
+        else:
+            for k, snap in enumerate(snapshots):
+                rows = np.fromiter((index[n] for n in snap.names.tolist()), dtype=np.int64,
+                                   count=len(snap.names))
+                mags[rows, :, k] = np.abs(snap.voltages)
+        nominals = nominals or {}
+        nominal = np.full(len(names), np.nan if default_nominal is None else float(default_nominal))
+        mask = np.ones((len(names), 3), dtype=bool)
+        for i, name in enumerate(names):
+            if name in nominals:
+                nominal[i], mask[i] = nominals[name]
+        # Without GLM phase information, a zero voltage means "no such phase"
+        mags[~mask] = np.nan
+        if not nominals:
+            mags[mags == 0] = np.nan
+        pu = mags / nominal[:, None, None]
+        return cls(names, [s.time for s in snapshots], pu, nominal)
+
+    @classmethod
+    def from_dumps(cls, paths, glm_path=None, default_nominal=None):
+        """Screen of every snapshot in the voltdump files paths."""
+        nominals = nominal_voltages(glm_path) if glm_path else None
+        snapshots = [s for path in paths for s in iter_snapshots(path)]
+        return cls.from_snapshots(snapshots, nominals, default_nominal)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def node(self, name):
+        """(3, n_times) per-unit magnitudes of one node."""
+        return self.pu[self.index[name]]
+
+    def durations(self):
+        """Seconds each snapshot stands for: the gap to the next one (the last repeats the median gap)."""
+        if len(self.times) < 2:
+            return np.zeros(len(self.times))
+        gaps = np.diff(self.times).astype(np.int64).astype(float)
+        return np.append(gaps, np.median(gaps))
+
+    def violations(self, low=DEFAULT_BAND[0], high=DEFAULT_BAND[1]):
+        """(under, over) boolean (node, phase, time) arrays; NaN entries are neither."""
+        with np.errstate(invalid="ignore"):
+            return self.pu < low, self.pu > high
+
+    def report(self, low=DEFAULT_BAND[0], high=DEFAULT_BAND[1], top=10):
+        """Violation counts, worst node phases and time outside the band."""
+        under, over = self.violations(low, high)
+        outside = under | over
+        dt = self.durations()
+        time_outside = (outside * dt).sum(axis=2)          # (node, phase) seconds
+        # Worst: the largest |pu - 1| of every node over phases and time
+        deviation = np.abs(self.pu - 1.0)
+        flat = np.where(np.isnan(deviation), -1.0, deviation).reshape(len(self.names), -1)
+        worst_flat = flat.argmax(axis=1) if len(self.names) else np.empty(0, dtype=np.int64)
+        worst_dev = flat[np.arange(len(self.names)), worst_flat]
+        order = np.argsort(-worst_dev)[:top]
+        worst = []
+        for i in order:
+            if worst_dev[i] < 0:
+                break
+            p, k = divmod(int(worst_flat[i]), len(self.times))
+            worst.append(WorstNode(self.names[i], PHASES[p], float(self.pu[i, p, k]), self.times[k]))
+        return {
+            "nodes": len(self.names),
+            "snapshots": len(self.times),
+            "screened": int(np.sum(~np.isnan(self.pu))),
+            "no_nominal": int(np.sum(np.isnan(self.nominal))),
+            "under": under.sum(axis=(0, 2)),
+            "over": over.sum(axis=(0, 2)),
+            "nodes_outside": int(np.sum(outside.any(axis=(1, 2)))),
+            "time_outside_s": time_outside,
+            "longest_outside_s": self._longest_runs(outside, dt),
+            "worst": worst,
+        }
+
+    @staticmethod
+    def _longest_runs(outside, dt):
+        """Longest contiguous time (s) outside the band per (node, phase)."""
+        n, p, t = outside.shape
+        if t == 0:
+            return np.zeros((n, p))
+        flat = outside.reshape(-1, t)
+        # Cumulative duration, reset at every in-band snapshot
+        cum = np.cumsum(flat * dt, axis=1)
+        reset = np.maximum.accumulate(np.where(flat, 0.0, cum), axis=1)
+        return (cum - reset).max(axis=1).reshape(n, p)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Voltage band screening of GridLAB-D voltdump files')
+    parser.add_argument('paths', nargs='*', default=['Volt_Dump_NR.csv'], help='voltdump files or glob patterns')
+    parser.add_argument('--glm', default='1c_IEEE_123_feeder.glm', help='model with the nominal voltages')
+    parser.add_argument('--nominal', type=float, help='nominal voltage for nodes missing from the GLM')
+    parser.add_argument('--band', nargs=2, type=float, default=list(DEFAULT_BAND), metavar=('LOW', 'HIGH'))
+    parser.add_argument('--top', type=int, default=10, help='worst nodes to list')
+    parser.add_argument('--node', action='append', default=[], help='print the series of this node')
+    args = parser.parse_args()
+
+    paths = sorted({p for pattern in args.paths for p in glob.glob(pattern)})
+    screen = VoltageScreen.from_dumps(paths, args.glm or None, args.nominal)
+    low, high = args.band
+    rep = screen.report(low, high, args.top)
+    print(f"{rep['nodes']} nodes x {rep['snapshots']} snapshots, {rep['screened']} node-phase values screened "
+          f"({rep['no_nominal']} nodes without a nominal voltage)")
+    print(f"band {low:.3f} .. {high:.3f} pu: {rep['nodes_outside']} nodes outside")
+    for p, ph in enumerate(PHASES):
+        print(f"    phase {ph}: {rep['under'][p]} under, {rep['over'][p]} over")
+    print("worst nodes:")
+    for w in rep["worst"]:
+        i, p = screen.index[w.node], PHASES.index(w.phase)
+        print(f"    {w.node:<24} {w.phase} {w.pu:.4f} pu at {w.time}  "
+              f"outside {rep['time_outside_s'][i, p] / 3600:.2f} h (longest {rep['longest_outside_s'][i, p] / 3600:.2f} h)")
+    for name in args.node:
+        if name not in screen:
+            print(f"{name}: not in the dumps")
+            continue
+        for p, ph in enumerate(PHASES):
+            print(f"{name} {ph}: " + " ".join(f"{v:.4f}" for v in screen.node(name)[p]))